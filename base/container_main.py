@@ -86,9 +86,20 @@ def write_pid_file(pid_file_path, pid_file):
     pid_file_path = os.path.join(pid_file_path, pid_file)
     if os.path.exists(pid_file_path):
         os.remove(pid_file_path)
+    if os.path.exists(pid_file_path + ".exit"):
+        os.remove(pid_file_path + ".exit")
     file_d = open(pid_file_path, "w")
     file_d.write("%s\n" % os.getpid())
     file_d.close()
+
+
+def write_exit_file(pid_file_path, pid_file, exit_code):
+    '''Write exit code of the task next to its pid file, so that the waiter
+       in the cluster can report it.
+    '''
+    file_d = open(os.path.join(pid_file_path, pid_file + ".exit"), "w")
+    file_d.write("%s\n" % exit_code)
+    file_d.close()
     
 
 if __name__ == "__main__":
@@ -141,6 +152,7 @@ if __name__ == "__main__":
                          stdout=f,
                          stderr=subprocess.STDOUT)
     p.wait()
+    write_exit_file(config.log_dir, "start_base_task.pid", p.returncode)
     f.close() 
     logger.info("Task Finish")    
   
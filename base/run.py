@@ -13,13 +13,15 @@ import yaml
 from argparse import Namespace
 import importlib
 import json
-import numpy as np
 
 CURR_PATH = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(os.path.abspath(os.path.join(CURR_PATH, "../")))
 from utils import cluster_manager
 from utils import flagperf_logger
 from utils import image_manager
+from utils import monitor_log
+from utils import log_analysis
+from utils import result_store
 
 VERSION = "v0.1"
 RUN_LOGGER = flagperf_logger.FlagPerfLogger()
@@ -143,7 +145,8 @@ def clear_caches_cluster(clear, nnodes):
 
 def start_monitors_in_cluster(dp_path, case_log_dir, nnodes, config):
     '''Start sytem and vendor's monitors.'''
-    start_mon_cmd = "cd " + dp_path + " && " + sys.executable + " ../utils/sys_monitor.py -v " + config.VENDOR +  " -o restart -l "
+    log_format = " -f " + getattr(config, "MONITOR_FORMAT", "text")
+    start_mon_cmd = "cd " + dp_path + " && " + sys.executable + " ../utils/sys_monitor.py -v " + config.VENDOR + log_format + " -o restart -l "
     timeout = 60
     RUN_LOGGER.debug("Run cmd in the cluster to start system monitors: " +
                      start_mon_cmd)
@@ -157,7 +160,7 @@ def start_monitors_in_cluster(dp_path, case_log_dir, nnodes, config):
     ven_mon_path = os.path.join(dp_path, "vendors", config.VENDOR,
                                 config.VENDOR + "_monitor.py")
     start_mon_cmd = "cd " + dp_path + " && " + sys.executable \
-                    + " " + ven_mon_path + " -o restart -l "
+                    + " " + ven_mon_path + log_format + " -o restart -l "
     RUN_LOGGER.debug("Run cmd in the cluster to start vendor's monitors: " +
                      start_mon_cmd)
     bad_hosts = CLUSTER_MGR.start_monitors_some_hosts(start_mon_cmd,
@@ -236,27 +239,43 @@ def start_tasks_in_cluster(dp_path, container_name, config, base_args,
 
     RUN_LOGGER.debug("Run cmd in the cluster to start tasks, cmd=" + start_cmd)
     CLUSTER_MGR.run_command_some_hosts_distribution_info(start_cmd, nnodes, 15, "base")
-    # Wait a moment for starting tasks.
-    time.sleep(60)
+
+
+def remove_pid_file_in_cluster(dp_path, pid_file_path, nnodes):
+    '''Remove pid file and exit file of the last task, so that they won't
+       be waited for again.
+    '''
+    rm_cmd = "cd " + dp_path + " && rm -f " + pid_file_path + " " \
+             + pid_file_path + ".exit"
+    RUN_LOGGER.debug("Run cmd in the cluster to remove old pid file: " + rm_cmd)
+    CLUSTER_MGR.run_command_some_hosts(rm_cmd, nnodes, 10)
 
 
 def wait_for_finish(dp_path, container_name, pid_file_path, nnodes):
     '''wait all the processes of start_xxx_task.py finished.
+       Each host blocks until its task exits and reports the exit code.
+       Return hosts whose task exits with non-zero code.
     '''
-    # Aussme pid of start_xxx_task.py won't loop in a short time.
-    check_cmd = "cd " + dp_path + "; " + sys.executable \
-                + " ../utils/container_manager.py -o pidrunning -c " \
-                + container_name + " -f " + pid_file_path
-
-    RUN_LOGGER.debug(
-        "Run cmd to check whether the training tasks is running: " + check_cmd)
-    while True:
-        bad_hosts = CLUSTER_MGR.run_command_some_hosts(check_cmd,
+    wait_cmd = "cd " + dp_path + "; " + sys.executable \
+               + " ../utils/container_manager.py -o waitpid -c " \
+               + container_name + " -f " + pid_file_path
+
+    RUN_LOGGER.debug("Run cmd to wait for the tasks finished: " + wait_cmd)
+    # ssh exits with 255 if the connection is lost, wait again in that case.
+    for _ in range(3):
+        bad_hosts = CLUSTER_MGR.run_command_some_hosts(wait_cmd,
                                                        nnodes,
+                                                       timeout=None,
                                                        no_log=True)
-        if len(bad_hosts) == nnodes:
+        lost_hosts = [host for host in bad_hosts if bad_hosts[host] == 255]
+        if len(lost_hosts) == 0:
             break
-        time.sleep(10)
+        RUN_LOGGER.warning("Lost connection to hosts while waiting for tasks: " +
+                           ",".join(lost_hosts) + ". Wait again.")
+    for host in bad_hosts:
+        RUN_LOGGER.warning("Task on host " + host + " exit with: " +
+                           str(bad_hosts[host]))
+    return bad_hosts
         
 
 def prepare_containers_env_cluster(dp_path, case_log_dir, container_name,
@@ -374,9 +393,9 @@ def summary_logs(config, case_log_dir):
         
         # system monitor results like CPU/MEM/POWER
         for index in ["cpu", "mem", "pwr"]:
-            monitor_path = os.path.join(monitor_log_dir, index + "_monitor.log")
-            with open(monitor_path, 'r') as file:
-                sys_log = [float(line.split("\t")[1][:-1]) for line in file if "\t" in line]
+            monitor_path = os.path.join(monitor_log_dir,
+                                        index + "_monitor.log")
+            sys_log = monitor_log.read_sys_log(monitor_path).tolist()
             result[host][index] = sys_log
         
         # FlagPerf Result
@@ -391,79 +410,6 @@ def summary_logs(config, case_log_dir):
     return result
 
 
-def analysis_log(key_logs):
-    noderank = 0
-    for host in key_logs:
-        RUN_LOGGER.info("*" * 50)
-        RUN_LOGGER.info("Noderank {} with IP {}".format(noderank, host))
-
-        RUN_LOGGER.info("1) Performance:")
-        for line in key_logs[host]["flagperf"]:
-            RUN_LOGGER.info("  " + line.split("]")[1])
-
-        RUN_LOGGER.info("2) POWER:")
-        RUN_LOGGER.info("  2.1) SYSTEM POWER:")
-        pwr_series = key_logs[host]["pwr"]
-        RUN_LOGGER.info(
-            "    AVERAGE: {} Watts, MAX: {} Watts, STD DEVIATION: {} Watts".
-            format(round(np.mean(pwr_series), 2), round(np.max(pwr_series), 2),
-                   round(np.std(pwr_series), 2)))
-
-        RUN_LOGGER.info("  2.2) AI-chip POWER:")
-        for node in key_logs[host]["vendor"]["power"].keys():
-            pwr_series = key_logs[host]["vendor"]["power"][node]
-            RUN_LOGGER.info(
-                "    RANK {}'s AVERAGE: {} Watts, MAX: {} Watts, STD DEVIATION: {} Watts"
-                .format(node, round(np.mean(pwr_series), 2),
-                        round(np.max(pwr_series), 2),
-                        round(np.std(pwr_series), 2)))
-
-        RUN_LOGGER.info("  2.3) AI-chip TEMPERATURE:")
-        for node in key_logs[host]["vendor"]["temp"].keys():
-            temp_series = key_logs[host]["vendor"]["temp"][node]
-            RUN_LOGGER.info(
-                u"    RANK {}'s AVERAGE: {} \u00b0C, MAX: {} \u00b0C, STD DEVIATION: {} \u00b0C"
-                .format(node, round(np.mean(temp_series), 2),
-                        round(np.max(temp_series), 2),
-                        round(np.std(temp_series), 2)))
-
-        RUN_LOGGER.info("3) Utilization:")
-        RUN_LOGGER.info("  3.1) SYSTEM CPU:")
-        cpu_series = key_logs[host]["cpu"]
-        RUN_LOGGER.info(
-            "    AVERAGE: {} %, MAX: {} %, STD DEVIATION: {} %".format(
-                round(np.mean(cpu_series) * 100, 3),
-                round(np.max(cpu_series) * 100, 3),
-                round(np.std(cpu_series) * 100, 3)))
-
-        RUN_LOGGER.info("  3.2) SYSTEM MEMORY:")
-        mem_series = key_logs[host]["mem"]
-        RUN_LOGGER.info(
-            "    AVERAGE: {} %, MAX: {} %, STD DEVIATION: {} %".format(
-                round(np.mean(mem_series) * 100, 3),
-                round(np.max(mem_series) * 100, 3),
-                round(np.std(mem_series) * 100, 3)))
-
-        RUN_LOGGER.info("  3.3) AI-chip MEMORY:")
-        for node in key_logs[host]["vendor"]["mem"].keys():
-            mem_series = key_logs[host]["vendor"]["mem"][node]
-            RUN_LOGGER.info(
-                "    RANK {}'s AVERAGE: {} %, MAX: {} %, STD DEVIATION: {} %".
-                format(
-                    node,
-                    round(
-                        np.mean(mem_series) * 100 /
-                        key_logs[host]["vendor"]["max_mem"], 3),
-                    round(
-                        np.max(mem_series) * 100 /
-                        key_logs[host]["vendor"]["max_mem"], 3),
-                    round(
-                        np.std(mem_series) * 100 /
-                        key_logs[host]["vendor"]["max_mem"], 3)))
-        noderank += 1
-    
-
-
 def print_welcome_msg():
     '''Print colorful welcome message to console.'''
     print("\033[1;34;40m==============================================\033[0m")
@@ -567,14 +513,15 @@ def main():
                              "...[FAILED]. Ignore case " + case)
             continue
         RUN_LOGGER.info("2) Start tasks in the cluster...")
+        pid_file_path = os.path.join(
+            log_dir_container, "start_base_task.pid")
+        remove_pid_file_in_cluster(dp_path, pid_file_path, nnodes)
 
         start_tasks_in_cluster(dp_path, container_name, config,
                                base_args, curr_log_path, case)
 
         # Wait until start_xxx_task.py finished.
         RUN_LOGGER.info("3) Waiting for tasks end in the cluster...")
-        pid_file_path = os.path.join(
-            log_dir_container, "start_base_task.pid")
         wait_for_finish(dp_path, container_name, pid_file_path, nnodes)
 
         RUN_LOGGER.info("3) Training tasks end in the cluster...")
@@ -590,15 +537,27 @@ def main():
     RUN_LOGGER.info("2) summary logs")
     key_logs = summary_logs(config, case_log_dir)
     RUN_LOGGER.debug(key_logs)
+    result = log_analysis.AnalysisResult(key_logs, steady=False)
     jsonfile = os.path.join(dp_path, curr_log_path, "detail_result.json")
-    json.dump(key_logs, open(jsonfile, "w"))
+    json.dump(result.to_dict(), open(jsonfile, "w"))
     
     RUN_LOGGER.info("3) analysis logs")
-    analysis_log(key_logs)
+    result.log(RUN_LOGGER)
+
+    RUN_LOGGER.info("4) append results to the result store")
+    case_info = case.split(":")
+    chip = case_info[1] if len(case_info) > 1 else None
+    records = result_store.host_records(result, "base", case_info[0],
+                                        config.VENDOR, chip,
+                                        timestamp_log_dir)
+    result_store.append_records(
+        os.path.join(dp_path, result_store.store_path(config)), records,
+        RUN_LOGGER)
 
 
 if __name__ == '__main__':
     if len(sys.argv) > 1:
         usage()
     main()
+    CLUSTER_MGR.close()
     RUN_LOGGER.stop()
@@ -4,6 +4,7 @@
 Usage:  python3 sys-monitor.py -o operation -l [log_path]
             -o, --operation     start|stop|restart|status
             -l, --log           log path , ./logs/ default
+            -f, --format        text|binary, text default
 '''
 
 import os
@@ -17,6 +18,14 @@ from multiprocessing import Process
 import subprocess
 import schedule
 
+# monitor_log in utils/ writes binary logs
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../../utils"))
+# device lines of the query output, and their columns kept in binary logs,
+# the ones cambricon_analysis reads
+DEVICE_MARKER = "MiB"
+DEVICE_COLUMNS = [0, 1, 3, 5]
+
 
 class Daemon:
     '''
@@ -38,6 +47,7 @@ class Daemon:
                  stderr=os.devnull,
                  home_dir='.',
                  umask=0o22,
+                 log_format="text",
                  verbose=0):
         self.stdin = stdin
         self.stdout = stdout
@@ -53,6 +63,7 @@ class Daemon:
         self.umask = umask
         self.verbose = verbose
         self.daemon_alive = True
+        self.log_format = log_format
 
     def get_pid(self):
         try:
@@ -90,6 +101,12 @@ class Daemon:
 
             if process.returncode != 0:
                 result = "error"
+            if self.log_format == "binary":
+                # numpy is only needed on hosts writing binary logs
+                import monitor_log
+                monitor_log.append_device_sample(file, out[0], DEVICE_MARKER,
+                                                 DEVICE_COLUMNS)
+                return
             result = TIMESTAMP + "\n" + out[0] + "\n"
             with open(file, 'a') as f:
                 f.write(result)
@@ -144,8 +161,11 @@ class Daemon:
     def start(self):
         if not os.path.exists(self.logpath):
             os.makedirs(self.logpath)
-        elif os.path.exists(self.mlufile):
-            os.remove(self.mlufile)
+        else:
+            bin_file = os.path.splitext(self.mlufile)[0] + ".bin"
+            for log in self.mlufile, bin_file:
+                if os.path.exists(log):
+                    os.remove(log)
         if self.verbose >= 1:
             print('ready to start ......')
         # check for a pid file to see if the daemon already runs
@@ -214,6 +234,13 @@ def parse_args():
                        required=False,
                        default='/tmp/',
                        help='log path')
+    parse.add_argument('-f',
+                       type=str,
+                       metavar='[format]',
+                       required=False,
+                       default='text',
+                       choices=['text', 'binary'],
+                       help='text|binary')
     args = parse.parse_args()
     return args
 
@@ -267,7 +294,8 @@ def main():
                        mlu_fn,
                        log_path,
                        verbose=1,
-                       rate=sample_rate1)
+                       rate=sample_rate1,
+                       log_format=args.f)
     if operation == 'start':
         subdaemon.start()
     elif operation == 'stop':
@@ -7,7 +7,7 @@ import numpy as np
 from tqdm import tqdm
 from loguru import logger
 
-from tools import torch_sync
+from tools import torch_sync, LatencyRecorder
 from flagai.data.tokenizer import Tokenizer
 from .utils import TASKS, gen_prompt, format_example, batch_split
 
@@ -22,7 +22,7 @@ def cal_perf(config, tokens, duration, core_time, str_prefix):
     return round(model_forward_perf, 3), round(model_forward_core_perf, 3)
 
 
-def batch_infer(model, tokenizer, config, prompts):
+def batch_infer(model, tokenizer, config, prompts, recorder):
     answers = []
     start = time.time()
     core_time = 0.0
@@ -34,11 +34,11 @@ def batch_infer(model, tokenizer, config, prompts):
         prompt_tokens_all += len(prompt_tokens)
         with torch.no_grad():
             torch_sync(config)
-            core_time_start = time.time()
+            recorder.start()
             model_forward_output = model(tokens)
             predict_result = torch.argmax(model_forward_output["logits"], dim=1)
             model_output = tokenizer.decode([predict_result.item()])
-            core_time += time.time() - core_time_start
+            core_time += recorder.stop()
         answers.append(model_output)
     duration = time.time() - start
     model_forward_perf, model_forward_core_perf = cal_perf(
@@ -54,17 +54,18 @@ def model_forward(model, dataloader, evaluator, config):
 
     average_model_forward_perf = []
     average_model_forward_core_perf = []
+    recorder = LatencyRecorder("Validation")
 
     for task in TASKS:
         logger.info('Testing %s ...' % task)
         records = []
         dev_df = pd.read_csv(os.path.join(config.data_dir, "dev", task + "_dev.csv"), header=None)[:config.ntrain]
         test_df = pd.read_csv(os.path.join(config.data_dir, "test", task + "_test.csv"), header=None)
+        # the few-shot prefix is the same for all questions of a task
+        train_prompt = gen_prompt(dev_df, task, config.ntrain)
         for i in range(test_df.shape[0]):
             # get prompt and make sure it fits
-            k = config.ntrain
             prompt_end = format_example(test_df, i, include_answer=False)
-            train_prompt = gen_prompt(dev_df, task, k)
             prompt = train_prompt + prompt_end
             while len(tokenizer.tokenize(prompt)) + 1> 2048: # bos token
                 prompt_split = prompt.split("\n\n")
@@ -73,7 +74,7 @@ def model_forward(model, dataloader, evaluator, config):
             label = test_df.iloc[i, test_df.shape[1]-1]
             records.append({'prompt':prompt, 'answer':label})
 
-        pred_answers, model_forward_perf, model_forward_core_perf = batch_infer(model, tokenizer, config, [record['prompt'] for record in records])
+        pred_answers, model_forward_perf, model_forward_core_perf = batch_infer(model, tokenizer, config, [record['prompt'] for record in records], recorder)
         
         gold_answers = [record['answer'] for record in records]
         run_results[task] = {'pred_answers':pred_answers, 'gold_answers':gold_answers}
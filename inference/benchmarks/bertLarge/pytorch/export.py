@@ -1,30 +1,24 @@
 import torch
-import os
+from tools import export_cache
 
 
 def export_model(model, config):
     if config.exist_onnx_path is not None:
         return config.exist_onnx_path
 
-    filename = config.case + "_bs" + str(config.batch_size)
-    filename = filename + "_" + str(config.framework)
-    filename = filename + "_fp16" + str(config.fp16)
-    filename = "onnxs/" + filename + ".onnx"
-    onnx_path = config.perf_dir + "/" + filename
+    def export(onnx_path):
+        dummy_input = torch.ones(config.batch_size, config.seq_length).int().cuda()
 
-    dummy_input = torch.ones(config.batch_size, config.seq_length).int().cuda()
+        with torch.no_grad():
+            torch.onnx.export(model,
+                              dummy_input,
+                              onnx_path,
+                              verbose=False,
+                              input_names=["input"],
+                              output_names=["output"],
+                              training=torch.onnx.TrainingMode.EVAL,
+                              do_constant_folding=True)
 
-    dir_onnx_path = os.path.dirname(onnx_path)
-    os.makedirs(dir_onnx_path, exist_ok=True)
-
-    with torch.no_grad():
-        torch.onnx.export(model,
-                          dummy_input,
-                          onnx_path,
-                          verbose=False,
-                          input_names=["input"],
-                          output_names=["output"],
-                          training=torch.onnx.TrainingMode.EVAL,
-                          do_constant_folding=True)
-
-    return onnx_path
+    # the dummy input shape is part of the exported graph
+    shapes = {"seq_length": config.seq_length}
+    return export_cache.cached_export(model, config, export, shapes)
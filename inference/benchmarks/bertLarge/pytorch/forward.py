@@ -2,7 +2,7 @@ from loguru import logger
 import torch
 import numpy as np
 import time
-from tools import torch_sync
+from tools import torch_sync, LatencyRecorder
 
 
 def cal_perf(config, dataloader_len, duration, core_time, str_prefix):
@@ -20,6 +20,7 @@ def model_forward(model, dataloader, evaluator, config):
         return None, None, None
     start = time.time()
     core_time = 0.0
+    recorder = LatencyRecorder("Validation", config.repeat * len(dataloader))
 
     correct = 1
     whole = 1
@@ -31,7 +32,7 @@ def model_forward(model, dataloader, evaluator, config):
         all_top1 = []
         for step, (x, y) in enumerate(dataloader):
             torch_sync(config)
-            core_time_start = time.time()
+            recorder.start()
 
             if step % config.log_freq == 0:
                 logger.debug("Step: " + str(step) + " / " +
@@ -43,7 +44,7 @@ def model_forward(model, dataloader, evaluator, config):
 
                 pred = model(x)
                 torch_sync(config)
-                core_time += time.time() - core_time_start
+                core_time += recorder.stop()
 
                 pred = pred[0]
                 pred = torch.argmax(pred, dim=2)
@@ -66,6 +67,7 @@ def model_forward(model, dataloader, evaluator, config):
 def engine_forward(model, dataloader, evaluator, config):
     start = time.time()
     core_time = 0.0
+    recorder = LatencyRecorder("Inference", config.repeat * len(dataloader))
     foo_time = 0.0
 
     correct = 1
@@ -78,7 +80,7 @@ def engine_forward(model, dataloader, evaluator, config):
         all_top1 = []
         for step, (x, y) in enumerate(dataloader):
             torch_sync(config)
-            core_time_start = time.time()
+            recorder.start()
 
             if step % config.log_freq == 0:
                 logger.debug("Step: " + str(step) + " / " +
@@ -89,9 +91,10 @@ def engine_forward(model, dataloader, evaluator, config):
                 outputs = model([x])
                 pred = outputs[0]
                 foo_time += outputs[1]
+                recorder.exclude(outputs[1])
 
                 torch_sync(config)
-                core_time += time.time() - core_time_start
+                core_time += recorder.stop()
 
                 pred = pred[0]
                 pred = pred.reshape(config.batch_size, config.seq_length, -1)
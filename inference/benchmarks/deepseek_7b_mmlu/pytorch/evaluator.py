@@ -2,17 +2,17 @@ import torch
 
 
 def evaluator(pred, y, dataloader):
-
+    '''Number of questions in the batch answered right.'''
     tokenizer = dataloader.dataset.tokenizer
 
-    gt = y[0][0][1]
-    predict = pred[:, -1, :]
-    answer = torch.argmax(predict, dim=1)
-    answer_str = tokenizer.decode(answer)
+    answers = torch.argmax(pred[:, -1, :], dim=1)
     valid_answers = ['A', 'B', 'C', 'D']
-    answer_str = ''.join([c for c in answer_str if c in valid_answers])
-    gt_str = tokenizer.decode(gt)
-    if answer_str == gt_str:
-        return 1
-    else:
-        return 0
+    correct = 0
+    for answer, label in zip(answers, y):
+        gt = label[1]
+        answer_str = tokenizer.decode(answer)
+        answer_str = ''.join([c for c in answer_str if c in valid_answers])
+        gt_str = tokenizer.decode(gt)
+        if answer_str == gt_str:
+            correct += 1
+    return correct
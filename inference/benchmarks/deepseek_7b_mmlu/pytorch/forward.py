@@ -2,7 +2,8 @@ from loguru import logger
 import torch
 import numpy as np
 import time
-from tools import torch_sync
+from tools import torch_sync, LatencyRecorder
+from tools import mmlu_cache
 
 
 def cal_perf(config, tokens, duration, core_time, str_prefix):
@@ -18,8 +19,12 @@ def cal_perf(config, tokens, duration, core_time, str_prefix):
 def model_forward(model, dataloader, evaluator, config):
     if config.no_validation:
         return None, None, None
+    if config.mmlu_prefix_kv_cache:
+        return prefix_shared_model_forward(model, dataloader, evaluator,
+                                           config)
     start = time.time()
     core_time = 0.0
+    recorder = LatencyRecorder("Validation", config.repeat * len(dataloader))
 
     token_cnt = 0
     correct = 0
@@ -34,25 +39,27 @@ def model_forward(model, dataloader, evaluator, config):
                 logger.debug("Step: " + str(step) + " / " +
                              str(len(dataloader)))
 
-            tokens = item["prompt"].input_ids.cuda()[0]
+            inputs = [
+                x.cuda() for x in mmlu_cache.model_inputs(item, config)
+            ]
 
             with torch.no_grad():
 
                 torch_sync(config)
-                core_time_start = time.time()
+                recorder.start()
 
-                y = model(tokens)
+                y = model(*inputs)
 
                 torch_sync(config)
-                core_time += time.time() - core_time_start
+                core_time += recorder.stop()
 
-                token_cnt += len(tokens[0])
+                token_cnt += item["token_count"]
 
                 pred = y[0]
                 r = evaluator(pred, item["answer"], dataloader)
 
                 correct += r
-                whole += 1
+                whole += len(item["answer"])
 
     logger.info("MMLU" + str(config.few_shots) + "-shots Acc: " +
                 str(correct / whole))
@@ -65,11 +72,50 @@ def model_forward(model, dataloader, evaluator, config):
         correct / whole, 3)
 
 
+def prefix_shared_model_forward(model, dataloader, evaluator, config):
+    '''model_forward prefilling the shared few-shot prefix of each task once
+    and running only the question suffixes on its past key values. Perf still
+    counts the full prompt tokens.'''
+    start = time.time()
+    core_time = 0.0
+    recorder = LatencyRecorder("Validation",
+                               config.repeat * len(dataloader.dataset))
+
+    token_cnt = 0
+    correct = 0
+    whole = 0
+
+    for times in range(config.repeat):
+
+        logger.debug("Repeat: " + str(times + 1))
+
+        with torch.no_grad():
+            for pred, answer, tokens, seconds in mmlu_cache.prefix_shared_forward(
+                    model, dataloader.dataset, config, recorder):
+                core_time += seconds
+                token_cnt += tokens
+
+                correct += evaluator(pred, answer, dataloader)
+                whole += 1
+
+    logger.info("MMLU" + str(config.few_shots) +
+                "-shots Acc(shared prefix KV cache): " + str(correct / whole))
+
+    duration = time.time() - start
+    model_forward_perf, model_forward_core_perf = cal_perf(
+        config, token_cnt, duration, core_time,
+        "Validation(shared prefix KV cache)")
+
+    return model_forward_perf, model_forward_core_perf, round(
+        correct / whole, 3)
+
+
 def engine_forward(model, dataloader, evaluator, config):
     if config.no_validation:
         return None, None, None
     start = time.time()
     core_time = 0.0
+    recorder = LatencyRecorder("Inference", config.repeat * len(dataloader))
     foo_time = 0.0
 
     token_cnt = 0
@@ -85,30 +131,30 @@ def engine_forward(model, dataloader, evaluator, config):
                 logger.debug("Step: " + str(step) + " / " +
                              str(len(dataloader)))
 
-            tokens = item["prompt"].input_ids[0]
-            model_inputs = [tokens]
+            model_inputs = mmlu_cache.model_inputs(item, config)
 
             with torch.no_grad():
 
                 torch_sync(config)
-                core_time_start = time.time()
+                recorder.start()
 
                 y = model(model_inputs)
 
                 torch_sync(config)
-                core_time += time.time() - core_time_start
+                core_time += recorder.stop()
 
                 foo_time += y[1]
+                recorder.exclude(y[1])
                 model_outputs = y[0]
 
-                token_cnt += len(tokens[0])
+                token_cnt += item["token_count"]
 
                 y = model_outputs[0]
                 pred = y[0]
                 r = evaluator(pred, item["answer"], dataloader)
 
                 correct += r
-                whole += 1
+                whole += len(item["answer"])
 
     logger.info("MMLU" + str(config.few_shots) + "-shots Acc: " +
                 str(correct / whole))
@@ -1,9 +1,6 @@
 import os
-import pandas as pd
 from transformers import AutoTokenizer
-import torch
-from torch.utils.data import DataLoader, Dataset
-from loguru import logger
+from tools import mmlu_cache
 
 TASKS = [
         'abstract_algebra',
@@ -94,51 +91,14 @@ def format_example(df, idx, include_answer=True):
     return prompt
     
     
-class mmlu(Dataset):
+class mmlu(mmlu_cache.TokenizedMMLU):
 
     def __init__(self, config):
-        self.tokenizer = AutoTokenizer.from_pretrained(os.path.join(config.data_dir, config.weight_dir))
-        self.records = []
-        self.length = 0
-        
-        for task in TASKS:
-        
-            logger.debug("Loading 5-shot " + str(task))
-            
-            dev_df = pd.read_csv(os.path.join(config.data_dir, config.mmlu_dir, "dev", task + "_dev.csv"), header=None)[:config.few_shots]
-            test_df = pd.read_csv(os.path.join(config.data_dir, config.mmlu_dir, "test", task + "_test.csv"), header=None)
-            
-            for i in range(test_df.shape[0]):
-                k = config.few_shots
-                prompt_end = format_example(test_df, i, include_answer=False)
-                train_prompt = gen_prompt(dev_df, task, k)
-                prompt = train_prompt + prompt_end
-                while len(self.tokenizer.tokenize(prompt)) + 1> 2048:
-                    prompt_split = prompt.split("\n\n")
-                    prompt_split.pop(1)
-                    prompt = "\n\n".join(prompt_split)
-                label = test_df.iloc[i, test_df.shape[1]-1]
-                token_prompt = self.tokenizer(prompt, return_tensors="pt")
-                token_label = self.tokenizer([label], return_tensors="pt")
-                self.records.append({"prompt":token_prompt, "answer":token_label.input_ids})
-                self.length += 1
-                
+        tokenizer = AutoTokenizer.from_pretrained(
+            os.path.join(config.data_dir, config.weight_dir))
+        super().__init__(config, tokenizer, TASKS, gen_prompt, format_example)
 
-    def __len__(self):
-        return self.length
 
-    def __getitem__(self, idx):
-        return self.records[idx]
-        
-        
 def build_dataloader(config):
     dataset = mmlu(config)
-    assert config.batch_size == 1
-    loader = DataLoader(dataset,
-                        batch_size=config.batch_size,
-                        shuffle=False,
-                        drop_last=False,
-                        num_workers=config.num_workers,
-                        pin_memory=True)
-
-    return loader
\ No newline at end of file
+    return mmlu_cache.build_loader(dataset, config)
@@ -2,10 +2,10 @@ import torch
 
 
 def evaluator(pred, y):
-    gt = float(y[0][0][1])
-    predict = pred[:,-1,:]
-    answer = float(torch.argmax(predict, dim=1))
-    if answer == gt:
-        return 1
-    else:
-        return 0
+    '''Number of questions in the batch answered right.'''
+    answers = torch.argmax(pred[:, -1, :], dim=1)
+    correct = 0
+    for answer, label in zip(answers, y):
+        if float(answer) == float(label[1]):
+            correct += 1
+    return correct
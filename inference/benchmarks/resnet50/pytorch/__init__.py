@@ -1,5 +1,5 @@
 from .dataloader import build_dataloader
 from .model import create_model
-from .export import export_model
+from .export import export_model, DYNAMIC_BATCH_EXPORT
 from .evaluator import evaluator
 from .forward import model_forward, engine_forward
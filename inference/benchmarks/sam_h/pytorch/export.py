@@ -1,33 +1,27 @@
 import torch
-import os
+from tools import export_cache
 
 
 def export_model(model, config):
     if config.exist_onnx_path is not None:
         return config.exist_onnx_path
 
-    filename = config.case + "_bs" + str(config.batch_size)
-    filename = filename + "_" + str(config.framework)
-    filename = filename + "_fp16" + str(config.fp16)
-    filename = "onnxs/" + filename + ".onnx"
-    onnx_path = config.perf_dir + "/" + filename
-
-    img = torch.randn(config.batch_size, 3, 1024, 1024).cuda()
-    points = torch.ones(config.batch_size, 1, 1, 2).cuda()
-
-    if config.fp16:
-        img = img.half()
-    dummy_input = (img, points)
-
-    dir_onnx_path = os.path.dirname(onnx_path)
-    os.makedirs(dir_onnx_path, exist_ok=True)
-
-    with torch.no_grad():
-        torch.onnx.export(model,
-                          dummy_input,
-                          onnx_path,
-                          verbose=False,
-                          training=torch.onnx.TrainingMode.EVAL,
-                          do_constant_folding=True)
-
-    return onnx_path
+    def export(onnx_path):
+        img = torch.randn(config.batch_size, *shapes["img"]).cuda()
+        points = torch.ones(config.batch_size, *shapes["points"]).cuda()
+
+        if config.fp16:
+            img = img.half()
+        dummy_input = (img, points)
+
+        with torch.no_grad():
+            torch.onnx.export(model,
+                              dummy_input,
+                              onnx_path,
+                              verbose=False,
+                              training=torch.onnx.TrainingMode.EVAL,
+                              do_constant_folding=True)
+
+    # the dummy input shapes are part of the exported graph
+    shapes = {"img": (3, 1024, 1024), "points": (1, 1, 2)}
+    return export_cache.cached_export(model, config, export, shapes)
@@ -2,7 +2,7 @@ from loguru import logger
 import torch
 import numpy as np
 import time
-from tools import torch_sync
+from tools import torch_sync, LatencyRecorder
 from transformers import SamProcessor
 
 
@@ -24,6 +24,7 @@ def model_forward(model, dataloader, evaluator, config):
     gt_path = config.data_dir + "/" + config.ground_truth
     start = time.time()
     core_time = 0.0
+    recorder = LatencyRecorder("Validation", config.repeat * len(dataloader))
     scores = []
 
     for times in range(config.repeat):
@@ -36,7 +37,7 @@ def model_forward(model, dataloader, evaluator, config):
                 x = x.to(torch.float16)
                 y = y.to(torch.float16)
             torch_sync(config)
-            core_time_start = time.time()
+            recorder.start()
 
             if step % config.log_freq == 0:
                 logger.debug("Step: " + str(step) + " / " +
@@ -49,7 +50,7 @@ def model_forward(model, dataloader, evaluator, config):
 
                 pred = model(x, y)[1]
                 torch_sync(config)
-                core_time += time.time() - core_time_start
+                core_time += recorder.stop()
 
                 pred = processor.post_process_masks(pred, osize, dsize)
                 score = evaluator(pred, gt_path)
@@ -73,6 +74,7 @@ def engine_forward(model, dataloader, evaluator, config):
     gt_path = config.data_dir + "/" + config.ground_truth
     start = time.time()
     core_time = 0.0
+    recorder = LatencyRecorder("Inference", config.repeat * len(dataloader))
     foo_time = 0.0
     scores = []
 
@@ -85,7 +87,7 @@ def engine_forward(model, dataloader, evaluator, config):
             if config.fp16:
                 x = x.to(torch.float16)
             torch_sync(config)
-            core_time_start = time.time()
+            recorder.start()
 
             if step % config.log_freq == 0:
                 logger.debug("Step: " + str(step) + " / " +
@@ -96,9 +98,10 @@ def engine_forward(model, dataloader, evaluator, config):
                 outputs = model([x, y])
                 pred = outputs[0]
                 foo_time += outputs[1]
+                recorder.exclude(outputs[1])
 
                 torch_sync(config)
-                core_time += time.time() - core_time_start
+                core_time += recorder.stop()
 
                 pred = pred[0]
                 pred = pred.reshape(config.batch_size, 1, 3, 256, 256).float()
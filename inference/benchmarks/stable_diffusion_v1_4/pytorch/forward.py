@@ -2,7 +2,7 @@ from loguru import logger
 import torch
 import numpy as np
 import time
-from tools import torch_sync
+from tools import torch_sync, LatencyRecorder
 from diffusers import AutoencoderKL, UNet2DConditionModel, DDIMScheduler
 from transformers import CLIPTextModel, CLIPTokenizer
 from torchmetrics.multimodal import CLIPScore
@@ -48,6 +48,9 @@ def model_forward(model, dataloader, evaluator, config):
 
     start = time.time()
     core_time = 0.0
+    recorder = LatencyRecorder("Validation",
+                               config.repeat * len(dataloader) *
+                               config.num_inference_steps)
     scores = []
     for times in range(config.repeat):
 
@@ -92,7 +95,7 @@ def model_forward(model, dataloader, evaluator, config):
                     latent_model_input = torch.cat([latents] * 2)
 
                     torch_sync(config)
-                    core_time_start = time.time()
+                    recorder.start()
                     if config.fp16:
                         noise_pred = model(
                             latent_model_input.cuda().to(torch.float16),
@@ -103,7 +106,7 @@ def model_forward(model, dataloader, evaluator, config):
                                            text_embeddings.cuda())
 
                     torch_sync(config)
-                    core_time += time.time() - core_time_start
+                    core_time += recorder.stop()
 
                     noise_pred = noise_pred.to(torch.float32).cpu()
 
@@ -160,6 +163,9 @@ def engine_forward(model, dataloader, evaluator, config):
 
     start = time.time()
     core_time = 0.0
+    recorder = LatencyRecorder("Inference",
+                               config.repeat * len(dataloader) *
+                               config.num_inference_steps)
     scores = []
     for times in range(config.repeat):
 
@@ -211,13 +217,14 @@ def engine_forward(model, dataloader, evaluator, config):
                         ]
 
                     torch_sync(config)
-                    core_time_start = time.time()
+                    recorder.start()
                     outputs = model(inputs)
                     noise_pred = outputs[0]
                     foo_time = outputs[1]
+                    recorder.exclude(outputs[1])
 
                     torch_sync(config)
-                    core_time += time.time() - core_time_start
+                    core_time += recorder.stop()
 
                     noise_pred = noise_pred[0].float()
                     noise_pred = noise_pred.reshape(
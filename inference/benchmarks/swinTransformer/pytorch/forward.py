@@ -2,7 +2,8 @@ from loguru import logger
 import torch
 import numpy as np
 import time
-from tools import torch_sync
+from tools import torch_sync, LatencyRecorder
+from tools import CudaPrefetcher, AsyncEvaluator
 
 
 def cal_perf(config, dataloader_len, duration, core_time, str_prefix):
@@ -20,6 +21,9 @@ def model_forward(model, dataloader, evaluator, config):
         return None, None, None
     start = time.time()
     core_time = 0.0
+    recorder = LatencyRecorder("Validation", config.repeat * len(dataloader))
+    loader = CudaPrefetcher(dataloader, config, device_fields=(0, 1))
+    evaluation = AsyncEvaluator(evaluator, config)
     acc = []
 
     for times in range(config.repeat):
@@ -27,9 +31,9 @@ def model_forward(model, dataloader, evaluator, config):
         logger.debug("Repeat: " + str(times + 1))
 
         all_top1 = []
-        for step, (x, y) in enumerate(dataloader):
+        for step, (x, y) in enumerate(loader):
             torch_sync(config)
-            core_time_start = time.time()
+            recorder.start()
 
             if step % config.log_freq == 0:
                 logger.debug("Step: " + str(step) + " / " +
@@ -40,13 +44,14 @@ def model_forward(model, dataloader, evaluator, config):
                 x = x.cuda()
                 y = y.cuda()
                 pred = model(x)
+                loader.preload()
                 torch_sync(config)
-                core_time += time.time() - core_time_start
+                core_time += recorder.stop()
 
-                top1 = evaluator(pred, y)
-
-                all_top1.extend(top1.cpu())
+                evaluation.submit(pred, y)
 
+        for top1 in evaluation.results():
+            all_top1.extend(top1.cpu())
         acc.append(np.mean(all_top1))
 
     logger.info("Top1 Acc: " + str(acc))
@@ -62,6 +67,9 @@ def model_forward(model, dataloader, evaluator, config):
 def engine_forward(model, dataloader, evaluator, config):
     start = time.time()
     core_time = 0.0
+    recorder = LatencyRecorder("Inference", config.repeat * len(dataloader))
+    loader = CudaPrefetcher(dataloader, config)
+    evaluation = AsyncEvaluator(evaluator, config)
     foo_time = 0.0
     acc = []
 
@@ -70,9 +78,9 @@ def engine_forward(model, dataloader, evaluator, config):
         logger.debug("Repeat: " + str(times + 1))
 
         all_top1 = []
-        for step, (x, y) in enumerate(dataloader):
+        for step, (x, y) in enumerate(loader):
             torch_sync(config)
-            core_time_start = time.time()
+            recorder.start()
 
             if step % config.log_freq == 0:
                 logger.debug("Step: " + str(step) + " / " +
@@ -83,17 +91,20 @@ def engine_forward(model, dataloader, evaluator, config):
                 outputs = model([x])
                 pred = outputs[0]
                 foo_time += outputs[1]
+                recorder.exclude(outputs[1])
+                loader.preload()
 
                 torch_sync(config)
-                core_time += time.time() - core_time_start
-
-                pred = pred[0].float()
-                pred = pred.reshape(config.batch_size, -1)
-                pred = pred.cpu()
-                top1 = evaluator(pred, y)
+                core_time += recorder.stop()
 
-                all_top1.extend(top1.cpu())
+                pred = pred[0].reshape(config.batch_size, -1)
+                pred = pred.to("cpu",
+                               torch.float32,
+                               non_blocking=evaluation.enabled)
+                evaluation.submit(pred, y)
 
+        for top1 in evaluation.results():
+            all_top1.extend(top1.cpu())
         acc.append(np.mean(all_top1))
 
     logger.info("Top1 Acc: " + str(acc))
@@ -1,7 +1,7 @@
 import time
 
 import torch
-from tools import torch_sync
+from tools import torch_sync, LatencyRecorder
 from loguru import logger
 
 from tools import torch_sync
@@ -27,6 +27,7 @@ def model_forward(model, dataloader, evaluator, config):
 def engine_forward(model, dataloader, evaluator, config):
     start = time.time()
     core_time = 0.0
+    recorder = LatencyRecorder("Inference", config.repeat * len(dataloader))
     foo_time = 0.0
     result = {}
     for times in range(config.repeat):
@@ -50,14 +51,15 @@ def engine_forward(model, dataloader, evaluator, config):
                     images = images.half()
                     
                 torch_sync(config)
-                core_time_start = time.time()
+                recorder.start()
 
                 outputs = model([images])
 
                 pred = outputs[0]
                 foo_time += outputs[1]
+                recorder.exclude(outputs[1])
                 torch_sync(config)
-                core_time += time.time() - core_time_start
+                core_time += recorder.stop()
                 pred = pred[0].float().cpu()
 
                 output_shape = (config.batch_size, config.hidden_size, config.number_boxes)
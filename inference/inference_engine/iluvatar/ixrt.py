@@ -8,6 +8,7 @@ import pycuda.driver as cuda
 import pycuda.autoinit
 import time
 import subprocess
+from tools import engine_cache
 
 class InferModel:
 
@@ -65,28 +66,36 @@ class InferModel:
 
     def build_engine(self, config, onnx_path):
         if config.exist_compiler_path is None:
-            ixrt_path = config.log_dir + "/" + config.ixrt_tmp_path
 
-            dir_trt_path = os.path.dirname(ixrt_path)
-            os.makedirs(dir_trt_path, exist_ok=True)
-
-            time.sleep(10)
-
-            onnxsim_cmd = f"onnxsim {onnx_path} {onnx_path}"
-
-            onnxsim_cmd = subprocess.Popen(onnxsim_cmd, shell=True)
-            onnxsim_cmd.wait()
-
-            ixrtexec_cmd = "ixrtexec --onnx=" + onnx_path + " --save_engine=" + ixrt_path
-            if config.fp16:
-                ixrtexec_cmd += " --precision fp16"
-            if config.has_dynamic_axis:
-                ixrtexec_cmd += " --minShapes=" + config.minShapes
-                ixrtexec_cmd += " --optShapes=" + config.optShapes
-                ixrtexec_cmd += " --maxShapes=" + config.maxShapes
-
-            p = subprocess.Popen(ixrtexec_cmd, shell=True)
-            p.wait()
+            def ixrtexec(ixrt_path):
+                # onnx_path may be a cached export, never rewrite it
+                sim_path = ixrt_path + ".sim.onnx"
+                onnxsim_cmd = f"onnxsim {onnx_path} {sim_path}"
+
+                onnxsim_cmd = subprocess.Popen(onnxsim_cmd, shell=True)
+                if onnxsim_cmd.wait() != 0:
+                    return onnxsim_cmd.returncode
+
+                ixrtexec_cmd = "ixrtexec --onnx=" + sim_path + " --save_engine=" + ixrt_path
+                if config.fp16:
+                    ixrtexec_cmd += " --precision fp16"
+                if config.has_dynamic_axis:
+                    ixrtexec_cmd += " --minShapes=" + config.minShapes
+                    ixrtexec_cmd += " --optShapes=" + config.optShapes
+                    ixrtexec_cmd += " --maxShapes=" + config.maxShapes
+
+                p = subprocess.Popen(ixrtexec_cmd, shell=True)
+                returncode = p.wait()
+                os.remove(sim_path)
+                return returncode
+
+            ixrt_path = engine_cache.cached_build(
+                config,
+                onnx_path,
+                trt.__version__,
+                ".engine",
+                ixrtexec,
+                uncached_path=config.log_dir + "/" + config.ixrt_tmp_path)
         else:
             ixrt_path = config.exist_compiler_path
 
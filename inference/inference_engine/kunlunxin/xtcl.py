@@ -7,7 +7,8 @@ import tvm
 import tvm.relay as relay
 from tvm.contrib import graph_executor, xpu_config
 from tvm.relay.xpu.patterns import custom_fuse_patterns
-from tvm.runtime.vm import VirtualMachine
+from tvm.runtime.vm import VirtualMachine, Executable
+from tools import engine_cache
 
 
 class InferModel:
@@ -26,13 +27,11 @@ class InferModel:
             self.input_names.append(input_name)
             shape_dict[input_name] = input_shape
 
-        mod, params = relay.frontend.from_onnx(onnx_model, shape_dict)
-
         target_host = f'llvm -acc=xpu{os.environ.get("XPUSIM_DEVICE_MODEL", "KUNLUN1")[-1]}'
         ctx = tvm.device("xpu", 0)
-        build_config = config.build_config if 'build_config' in config._fields else {}
-        disabled_pass = config.disabled_pass if 'disabled_pass' in config._fields else []
-        self.vm_enable = config.vm_enable if 'vm_enable' in config._fields else True
+        build_config = config.build_config
+        disabled_pass = config.disabled_pass
+        self.vm_enable = config.vm_enable
         if "pattern_match" in build_config:
             build_config["XPUFuzzyMatch"] = xpu_config.XPUGraphMatchConfig(
                 pattern_match=build_config["pattern_match"]).value()
@@ -52,18 +51,50 @@ class InferModel:
             os.environ['XTCL_USE_FP16'] = '1'
             os.environ['XTCL_QUANTIZE_WEIGHT'] = '1'
 
-        with tvm.transform.PassContext(opt_level=3, config=build_config, disabled_pass=disabled_pass):
-            if self.vm_enable:
-                vm_exec = relay.backend.vm.compile(mod, target=target_host, target_host=target_host, params=params)
-                vm = VirtualMachine(vm_exec, ctx)
-                return vm
-            else:
-                graph, lib, params = relay.build(mod,
-                                                 target="xpu -libs=xdnn -split-device-funcs -device-type=xpu2",
-                                                 params=params)
-                m = graph_executor.create(graph, lib, ctx)
-                m.set_input(**params)
-                return m
+        def compile(engine_dir):
+            os.makedirs(engine_dir, exist_ok=True)
+            mod, params = relay.frontend.from_onnx(onnx_model, shape_dict)
+            with tvm.transform.PassContext(opt_level=3, config=build_config, disabled_pass=disabled_pass):
+                if self.vm_enable:
+                    vm_exec = relay.backend.vm.compile(mod, target=target_host, target_host=target_host, params=params)
+                    code, lib = vm_exec.save()
+                    lib.export_library(os.path.join(engine_dir, "lib.so"))
+                    with open(os.path.join(engine_dir, "code.ro"), "wb") as f:
+                        f.write(code)
+                else:
+                    graph, lib, graph_params = relay.build(mod,
+                                                           target="xpu -libs=xdnn -split-device-funcs -device-type=xpu2",
+                                                           params=params)
+                    lib.export_library(os.path.join(engine_dir, "lib.so"))
+                    with open(os.path.join(engine_dir, "graph.json"), "w") as f:
+                        f.write(graph)
+                    with open(os.path.join(engine_dir, "params.bin"), "wb") as f:
+                        f.write(tvm.runtime.save_param_dict(graph_params))
+
+        # build options and XTCL_* switches are part of the engine
+        extra = {
+            "build_config": str(build_config),
+            "disabled_pass": disabled_pass,
+            "vm_enable": self.vm_enable,
+            "target_host": target_host,
+            "env": {k: v for k, v in os.environ.items() if k.startswith("XTCL_")},
+        }
+        engine_dir = engine_cache.cached_build(config, onnx_path, tvm.__version__, ".xtcl", compile, extra)
+
+        lib = tvm.runtime.load_module(os.path.join(engine_dir, "lib.so"))
+        if self.vm_enable:
+            with open(os.path.join(engine_dir, "code.ro"), "rb") as f:
+                vm_exec = Executable.load_exec(bytearray(f.read()), lib)
+            vm = VirtualMachine(vm_exec, ctx)
+            return vm
+        else:
+            with open(os.path.join(engine_dir, "graph.json"), "r") as f:
+                graph = f.read()
+            with open(os.path.join(engine_dir, "params.bin"), "rb") as f:
+                graph_params = tvm.runtime.load_param_dict(f.read())
+            m = graph_executor.create(graph, lib, ctx)
+            m.set_input(**graph_params)
+            return m
 
     def __call__(self, model_inputs: list):
         for index, input_name in enumerate(self.input_names):
@@ -14,14 +14,18 @@ class InferModel:
         self.warmup = config.dynamo_wamrup_iters
 
     def __call__(self, model_inputs: list):
+        # model_inputs are positional args of the model, like input_ids,
+        # attention_mask and position_ids of a padded batch
+        model_inputs = [model_input.cuda() for model_input in model_inputs]
+
         start = time.time()
         if self.warmup != 0:
             for i in range(self.config.dynamo_wamrup_times):
-                _ = self.model(model_inputs[0])
+                _ = self.model(*model_inputs)
             self.warmup -= 1
 
         torch.cuda.synchronize()
         compile_foo_time = time.time() - start
 
-        model_outputs = self.model(model_inputs[0].cuda())
+        model_outputs = self.model(*model_inputs)
         return [model_outputs], compile_foo_time
@@ -9,15 +9,18 @@ import pycuda.driver as cuda
 import pycuda.autoinit
 import time
 import subprocess
+from loguru import logger
+from tools import engine_cache
 
 
 class InferModel:
 
     class HostDeviceMem(object):
 
-        def __init__(self, host_mem, device_mem):
+        def __init__(self, host_mem, device_mem, index=None):
             self.host = host_mem
             self.device = device_mem
+            self.index = index
 
         def __str__(self):
             return "Host:\n" + str(self.host) + "\nDevice:\n" + str(
@@ -33,11 +36,8 @@ class InferModel:
         self.runtime = trt.Runtime(self.logger)
 
         self.engine = self.build_engine(config, onnx_path)
-
-        self.inputs, self.outputs, self.bindings, self.stream = self.allocate_buffers(
-            self.engine)
-
         self.context = self.engine.create_execution_context()
+
         self.numpy_to_torch_dtype_dict = {
             bool: torch.bool,
             np.uint8: torch.uint8,
@@ -65,25 +65,42 @@ class InferModel:
             "complex128": torch.complex128,
         }
 
+        # trt_zero_copy: bind CUDA inputs and persistent output tensors,
+        # trt_cuda_graph: also replay the engine as a CUDA graph(static shapes
+        # only), which copies inputs into persistent tensors
+        self.zero_copy = config.trt_zero_copy
+        self.graph = None
+        if self.zero_copy:
+            self.input_tensors, self.output_tensors, self.bindings = self.allocate_tensors(
+                self.engine)
+            if config.trt_cuda_graph:
+                self.graph = self.capture_graph()
+        else:
+            self.inputs, self.outputs, self.bindings, self.stream = self.allocate_buffers(
+                self.engine)
+
     def build_engine(self, config, onnx_path):
         if config.exist_compiler_path is None:
-            trt_path = config.log_dir + "/" + config.trt_tmp_path
-
-            dir_trt_path = os.path.dirname(trt_path)
-            os.makedirs(dir_trt_path, exist_ok=True)
 
-            time.sleep(10)
+            def trtexec(trt_path):
+                trtexec_cmd = "trtexec --onnx=" + onnx_path + " --saveEngine=" + trt_path
+                if config.fp16:
+                    trtexec_cmd += " --fp16"
+                if config.has_dynamic_axis:
+                    trtexec_cmd += " --minShapes=" + config.minShapes
+                    trtexec_cmd += " --optShapes=" + config.optShapes
+                    trtexec_cmd += " --maxShapes=" + config.maxShapes
 
-            trtexec_cmd = "trtexec --onnx=" + onnx_path + " --saveEngine=" + trt_path
-            if config.fp16:
-                trtexec_cmd += " --fp16"
-            if config.has_dynamic_axis:
-                trtexec_cmd += " --minShapes=" + config.minShapes
-                trtexec_cmd += " --optShapes=" + config.optShapes
-                trtexec_cmd += " --maxShapes=" + config.maxShapes
+                p = subprocess.Popen(trtexec_cmd, shell=True)
+                return p.wait()
 
-            p = subprocess.Popen(trtexec_cmd, shell=True)
-            p.wait()
+            trt_path = engine_cache.cached_build(
+                config,
+                onnx_path,
+                trt.__version__,
+                ".trt",
+                trtexec,
+                uncached_path=config.log_dir + "/" + config.trt_tmp_path)
         else:
             trt_path = config.exist_compiler_path
 
@@ -96,26 +113,145 @@ class InferModel:
         bindings = []
         stream = cuda.Stream()
 
-        for binding in engine:
-            size = trt.volume(
-                engine.get_binding_shape(binding)) * engine.max_batch_size
+        for binding, size in zip(engine, self.binding_sizes(engine)):
+            index = engine.get_binding_index(binding)
             dtype = trt.nptype(engine.get_binding_dtype(binding))
 
-            host_mem = cuda.pagelocked_empty(size, dtype)
+            # only shape and dtype of host_mem are used, it is never pinned
+            host_mem = np.empty(size, dtype)
             device_mem = cuda.mem_alloc(host_mem.nbytes)
             bindings.append(int(device_mem))
 
             if engine.binding_is_input(binding):
-                inputs.append(self.HostDeviceMem(host_mem, device_mem))
+                inputs.append(self.HostDeviceMem(host_mem, device_mem, index))
             else:
-                outputs.append(self.HostDeviceMem(host_mem, device_mem))
+                outputs.append(self.HostDeviceMem(host_mem, device_mem,
+                                                  index))
 
         return inputs, outputs, bindings, stream
 
+    def binding_sizes(self, engine):
+        '''Element count of each binding. A dynamic shape engine is sized by
+        the max shapes of its profile.'''
+        if self.config.has_dynamic_axis:
+            for binding in engine:
+                if engine.binding_is_input(binding):
+                    self.context.set_binding_shape(
+                        engine.get_binding_index(binding),
+                        engine.get_profile_shape(0, binding)[2])
+
+        sizes = []
+        for binding in engine:
+            if self.config.has_dynamic_axis:
+                sizes.append(
+                    trt.volume(
+                        self.context.get_binding_shape(
+                            engine.get_binding_index(binding))))
+            else:
+                sizes.append(
+                    trt.volume(engine.get_binding_shape(binding)) *
+                    engine.max_batch_size)
+        return sizes
+
+    def allocate_tensors(self, engine):
+        '''Allocate a persistent torch tensor on device for each binding,
+        which TensorRT reads and writes directly. Inputs and outputs are
+        lists of (binding index, tensor).'''
+        inputs = []
+        outputs = []
+        bindings = []
+
+        for binding, size in zip(engine, self.binding_sizes(engine)):
+            dtype = np.dtype(trt.nptype(engine.get_binding_dtype(binding)))
+            tensor = torch.empty(size,
+                                 dtype=self.str_to_torch_dtype_dict[dtype.name],
+                                 device="cuda")
+            bindings.append(tensor.data_ptr())
+
+            index = engine.get_binding_index(binding)
+            if engine.binding_is_input(binding):
+                inputs.append((index, tensor))
+            else:
+                outputs.append((index, tensor))
+
+        return inputs, outputs, bindings
+
+    def capture_graph(self):
+        '''Capture one execution of the engine into a CUDA graph. Returns
+        None if the engine has dynamic shapes or can not be captured.'''
+        if self.config.has_dynamic_axis:
+            logger.warning("CUDA graph needs static shapes, not capturing")
+            return None
+
+        graph = torch.cuda.CUDAGraph()
+        stream = torch.cuda.Stream()
+        try:
+            with torch.cuda.stream(stream):
+                # TensorRT sets up its resources on the first execution
+                self.context.execute_async_v2(bindings=self.bindings,
+                                              stream_handle=stream.cuda_stream)
+                stream.synchronize()
+                with torch.cuda.graph(graph, stream=stream):
+                    self.context.execute_async_v2(
+                        bindings=self.bindings,
+                        stream_handle=stream.cuda_stream)
+            torch.cuda.synchronize()
+        except RuntimeError as e:
+            logger.warning("Failed to capture CUDA graph: " + str(e))
+            return None
+        return graph
+
+    def bindable(self, model_input, tensor):
+        '''Whether TensorRT can read model_input in place of the bound
+        tensor: a contiguous CUDA tensor of its dtype, filling it unless the
+        shapes are dynamic, and no captured graph holding the bound
+        address.'''
+        return (self.graph is None and model_input.is_cuda
+                and model_input.dtype == tensor.dtype
+                and model_input.is_contiguous()
+                and (self.config.has_dynamic_axis
+                     or model_input.nelement() == tensor.nelement()))
+
+    def zero_copy_call(self, model_inputs):
+        '''Bind the inputs and execute on the current torch stream. CUDA
+        inputs are bound as they are, the others(CPU, another dtype, or any
+        input of a captured graph) are copied into the bound tensors.
+        Outputs are views of the bound tensors, valid until the next call.'''
+        stream = torch.cuda.current_stream()
+        for i, model_input in enumerate(model_inputs):
+            index, tensor = self.input_tensors[i]
+            if self.config.has_dynamic_axis:
+                self.context.set_binding_shape(index, tuple(model_input.shape))
+            if self.bindable(model_input, tensor):
+                self.bindings[index] = model_input.data_ptr()
+                continue
+            self.bindings[index] = tensor.data_ptr()
+            tensor[0:model_input.nelement()].copy_(model_input.reshape(-1),
+                                                   non_blocking=True)
+
+        if self.graph is not None:
+            self.graph.replay()
+        else:
+            self.context.execute_async_v2(bindings=self.bindings,
+                                          stream_handle=stream.cuda_stream)
+
+        result = []
+        for index, tensor in self.output_tensors:
+            size = tensor.nelement()
+            if self.config.has_dynamic_axis:
+                size = trt.volume(self.context.get_binding_shape(index))
+            result.append(tensor[0:size])
+        return result, 0
+
     def __call__(self, model_inputs: list):
+        if self.zero_copy:
+            return self.zero_copy_call(model_inputs)
 
         for i, model_input in enumerate(model_inputs):
             model_input = model_input.cuda()
+            if self.config.has_dynamic_axis:
+                self.context.set_binding_shape(self.inputs[i].index,
+                                               tuple(model_input.shape))
 
             cuda.memcpy_dtod_async(
                 self.inputs[i].device,
@@ -128,7 +264,11 @@ class InferModel:
                                       stream_handle=self.stream.handle)
         result = []
         for out in self.outputs:
-            out_tensor = torch.empty(out.host.shape, device="cuda").to(
+            shape = out.host.shape
+            if self.config.has_dynamic_axis:
+                shape = (trt.volume(self.context.get_binding_shape(
+                    out.index)), )
+            out_tensor = torch.empty(shape, device="cuda").to(
                 self.str_to_torch_dtype_dict[str(out.host.dtype)])
             cuda.memcpy_dtod_async(
                 out_tensor.data_ptr(),
@@ -7,6 +7,7 @@ from loguru import logger
 import numpy as np
 import time
 import TopsInference
+from tools import engine_cache
 
 def type2dtype(types):
     dtypes = []
@@ -60,18 +61,25 @@ class InferModel:
                     set_input_dtype.append(tops_dtype)
             self.input_dtype = set_input_dtype
 
-        onnx_parser = TopsInference.create_parser(TopsInference.ONNX_MODEL)
-        onnx_parser.set_input_names(self.input_names)
-        onnx_parser.set_input_dtypes(self.input_dtype)
-        onnx_parser.set_input_shapes(input_shape)
+        def compile(engine_path):
+            onnx_parser = TopsInference.create_parser(TopsInference.ONNX_MODEL)
+            onnx_parser.set_input_names(self.input_names)
+            onnx_parser.set_input_dtypes(self.input_dtype)
+            onnx_parser.set_input_shapes(input_shape)
 
-        network = onnx_parser.read(onnx_path)
-        optimizer = TopsInference.create_optimizer()
-        if config.fp16 == True: 
-            optimizer.set_build_flag(TopsInference.KFP16_MIX)
-        engine = optimizer.build(network)
-        engine.save_executable(onnx_path+".bin")
-        engine = TopsInference.load(onnx_path+".bin")
+            network = onnx_parser.read(onnx_path)
+            optimizer = TopsInference.create_optimizer()
+            if config.fp16 == True: 
+                optimizer.set_build_flag(TopsInference.KFP16_MIX)
+            engine = optimizer.build(network)
+            engine.save_executable(engine_path)
+
+        engine_path = engine_cache.cached_build(
+            config, onnx_path,
+            getattr(TopsInference, "__version__", "unknown"), ".bin", compile,
+            {"zixiao_test_batch_size": config.zixiao_test_batch_size},
+            onnx_path + ".bin")
+        engine = TopsInference.load(engine_path)
         self.streams = []
         for i in range(12):
             self.streams.append(TopsInference.create_stream())
@@ -8,6 +8,7 @@
 import os
 import sys
 import ast
+import json
 import time
 import yaml
 import importlib
@@ -18,7 +19,7 @@ from collections import namedtuple
 
 CURR_PATH = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(os.path.abspath(os.path.join(CURR_PATH, "../")))
-from utils import cluster_manager, image_manager
+from utils import cluster_manager, image_manager, result_store
 
 VERSION = "v0.1"
 CLUSTER_MGR = cluster_manager.ClusterManager()
@@ -341,14 +342,11 @@ def start_tasks_in_cluster(dp_path, container_name, case_config, curr_log_path,
                 + f" --log_dir " + curr_log_path  + " 2>&1 | tee "+curr_log_path+"/stdout_err.out.log"
     start_cmd = "cd " + dp_path + " && " + sys.executable \
                 + " ../utils/container_manager.py -o runcmdin -c " \
-                + container_name + " -r \"" + run_container_cmd + "\""
+                + container_name + " -d -r \"" + run_container_cmd + "\""
     
     logger.debug("Run cmd in the run_container_cmd to start tasks, cmd: \n" + run_container_cmd)
     logger.debug("Run cmd in the cluster to start tasks, cmd: \n" + start_cmd)
     CLUSTER_MGR.run_command_some_hosts_distribution_info(start_cmd, nnodes, 15, "inference")
-    # Wait a moment for starting tasks.
-    time.sleep(10)
-
     logger.info("3) Waiting for tasks end in the cluster...")
     logger.info("Check task log in real time from container: " +
                 curr_log_path + "/container.out.log")
@@ -356,24 +354,41 @@ def start_tasks_in_cluster(dp_path, container_name, case_config, curr_log_path,
                 curr_log_path + "/stdout_err.out.log")
 
 
+def remove_pid_file_in_cluster(dp_path, pid_file_path, nnodes):
+    '''Remove pid file and exit file of the last task, so that they won't
+       be waited for again.
+    '''
+    rm_cmd = "cd " + dp_path + " && rm -f " + pid_file_path + " " \
+             + pid_file_path + ".exit"
+    logger.debug("Run cmd in the cluster to remove old pid file: " + rm_cmd)
+    CLUSTER_MGR.run_command_some_hosts(rm_cmd, nnodes, 10)
+
+
 def wait_for_finish(dp_path, container_name, pid_file_path, nnodes):
-    '''wait all the processes of start_xxx_task.py finished.
+    '''wait all the processes of run_inference.py finished.
+       Each host blocks until its task exits and reports the exit code.
+       Return hosts whose task exits with non-zero code.
     '''
-    # Aussme pid of start_xxx_task.py won't loop in a short time.
-    check_cmd = "cd " + dp_path + "; " + sys.executable \
-                + " ../utils/container_manager.py -o pidrunning -c " \
-                + container_name + " -f " + pid_file_path
-
-    logger.debug("Run cmd to check whether the training tasks is running: " +
-                 check_cmd)
-    while True:
-        bad_hosts = CLUSTER_MGR.run_command_some_hosts(check_cmd,
+    wait_cmd = "cd " + dp_path + "; " + sys.executable \
+               + " ../utils/container_manager.py -o waitpid -c " \
+               + container_name + " -f " + pid_file_path
+
+    logger.debug("Run cmd to wait for the tasks finished: " + wait_cmd)
+    # ssh exits with 255 if the connection is lost, wait again in that case.
+    for _ in range(3):
+        bad_hosts = CLUSTER_MGR.run_command_some_hosts(wait_cmd,
                                                        nnodes,
+                                                       timeout=None,
                                                        no_log=True)
-
-        if len(bad_hosts) == nnodes:
+        lost_hosts = [host for host in bad_hosts if bad_hosts[host] == 255]
+        if len(lost_hosts) == 0:
             break
-        time.sleep(10)
+        logger.warning("Lost connection to hosts while waiting for tasks: " +
+                       ",".join(lost_hosts) + ". Wait again.")
+    for host in bad_hosts:
+        logger.warning("Task on host " + host + " exit with: " +
+                       str(bad_hosts[host]))
+    return bad_hosts
 
 
 def prepare_containers_env_cluster(dp_path, case_log_dir, config,
@@ -430,22 +445,37 @@ def clean_containers_env_cluster(dp_path, container_name, nnodes):
     stop_monitors_in_cluster(dp_path, nnodes)
 
 
-def compilation_result(case_log_path, config):
-    '''Scp logs from hosts in the cluster to temp dir, and then merge all.
+def read_case_result(case_log_path):
+    '''Return Finish Info and Sweep Info of a case from the result.json
+    written by run_inference.py, or from container.out.log of older runs.
     '''
-    case_perf_path = os.path.join(case_log_path, "container.out.log")
-    vendor_usage_path = os.path.join(case_log_path,
-                                     config.VENDOR + "_monitor.log")
+    result_path = os.path.join(case_log_path, "result.json")
+    if os.path.exists(result_path):
+        with open(result_path, "r") as f:
+            result = json.load(f)
+        return result["finish_info"], result["sweep_info"]
 
     case_perf = None
-    case_file = open(case_perf_path)
-
+    sweep_perf = []
+    case_file = open(os.path.join(case_log_path, "container.out.log"))
     for line in case_file.readlines():
         if "Finish Info" in line:
             case_perf_str = "{" + line.split("{")[1]
             case_perf = ast.literal_eval(case_perf_str)
-            break
+        elif "Sweep Info" in line:
+            point_perf_str = "{" + line.split("{")[1]
+            sweep_perf.append(ast.literal_eval(point_perf_str))
+    return case_perf, sweep_perf
+
+
+def compilation_result(case_log_path, config, case, run_id):
+    '''Summarize the result of a case with the vendor monitor log, and
+    append it to the result store.
+    '''
+    vendor_usage_path = os.path.join(case_log_path,
+                                     config.VENDOR + "_monitor.log")
 
+    case_perf, sweep_perf = read_case_result(case_log_path)
     if case_perf is None:
         logger.error("Case Run Failed, Please Check Log!")
         return
@@ -467,6 +497,28 @@ def compilation_result(case_log_path, config):
             case_perf[key]).ljust(23)
         logger.info(padding_str)
 
+    if len(sweep_perf) > 0:
+        logger.info("Batch size sweep:")
+    for point_perf in sweep_perf:
+        mfu = point_perf["flops"] / theory
+        point_perf["*MFU"] = str(round(mfu * 100, 1)) + "%"
+        logger.info(", ".join(
+            str(key) + ": " + str(value) for key, value in point_perf.items()))
+
+    metrics = dict(case_perf)
+    metrics["sweep"] = sweep_perf
+    record = result_store.make_record("inference",
+                                      case.split(":")[0],
+                                      config.VENDOR,
+                                      metrics,
+                                      chip=config.CHIP,
+                                      host=config.HOSTS[0],
+                                      run_id=run_id,
+                                      config={"case": case})
+    result_store.append_records(
+        os.path.join(config.FLAGPERF_PATH, result_store.store_path(config)),
+        record, logger)
+
 
 def get_config_from_case(case, config):
     '''check case is string'''
@@ -613,10 +665,16 @@ def main(config):
                          "...[FAILED]. Ignore case " + case)
             continue
         logger.info("2) Start tasks in the cluster...")
+        pid_file_path = os.path.join(curr_log_path,
+                                     "start_inference_task.pid")
+        remove_pid_file_in_cluster(dp_path, pid_file_path, nnodes)
 
         start_tasks_in_cluster(dp_path, container_name, case_config,
                                curr_log_path, config)
 
+        # Wait until run_inference.py finished.
+        wait_for_finish(dp_path, container_name, pid_file_path, nnodes)
+
         logger.info("3) Training tasks end in the cluster...")
         logger.info("4) Clean container environments in cluster...")
         clean_containers_env_cluster(dp_path, container_name, nnodes)
@@ -624,7 +682,8 @@ def main(config):
         logger.info("=== 2.2 Setup container and run testcases finished."
                     " ===")
         logger.info("=== 2.3 Compilation Case Performance ===")
-        compilation_result(curr_log_path, config)
+        compilation_result(curr_log_path, config, case,
+                           os.path.basename(curr_log_whole))
 
 
 if __name__ == '__main__':
@@ -637,3 +696,4 @@ if __name__ == '__main__':
     config = DefaultMunch.fromDict(data)
 
     main(config)
+    CLUSTER_MGR.close()
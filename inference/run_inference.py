@@ -9,9 +9,115 @@ from loguru import logger
 import time
 import os
 import sys
-from tools import init_logger, merge_config
+import json
+from tools import init_logger, merge_config, replace_config
+from tools import export_cache, latency_summary
 from argparse import ArgumentParser
 
+# compilers building one engine for all batch sizes of a sweep
+DYNAMIC_BATCH_COMPILERS = ("tensorrt", )
+
+
+def get_sweep_batch_sizes(config):
+    return list(config.sweep_batch_sizes or [])
+
+
+def use_dynamic_batch(config, benchmark_module):
+    '''Whether one engine is compiled for all batch sizes of the sweep: the
+    compiler builds dynamic shape engines, the case sets sweep_shapes and
+    its export_model honours dynamic_batch(DYNAMIC_BATCH_EXPORT).'''
+    return (config.compiler in DYNAMIC_BATCH_COMPILERS
+            and config.sweep_shapes is not None
+            and getattr(benchmark_module, "DYNAMIC_BATCH_EXPORT", False))
+
+
+def dynamic_batch_config(config):
+    '''Config exporting and compiling one engine for config.batch_size and
+    all sweep_batch_sizes, with sweep_shapes as the dynamic shape profile.
+    '''
+    batch_sizes = get_sweep_batch_sizes(config) + [config.batch_size]
+    shapes = config.sweep_shapes
+    return replace_config(
+        config,
+        dynamic_batch=True,
+        has_dynamic_axis=True,
+        minShapes=shapes.replace("{}", str(min(batch_sizes))),
+        optShapes=shapes.replace("{}", str(config.batch_size)),
+        maxShapes=shapes.replace("{}", str(max(batch_sizes))))
+
+
+def write_result(config, infer_info, sweep_info):
+    '''Write the result of the case as json to result.json in log_dir,
+    which run.py appends to the result store.'''
+    result = {
+        "case": config.case,
+        "framework": config.framework,
+        "finish_info": infer_info,
+        "sweep_info": sweep_info
+    }
+    with open(os.path.join(config.log_dir, "result.json"), "w") as f:
+        json.dump(result, f, default=str)
+
+
+def write_pid_file(pid_file_path, pid_file):
+    '''Write pid file for watching the process later.
+       In each round of case, we will write the current pid in the same path.
+    '''
+    pid_file_path = os.path.join(pid_file_path, pid_file)
+    if os.path.exists(pid_file_path):
+        os.remove(pid_file_path)
+    if os.path.exists(pid_file_path + ".exit"):
+        os.remove(pid_file_path + ".exit")
+    file_d = open(pid_file_path, "w")
+    file_d.write("%s\n" % os.getpid())
+    file_d.close()
+
+
+def write_exit_file(pid_file_path, pid_file, exit_code):
+    '''Write exit code of the task next to its pid file, so that the waiter
+       in the cluster can report it.
+    '''
+    file_d = open(os.path.join(pid_file_path, pid_file + ".exit"), "w")
+    file_d.write("%s\n" % exit_code)
+    file_d.close()
+
+
+def sweep_forward(benchmark_module, vendor_module, model, compile_model,
+                  compile_config, evaluator, config):
+    '''Measure each of sweep_batch_sizes. compile_model is reused if
+    compile_config has a dynamic batch profile, otherwise every batch size
+    is exported and compiled(both are cached).
+    '''
+    dynamic = compile_config.dynamic_batch
+
+    sweep_info = []
+    for batch_size in get_sweep_batch_sizes(config):
+        point_config = replace_config(config, batch_size=batch_size)
+        logger.info("Sweep batch size " + str(batch_size))
+
+        point_model = compile_model
+        if not dynamic:
+            onnx_path = benchmark_module.export_model(model, point_config)
+            point_model = vendor_module.InferModel(point_config, onnx_path,
+                                                   model)
+
+        dataloader = benchmark_module.build_dataloader(point_config)
+        p_infer, p_infer_core, infer_acc = benchmark_module.engine_forward(
+            point_model, dataloader, evaluator, point_config)
+
+        point_info = {
+            "batchsize": batch_size,
+            "flops": eval(config.flops) * p_infer_core,
+            "p_inference_whole(qps)": p_infer,
+            "*p_inference_core(qps)": p_infer_core,
+            "latency_core(ms)": round(1000.0 * batch_size / p_infer_core, 3),
+            "infer_average_acc": infer_acc
+        }
+        point_info.update(latency_summary(["Inference"]))
+        logger.log("Sweep Info", point_info)
+        sweep_info.append(point_info)
+    return sweep_info
+
  
 def main(config):
     
@@ -44,7 +150,8 @@ def main(config):
 
     logger.log("Model Forward End", "")
     if config.compiler is None:
-        return config, p_forward, None, p_forward_core, None, val_acc, None
+        return (config, p_forward, None, p_forward_core, None, val_acc, None,
+                latency_summary(), [])
     """
     Convert model into onnx
     """
@@ -52,10 +159,23 @@ def main(config):
                "Export " + config.framework + " model into .onnx")
     start = time.time()
 
-    onnx_path = benchmark_module.export_model(model, config)
+    compile_config = config
+    if get_sweep_batch_sizes(config):
+        if use_dynamic_batch(config, benchmark_module):
+            compile_config = dynamic_batch_config(config)
+        else:
+            logger.warning("No dynamic batch engine for " + config.case +
+                           " with " + config.compiler +
+                           ", compiling each batch size of the sweep")
+
+    onnx_path = benchmark_module.export_model(model, compile_config)
 
     duration = time.time() - start
-    logger.log("Export End", str(duration) + " seconds")
+    if export_cache.is_cache_hit(onnx_path):
+        logger.log("Export End",
+                   str(duration) + " seconds, cache hit: " + onnx_path)
+    else:
+        logger.log("Export End", str(duration) + " seconds")
     # e.g. import funcs from inference_engine/nvidia/inference.py
     vendor_module = importlib.import_module("inference_engine." +
                                             config.vendor + "." +
@@ -67,7 +187,8 @@ def main(config):
                "Compiling With " + config.vendor + "." + config.compiler)
     start = time.time()
 
-    compile_model = vendor_module.InferModel(config, onnx_path, model)
+    compile_model = vendor_module.InferModel(compile_config, onnx_path,
+                                             model)
 
     duration = time.time() - start
     logger.log("Vendor Compile End", str(duration) + " seconds")
@@ -81,8 +202,16 @@ def main(config):
         compile_model, dataloader, evaluator, config)
 
     logger.log("Vendor Inference End", "")
+    # before the sweep replaces the "Inference" recorder
+    latency_info = latency_summary()
 
-    return config, p_forward, p_infer, p_forward_core, p_infer_core, val_acc, infer_acc
+    sweep_info = []
+    if get_sweep_batch_sizes(config):
+        sweep_info = sweep_forward(benchmark_module, vendor_module, model,
+                                   compile_model, compile_config, evaluator,
+                                   config)
+
+    return config, p_forward, p_infer, p_forward_core, p_infer_core, val_acc, infer_acc, latency_info, sweep_info
 
 
 def parse_args():
@@ -132,28 +261,40 @@ if __name__ == "__main__":
     config_from_args = parse_args()
     config_from_args.framework = config_from_args.framework.split('_')[0]
 
-    e2e_start = time.time()
-
-    config, p_forward, p_infer, p_forward_core, p_infer_core, val_acc, infer_acc = main(
-        config_from_args)
-
-    e2e_time = time.time() - e2e_start
-    e2e_time = round(float(e2e_time), 3)
-
-    flops = eval(config.flops) * (p_infer_core if p_infer_core is not None else p_forward_core)
-
-    infer_info = {
-        "vendor": config.vendor,
-        "compiler": config.compiler,
-        "precision": "fp16" if config.fp16 else "fp32",
-        "batchsize": config.batch_size,
-        "flops": flops,
-        "e2e_time(second)": e2e_time,
-        "p_validation_whole(qps)": p_forward,
-        "p_validation_core(qps)": p_forward_core,
-        "p_inference_whole(qps)": p_infer,
-        "*p_inference_core(qps)": p_infer_core,
-        "val_average_acc": val_acc,
-        "infer_average_acc": infer_acc
-    }
-    logger.log("Finish Info", infer_info)
+    os.makedirs(config_from_args.log_dir, exist_ok=True)
+    write_pid_file(config_from_args.log_dir, "start_inference_task.pid")
+    exit_code = 1
+    try:
+        e2e_start = time.time()
+
+        config, p_forward, p_infer, p_forward_core, p_infer_core, val_acc, infer_acc, latency_info, sweep_info = main(
+            config_from_args)
+
+        e2e_time = time.time() - e2e_start
+        e2e_time = round(float(e2e_time), 3)
+
+        flops = eval(config.flops) * (p_infer_core if p_infer_core is not None else p_forward_core)
+
+        infer_info = {
+            "vendor": config.vendor,
+            "compiler": config.compiler,
+            "precision": "fp16" if config.fp16 else "fp32",
+            "batchsize": config.batch_size,
+            "flops": flops,
+            "e2e_time(second)": e2e_time,
+            "p_validation_whole(qps)": p_forward,
+            "p_validation_core(qps)": p_forward_core,
+            "p_inference_whole(qps)": p_infer,
+            "*p_inference_core(qps)": p_infer_core,
+            "val_average_acc": val_acc,
+            "infer_average_acc": infer_acc
+        }
+        if config.mmlu_prefix_kv_cache:
+            infer_info["validation_mode"] = "shared prefix KV cache"
+        infer_info.update(latency_info)
+        logger.log("Finish Info", infer_info)
+        write_result(config, infer_info, sweep_info)
+        exit_code = 0
+    finally:
+        write_exit_file(config_from_args.log_dir, "start_inference_task.pid",
+                        exit_code)
@@ -1,3 +1,5 @@
 from .init_logger import init_logger
-from .config_manager import merge_config
+from .config_manager import merge_config, replace_config
 from .torch_sync import torch_sync
+from .latency_recorder import LatencyRecorder, latency_summary
+from .pipeline import CudaPrefetcher, AsyncEvaluator
@@ -1,8 +1,85 @@
 import yaml
 import os
+import copy
+import difflib
 from loguru import logger
 from collections import namedtuple
 
+# Fields read by run_inference, tools and inference engines: name ->
+# (accepted types, default), REQUIRED ones are set by every case. Every
+# merged config has them, so callers read config.x instead of probing
+# config._fields. Case specific fields are kept as they are, but a field
+# close to one of these names is rejected as a typo.
+REQUIRED = object()
+OPTIONAL_STR = (str, type(None))
+CONFIG_SCHEMA = {
+    "compiler": (OPTIONAL_STR, REQUIRED),
+    "fp16": (bool, REQUIRED),
+    "batch_size": (int, REQUIRED),
+    "flops": ((str, int, float), REQUIRED),
+    "repeat": (int, REQUIRED),
+    "num_workers": (int, REQUIRED),
+    "log_freq": (int, REQUIRED),
+    "no_validation": (bool, REQUIRED),
+    "exist_onnx_path": (OPTIONAL_STR, REQUIRED),
+    "exist_compiler_path": (OPTIONAL_STR, REQUIRED),
+    "engine_cache": (bool, True),
+    "has_dynamic_axis": (bool, False),
+    "dynamic_batch": (bool, False),
+    "minShapes": (OPTIONAL_STR, None),
+    "optShapes": (OPTIONAL_STR, None),
+    "maxShapes": (OPTIONAL_STR, None),
+    "sweep_batch_sizes": ((list, type(None)), None),
+    "sweep_shapes": (OPTIONAL_STR, None),
+    "prefetch": (bool, False),
+    "async_eval": (bool, False),
+    "trt_zero_copy": (bool, False),
+    "trt_cuda_graph": (bool, False),
+    "mmlu_prefix_kv_cache": (bool, False),
+    "build_config": (dict, {}),
+    "disabled_pass": (list, []),
+    "vm_enable": (bool, True),
+}
+
+# path -> ((size, mtime_ns), parsed yaml)
+YAML_CACHE = {}
+# (host args, stamps of the yaml files) -> merged config
+MERGED_CACHE = {}
+# field names -> namedtuple class
+CONFIG_CLASSES = {}
+
+
+def file_stamp(path):
+    '''(size, mtime_ns) of path, None if it does not exist.'''
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def load_yaml(path):
+    '''Parsed yaml at path as a new dict, {} if it is empty or missing. The
+    file is only parsed again when its size or mtime changes.'''
+    stamp = file_stamp(path)
+    if stamp is None:
+        return {}
+    cached = YAML_CACHE.get(path)
+    if cached is None or cached[0] != stamp:
+        with open(path) as f:
+            cached = (stamp, yaml.safe_load(f) or {})
+        YAML_CACHE[path] = cached
+    return dict(cached[1])
+
+
+def config_class(fields):
+    '''namedtuple class with fields, created once per field names.'''
+    fields = tuple(fields)
+    Config = CONFIG_CLASSES.get(fields)
+    if Config is None:
+        Config = namedtuple("Config", fields)
+        CONFIG_CLASSES[fields] = Config
+    return Config
+
 
 def check_dup_cfg_parm(cfg, parm):
 
@@ -25,29 +102,68 @@ def merge_vendor(cfg, vendor_cfg, vendor):
             cfg[item] = vendor_cfg[item]
 
 
+def check_type(item, value):
+    types = CONFIG_SCHEMA[item][0]
+    types = types if isinstance(types, tuple) else (types, )
+    # bool is an int, but true is no batch size
+    if isinstance(value, bool) and bool not in types:
+        return False
+    return isinstance(value, types)
+
+
+def validate_config(merged_data):
+    '''Fill the defaults of CONFIG_SCHEMA and check the types of its fields.
+    Exit on a missing or mistyped field, or on an unknown field that looks
+    like a typo of a schema field, before anything is compiled.'''
+    for item, value in merged_data.items():
+        if item in CONFIG_SCHEMA:
+            if not check_type(item, value):
+                logger.error("Config " + item + " should be " +
+                             str(CONFIG_SCHEMA[item][0]) + ", got " +
+                             repr(value))
+                exit(1)
+            continue
+        close = difflib.get_close_matches(item, CONFIG_SCHEMA.keys(), 1,
+                                          0.85)
+        if len(close) > 0:
+            logger.error("Unknown config " + item + ", did you mean " +
+                         close[0] + "?")
+            exit(1)
+
+    for item, (_, default) in CONFIG_SCHEMA.items():
+        if item in merged_data:
+            continue
+        if default is REQUIRED:
+            logger.error("Config " + item + " is not set")
+            exit(1)
+        merged_data[item] = copy.copy(default)
+    return merged_data
+
+
 def merge_config(config):
 
     configuration_path = config.perf_dir + "/configs/" + config.case + "/configurations.yaml"
     parameter_path = config.perf_dir + "/configs/" + config.case + "/parameters.yaml"
     vendor_cfg_path = config.perf_dir + "/configs/" + config.case + "/vendor_config/" + config.vendor + "_configurations.yaml"
 
-    configuration = yaml.safe_load(open(configuration_path))
-    if configuration is None:
-        configuration = {}
-    parameter = yaml.safe_load(open(parameter_path))
-    if parameter is None:
-        parameter = {}
-    vendor_cfg = {}
-    if os.path.exists(vendor_cfg_path):
-        vendor_cfg = yaml.safe_load(open(vendor_cfg_path))
-
-    merged_data = {}
-    merged_data["perf_dir"] = config.perf_dir
-    merged_data["data_dir"] = config.data_dir
-    merged_data["log_dir"] = config.log_dir
-    merged_data["vendor"] = config.vendor
-    merged_data["case"] = config.case
-    merged_data["framework"] = config.framework
+    host_data = {
+        "perf_dir": config.perf_dir,
+        "data_dir": config.data_dir,
+        "log_dir": config.log_dir,
+        "vendor": config.vendor,
+        "case": config.case,
+        "framework": config.framework
+    }
+    key = (tuple(host_data.items()), file_stamp(configuration_path),
+           file_stamp(parameter_path), file_stamp(vendor_cfg_path))
+    if key in MERGED_CACHE:
+        return MERGED_CACHE[key]
+
+    configuration = load_yaml(configuration_path)
+    parameter = load_yaml(parameter_path)
+    vendor_cfg = load_yaml(vendor_cfg_path)
+
+    merged_data = dict(host_data)
 
     if not check_dup_cfg_parm(configuration, parameter):
         logger.error(
@@ -68,6 +184,18 @@ def merge_config(config):
             exit(1)
         merged_data[item] = parameter[item]
 
-    Config = namedtuple("Config", merged_data.keys())
+    merged_data = validate_config(merged_data)
+    Config = config_class(merged_data.keys())
     unmutable_config = Config(**merged_data)
+    MERGED_CACHE[key] = unmutable_config
     return unmutable_config
+
+
+def replace_config(config, **items):
+    '''Return a copy of config with items set, new items are added.'''
+    if all(item in config._fields for item in items):
+        return config._replace(**items)
+    merged_data = config._asdict()
+    merged_data.update(items)
+    Config = config_class(merged_data.keys())
+    return Config(**merged_data)
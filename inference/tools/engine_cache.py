@@ -0,0 +1,110 @@
+import os
+import json
+import shutil
+import hashlib
+from loguru import logger
+
+
+def file_hash(path):
+    '''sha256 of a file. It is remembered in <path>.sha256 with the size and
+    mtime of the file, so big onnx files are only hashed once.'''
+    stat = os.stat(path)
+    stamp = str(stat.st_size) + "-" + str(stat.st_mtime_ns)
+    memo_path = path + ".sha256"
+    if os.path.exists(memo_path):
+        with open(memo_path, "r") as f:
+            memo = f.read().split()
+        if len(memo) == 2 and memo[0] == stamp:
+            return memo[1]
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 24), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    try:
+        with open(memo_path, "w") as f:
+            f.write(stamp + " " + digest)
+    except OSError:
+        pass
+    return digest
+
+
+def engine_key(config, onnx_path, compiler_version, extra=None):
+    '''Key of a compiled engine: onnx content, precision, dynamic shape
+    profile, batch size, vendor, compiler and its version, and any other
+    build options of the backend in extra.'''
+    profile = None
+    if config.has_dynamic_axis:
+        profile = [config.minShapes, config.optShapes, config.maxShapes]
+    key = {
+        "onnx": file_hash(onnx_path),
+        "fp16": config.fp16,
+        "profile": profile,
+        "batch_size": config.batch_size,
+        "vendor": config.vendor,
+        "compiler": config.compiler,
+        "compiler_version": str(compiler_version),
+        "extra": extra,
+    }
+    text = json.dumps(key, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()[0:24]
+
+
+def cache_path(config, key, suffix):
+    '''Path of the engine with key in the cache.'''
+    cache_dir = os.path.join(config.perf_dir, "engine_cache", config.vendor)
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(
+        cache_dir, config.case + "_" + config.compiler + "_" + key + suffix)
+
+
+def cached_build(config,
+                 onnx_path,
+                 compiler_version,
+                 suffix,
+                 build,
+                 extra=None,
+                 uncached_path=None):
+    '''Return path of the engine(a file or a dir) built from onnx_path,
+    calling build(path) to write it only when it is not cached. build may
+    return a non-zero exit code on failure. The engine is built under a
+    temporary name and renamed, so that a broken build is never cached. If
+    the cache is disabled, build to uncached_path every time.'''
+    if not config.engine_cache:
+        if uncached_path is None:
+            uncached_path = os.path.join(
+                config.log_dir, "engine_tmp",
+                config.case + "_" + config.compiler + suffix)
+        os.makedirs(os.path.dirname(uncached_path), exist_ok=True)
+        build(uncached_path)
+        return uncached_path
+
+    key = engine_key(config, onnx_path, compiler_version, extra)
+    path = cache_path(config, key, suffix)
+
+    if os.path.exists(path):
+        logger.info("Engine cache hit: " + path)
+        return path
+
+    logger.info("Engine cache miss, building " + path)
+    # keep the suffix, some compilers choose the format by it
+    tmp_path = path[0:len(path) - len(suffix)] + ".tmp" + str(
+        os.getpid()) + suffix
+    ret = build(tmp_path)
+    if ret not in (None, 0) or not os.path.exists(tmp_path):
+        logger.error("Engine build failed, not caching " + tmp_path)
+        return tmp_path
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # a dir engine can't replace the non-empty one another case built
+        # meanwhile, use that one
+        if not os.path.exists(path):
+            raise
+        logger.info("Engine cached meanwhile: " + path)
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        else:
+            os.remove(tmp_path)
+    return path
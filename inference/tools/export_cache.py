@@ -0,0 +1,69 @@
+import os
+import json
+import hashlib
+import torch
+from loguru import logger
+
+# onnx paths served from the cache in this process
+CACHE_HITS = set()
+
+
+def weights_hash(model):
+    '''sha256 of the names, dtypes, shapes and values of model's state_dict.'''
+    sha = hashlib.sha256()
+    for name, tensor in model.state_dict().items():
+        sha.update(
+            (name + str(tensor.dtype) + str(tuple(tensor.shape))).encode())
+        sha.update(tensor.detach().cpu().contiguous().view(-1).view(
+            torch.uint8).numpy().tobytes())
+    return sha.hexdigest()
+
+
+def default_opset():
+    '''Opset torch.onnx.export uses if it is not given.'''
+    constants = getattr(torch.onnx, "_constants", None)
+    return getattr(constants, "ONNX_DEFAULT_OPSET", None)
+
+
+def onnx_cache_path(model, config, extra=None):
+    '''Path of the onnx exported from model with config. The name keeps the
+    old onnxs/<case>_bs<N>_<framework>_fp16<fp16> prefix, followed by a key
+    of the weights, batch size, precision, opset and torch version.'''
+    key = {
+        "weights": weights_hash(model),
+        "batch_size": config.batch_size,
+        "fp16": config.fp16,
+        "opset": default_opset(),
+        "torch": torch.__version__,
+        "extra": extra,
+    }
+    key = hashlib.sha256(json.dumps(key, sort_keys=True,
+                                    default=str).encode()).hexdigest()[0:16]
+    filename = config.case + "_bs" + str(config.batch_size)
+    filename = filename + "_" + str(config.framework)
+    filename = filename + "_fp16" + str(config.fp16)
+    filename = "onnxs/" + filename + "_" + key + ".onnx"
+    return config.perf_dir + "/" + filename
+
+
+def cached_export(model, config, export, extra=None):
+    '''Return path of model exported to onnx, calling export(path) only when
+    it is not cached. The onnx is written under a temporary name and renamed,
+    so that concurrent cases never read a partly written file.'''
+    onnx_path = onnx_cache_path(model, config, extra)
+    if os.path.exists(onnx_path):
+        logger.info("ONNX cache hit: " + onnx_path)
+        CACHE_HITS.add(onnx_path)
+        return onnx_path
+
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    tmp_path = onnx_path[0:-len(".onnx")] + ".tmp" + str(
+        os.getpid()) + ".onnx"
+    export(tmp_path)
+    os.replace(tmp_path, onnx_path)
+    return onnx_path
+
+
+def is_cache_hit(onnx_path):
+    '''Whether onnx_path was served from the cache.'''
+    return onnx_path in CACHE_HITS
@@ -20,6 +20,7 @@ def init_logger(config):
     logger.level("Vendor Inference Begin", no=21)
     logger.level("Vendor Inference End", no=21)
     logger.level("Finish Info", no=50)
+    logger.level("Sweep Info", no=50)
 
     logdir = config.log_dir
     logfile = logdir + "/container.out.log"
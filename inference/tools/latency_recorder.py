@@ -0,0 +1,72 @@
+import time
+import numpy as np
+
+# the last recorder of each name, like "Validation" or "Inference"
+RECORDERS = {}
+
+PERCENTILES = (50, 90, 99)
+
+
+class LatencyRecorder:
+    '''Per batch latency of a forward loop, sampled with perf_counter_ns into
+    a preallocated array. The first sample is reported apart as the cold
+    latency, percentiles and jitter(std) are of the warm samples.'''
+
+    def __init__(self, name, capacity=4096):
+        self.name = name
+        self.samples = np.zeros(max(int(capacity), 1), dtype=np.int64)
+        self.count = 0
+        self.start_ns = None
+        self.excluded_ns = 0
+        RECORDERS[name] = self
+
+    def start(self):
+        self.excluded_ns = 0
+        self.start_ns = time.perf_counter_ns()
+
+    def stop(self):
+        '''End the running sample, return its duration in seconds. Time given
+        to exclude is left out of the sample, but not of the duration.'''
+        duration_ns = time.perf_counter_ns() - self.start_ns
+        self.start_ns = None
+        if self.count == len(self.samples):
+            self.samples = np.concatenate(
+                [self.samples, np.zeros_like(self.samples)])
+        self.samples[self.count] = duration_ns - self.excluded_ns
+        self.count += 1
+        return duration_ns / 1e9
+
+    def exclude(self, seconds):
+        '''Leave seconds(like the foo time returned by engines) out of the
+        running sample, or of the last one if none is running.'''
+        excluded_ns = int(seconds * 1e9)
+        if self.start_ns is not None:
+            self.excluded_ns += excluded_ns
+        elif self.count > 0:
+            self.samples[self.count - 1] -= excluded_ns
+
+    def summary(self):
+        '''Latency statistics in milliseconds, keyed like
+        "inference_latency_p99(ms)".'''
+        if self.count == 0:
+            return {}
+        samples = self.samples[0:self.count] / 1e6
+        warm = samples[1:] if self.count > 1 else samples
+        prefix = self.name.lower() + "_latency_"
+
+        result = {prefix + "cold(ms)": round(float(samples[0]), 3)}
+        result[prefix + "warm_mean(ms)"] = round(float(warm.mean()), 3)
+        for p, value in zip(PERCENTILES, np.percentile(warm, PERCENTILES)):
+            result[prefix + "p" + str(p) + "(ms)"] = round(float(value), 3)
+        result[prefix + "max(ms)"] = round(float(warm.max()), 3)
+        result[prefix + "jitter(ms)"] = round(float(warm.std()), 3)
+        return result
+
+
+def latency_summary(names=None):
+    '''Merged summary of the last recorders of names, all by default.'''
+    result = {}
+    for name, recorder in RECORDERS.items():
+        if names is None or name in names:
+            result.update(recorder.summary())
+    return result
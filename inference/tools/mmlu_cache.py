@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import hashlib
+import torch
+import pandas as pd
+from loguru import logger
+from torch.utils.data import DataLoader, Dataset, Sampler
+from .torch_sync import torch_sync
+
+CACHE_VERSION = 2
+MAX_LENGTH = 2048
+# prompts per call of the fast tokenizer, which encodes a batch on all cores
+TOKENIZE_BATCH = 1024
+
+
+def tokenizer_hash(tokenizer):
+    '''sha256 of the tokenizer class, vocabulary and special tokens.'''
+    sha = hashlib.sha256()
+    sha.update(type(tokenizer).__name__.encode())
+    sha.update(json.dumps(tokenizer.get_vocab(), sort_keys=True).encode())
+    sha.update(
+        json.dumps(tokenizer.special_tokens_map, sort_keys=True,
+                   default=str).encode())
+    return sha.hexdigest()
+
+
+def cache_path(config, tokenizer):
+    '''Path of the token cache of config.case, keyed by the tokenizer and the
+    few-shot config.'''
+    key = {
+        "version": CACHE_VERSION,
+        "tokenizer": tokenizer_hash(tokenizer),
+        "mmlu_dir": config.mmlu_dir,
+        "few_shots": config.few_shots,
+        "max_length": MAX_LENGTH,
+    }
+    key = hashlib.sha256(json.dumps(key,
+                                    sort_keys=True).encode()).hexdigest()[0:16]
+    return os.path.join(config.perf_dir, "mmlu_cache",
+                        config.case + "_" + key + ".pt")
+
+
+def build_prompts(config, tasks, gen_prompt, format_example):
+    '''Few-shot prompts, labels and task indices of all test questions. The
+    few-shot prefix is built once per task.'''
+    prompts = []
+    labels = []
+    task_ids = []
+    for task_id, task in enumerate(tasks):
+        logger.debug("Loading " + str(config.few_shots) + "-shot " + task)
+        dev_df = pd.read_csv(os.path.join(config.data_dir, config.mmlu_dir,
+                                          "dev", task + "_dev.csv"),
+                             header=None)[:config.few_shots]
+        test_df = pd.read_csv(os.path.join(config.data_dir, config.mmlu_dir,
+                                           "test", task + "_test.csv"),
+                              header=None)
+
+        train_prompt = gen_prompt(dev_df, task, config.few_shots)
+        for i in range(test_df.shape[0]):
+            prompts.append(train_prompt +
+                           format_example(test_df, i, include_answer=False))
+            labels.append(test_df.iloc[i, test_df.shape[1] - 1])
+            task_ids.append(task_id)
+    return prompts, labels, task_ids
+
+
+def batch_lengths(tokenizer, prompts):
+    '''Token counts of prompts without special tokens, tokenized in batches.'''
+    lengths = []
+    for start in range(0, len(prompts), TOKENIZE_BATCH):
+        encoded = tokenizer(prompts[start:start + TOKENIZE_BATCH],
+                            add_special_tokens=False)
+        lengths.extend(len(ids) for ids in encoded.input_ids)
+    return lengths
+
+
+def truncate(tokenizer, prompt):
+    '''Drop few-shot examples from the front until prompt fits MAX_LENGTH.'''
+    while len(tokenizer.tokenize(prompt)) + 1 > MAX_LENGTH:
+        prompt_split = prompt.split("\n\n")
+        prompt_split.pop(1)
+        prompt = "\n\n".join(prompt_split)
+    return prompt
+
+
+def tokenize(tokenizer, prompts, labels):
+    '''Return token ids of all prompts concatenated(int32), offsets of each
+    prompt in them, token ids of each label and whether each prompt was
+    truncated. Only the few prompts that are too long are truncated one by
+    one.'''
+    lengths = batch_lengths(tokenizer, prompts)
+    truncated = [length + 1 > MAX_LENGTH for length in lengths]
+    prompts = [
+        truncate(tokenizer, prompt) if length + 1 > MAX_LENGTH else prompt
+        for prompt, length in zip(prompts, lengths)
+    ]
+
+    ids = []
+    offsets = [0]
+    for start in range(0, len(prompts), TOKENIZE_BATCH):
+        encoded = tokenizer(prompts[start:start + TOKENIZE_BATCH])
+        for prompt_ids in encoded.input_ids:
+            ids.extend(prompt_ids)
+            offsets.append(len(ids))
+
+    label_ids = {
+        label: tokenizer([label]).input_ids[0]
+        for label in set(labels)
+    }
+    answers = [label_ids[label] for label in labels]
+    return torch.tensor(ids, dtype=torch.int32), torch.tensor(
+        offsets), answers, truncated
+
+
+class TokenizedMMLU(Dataset):
+    '''MMLU test questions with few-shot prompts, tokenized once and then
+    loaded from the token cache.'''
+
+    def __init__(self, config, tokenizer, tasks, gen_prompt, format_example):
+        self.tokenizer = tokenizer
+        path = cache_path(config, tokenizer)
+
+        if os.path.exists(path):
+            logger.info("MMLU token cache hit: " + path)
+            data = torch.load(path)
+        else:
+            logger.info("Building MMLU token cache " + path)
+            prompts, labels, task_ids = build_prompts(config, tasks,
+                                                      gen_prompt,
+                                                      format_example)
+            ids, offsets, answers, truncated = tokenize(
+                tokenizer, prompts, labels)
+            data = {
+                "ids": ids,
+                "offsets": offsets,
+                "answers": answers,
+                "task_ids": task_ids,
+                "truncated": truncated
+            }
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp" + str(os.getpid())
+            torch.save(data, tmp_path)
+            os.replace(tmp_path, path)
+
+        self.ids = data["ids"]
+        self.offsets = data["offsets"]
+        self.answers = data["answers"]
+        self.task_ids = data["task_ids"]
+        self.truncated = data["truncated"]
+        self.lengths = (self.offsets[1:] - self.offsets[:-1]).tolist()
+
+    def __len__(self):
+        return len(self.answers)
+
+    def __getitem__(self, idx):
+        return {
+            "input_ids":
+            self.ids[self.offsets[idx]:self.offsets[idx + 1]].long(),
+            "answer": torch.tensor(self.answers[idx])
+        }
+
+    def shared_prefixes(self):
+        '''Return (prefix ids, indices) per task, where prefix is the longest
+        token prefix shared by the questions of the task, leaving at least one
+        token to each. Questions with truncated few-shots are grouped apart
+        with an empty prefix.'''
+        groups = {}
+        full = []
+        for idx, task_id in enumerate(self.task_ids):
+            if self.truncated[idx]:
+                full.append(idx)
+            else:
+                groups.setdefault(task_id, []).append(idx)
+
+        prefixes = []
+        for indices in groups.values():
+            prefix = self[indices[0]]["input_ids"]
+            for idx in indices:
+                ids = self[idx]["input_ids"][0:-1]
+                size = min(len(prefix), len(ids))
+                diff = (prefix[0:size] != ids[0:size]).nonzero()
+                prefix = prefix[0:int(diff[0]) if len(diff) > 0 else size]
+            prefixes.append((prefix, indices))
+        if len(full) > 0:
+            prefixes.append((torch.zeros(0, dtype=torch.long), full))
+        return prefixes
+
+
+class LengthBucketSampler(Sampler):
+    '''Batches of questions with close token counts, so that little padding
+    is needed. With batch_size 1 the questions keep their order.'''
+
+    def __init__(self, lengths, batch_size):
+        order = list(range(len(lengths)))
+        if batch_size > 1:
+            order.sort(key=lambda idx: lengths[idx])
+        self.batches = [
+            order[start:start + batch_size]
+            for start in range(0, len(order), batch_size)
+        ]
+
+    def __iter__(self):
+        return iter(self.batches)
+
+    def __len__(self):
+        return len(self.batches)
+
+
+class PadCollator:
+    '''Left pad a batch, so that the last position of each row is its last
+    prompt token. token_count is the number of prompt tokens, without
+    padding.'''
+
+    def __init__(self, pad_id):
+        self.pad_id = pad_id
+
+    def __call__(self, items):
+        length = max(len(item["input_ids"]) for item in items)
+        input_ids = torch.full((len(items), length),
+                               self.pad_id,
+                               dtype=torch.long)
+        attention_mask = torch.zeros((len(items), length), dtype=torch.long)
+        for row, item in enumerate(items):
+            size = len(item["input_ids"])
+            input_ids[row, length - size:] = item["input_ids"]
+            attention_mask[row, length - size:] = 1
+
+        return {
+            "input_ids": input_ids,
+            "attention_mask": attention_mask,
+            "position_ids": (attention_mask.cumsum(1) - 1).clamp(min=0),
+            "answer": torch.stack([item["answer"] for item in items]),
+            "token_count": int(attention_mask.sum())
+        }
+
+
+def build_loader(dataset, config):
+    '''Length bucketed loader of padded batches over dataset.'''
+    tokenizer = dataset.tokenizer
+    pad_id = tokenizer.pad_token_id
+    if pad_id is None:
+        pad_id = tokenizer.eos_token_id if tokenizer.eos_token_id is not None else 0
+    return DataLoader(dataset,
+                      batch_sampler=LengthBucketSampler(
+                          dataset.lengths, config.batch_size),
+                      collate_fn=PadCollator(pad_id),
+                      num_workers=config.num_workers,
+                      pin_memory=True)
+
+
+def prefix_shared_forward(model, dataset, config, recorder):
+    '''Run the questions of dataset task by task. The prefix shared by a task
+    is prefilled once, and each question runs only its suffix on the past key
+    values of the prefix. Yields (logits, answer, tokens, core seconds) per
+    question, where tokens counts the full prompt, and the prefill time is
+    added to the first question of the task. recorder samples the suffixes.
+    '''
+    for prefix, indices in dataset.shared_prefixes():
+        past = None
+        prefill_time = 0.0
+        if len(prefix) > 0:
+            torch_sync(config)
+            prefill_start = time.perf_counter()
+            past = model(prefix.unsqueeze(0).cuda(),
+                         use_cache=True).past_key_values
+            torch_sync(config)
+            prefill_time = time.perf_counter() - prefill_start
+
+        for idx in indices:
+            item = dataset[idx]
+            suffix = item["input_ids"][len(prefix):].unsqueeze(0).cuda()
+
+            torch_sync(config)
+            recorder.start()
+            y = model(suffix, past_key_values=past, use_cache=past is not None)
+            torch_sync(config)
+            seconds = recorder.stop() + prefill_time
+            prefill_time = 0.0
+
+            # a Cache object is extended in place, a legacy tuple is not
+            if hasattr(past, "crop"):
+                past.crop(len(prefix))
+            yield y[0], item["answer"].unsqueeze(0), len(
+                item["input_ids"]), seconds
+
+
+def model_inputs(item, config):
+    '''Inputs of the model for a batch, the padding mask and positions are
+    only passed when batches can be padded.'''
+    inputs = [item["input_ids"]]
+    if config.batch_size > 1:
+        inputs += [item["attention_mask"], item["position_ids"]]
+    return inputs
@@ -0,0 +1,108 @@
+import torch
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class CudaPrefetcher:
+    '''Double buffered loader over dataloader, enabled by config.prefetch.
+    While batch i is computed, the host to device copy of batch i+1 runs on
+    a side stream. Fields of a batch at device_fields are copied, others are
+    passed as they are. Disabled, it iterates dataloader unchanged.
+
+    Core time accounting: the next host batch is taken from dataloader in
+    __next__, before the timed region. Inside the timed region, the loop
+    calls preload() after its compute is enqueued, which only enqueues the
+    copy of batch i+1. So core time holds the compute of batch i and the part
+    of the next copy it does not hide, but no dataloader or collate time.
+    '''
+
+    def __init__(self, dataloader, config, device_fields=(0, )):
+        self.dataloader = dataloader
+        self.device_fields = device_fields
+        self.enabled = config.prefetch and torch.cuda.is_available()
+        self.stream = torch.cuda.Stream() if self.enabled else None
+        self.host_batch = None
+        self.device_batch = None
+        self.ready = None
+
+    def __len__(self):
+        return len(self.dataloader)
+
+    def __iter__(self):
+        if not self.enabled:
+            return iter(self.dataloader)
+        self.iterator = iter(self.dataloader)
+        self.host_batch = next(self.iterator, None)
+        self.device_batch = None
+        self.preload()
+        return self
+
+    def preload(self):
+        '''Enqueue the copy of the next batch on the side stream.'''
+        if not self.enabled or self.host_batch is None:
+            return
+        with torch.cuda.stream(self.stream):
+            batch = list(self.host_batch)
+            for i in self.device_fields:
+                batch[i] = batch[i].cuda(non_blocking=True)
+            self.ready = torch.cuda.Event()
+            self.ready.record(self.stream)
+        self.device_batch = batch
+        self.host_batch = None
+
+    def __next__(self):
+        # the loop did not preload during the last compute
+        self.preload()
+        if self.device_batch is None:
+            raise StopIteration
+
+        current = torch.cuda.current_stream()
+        current.wait_event(self.ready)
+        batch = self.device_batch
+        for i in self.device_fields:
+            batch[i].record_stream(current)
+        self.device_batch = None
+        self.host_batch = next(self.iterator, None)
+        return tuple(batch)
+
+
+class AsyncEvaluator:
+    '''Calls evaluator on a background thread in submit order, enabled by
+    config.async_eval. Device work enqueued before submit, like a non
+    blocking copy of predictions to host, is waited for with an event, so
+    arguments must not be written after submit. At most max_pending calls
+    are queued. Disabled, evaluator is called in submit.'''
+
+    def __init__(self, evaluator, config, max_pending=4):
+        self.evaluator = evaluator
+        self.enabled = config.async_eval
+        self.executor = ThreadPoolExecutor(
+            max_workers=1) if self.enabled else None
+        self.max_pending = max_pending
+        self.pending = []
+
+    def submit(self, *args):
+        if not self.enabled:
+            self.pending.append(self.evaluator(*args))
+            return
+
+        if len(self.pending) >= self.max_pending:
+            self.pending[-self.max_pending].result()
+        ready = None
+        if torch.cuda.is_available():
+            ready = torch.cuda.Event()
+            ready.record()
+        self.pending.append(self.executor.submit(self.evaluate, ready, args))
+
+    def evaluate(self, ready, args):
+        if ready is not None:
+            ready.synchronize()
+        return self.evaluator(*args)
+
+    def results(self):
+        '''Wait for all submitted calls, return their results in order.'''
+        results = [
+            result.result() if isinstance(result, Future) else result
+            for result in self.pending
+        ]
+        self.pending = []
+        return results
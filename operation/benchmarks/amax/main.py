@@ -33,6 +33,11 @@ def parse_args():
                         required=True,
                         help="spectflops of current dataformat")
 
+    parser.add_argument("--spectbandwidth",
+                        type=str,
+                        default="-1",
+                        help="memory bandwidth of the chip in GB/s")
+
     parser.add_argument("--dataformat",
                         type=str,
                         required=True,
@@ -84,9 +89,11 @@ def main(config, case_config):
         torch.amax, (a, 1), host_device_sync, config, case_config)
 
     op2flops = lambda x: x * math.prod(shape)
+    op2bytes = lambda x: x * (a.numel() + a.shape[0]) * a.element_size()
 
     perf_result = cal_perf(cputime, kerneltime, op2flops,
-                           config.spectflops)
+                           config.spectflops, op2bytes=op2bytes,
+                           spectbandwidth=config.spectbandwidth)
     print_result(config, config.case_name, *perf_result, correctness,
                  latency_nowarm, latency_warm)
 
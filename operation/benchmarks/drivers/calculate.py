@@ -4,25 +4,16 @@
 #!/usr/bin/env python3
 # -*- coding: UTF-8 -*-
 import time
+import math
 from triton.testing import do_bench as kernel_bench
 import os
-import subprocess
+import json
+from .correctness import do_correctness, check_correctness
 
 
-def do_correctness(operation):
-    flaggems_dir = os.getenv("FLAGGEMS_WORK_DIR", "/")
-    gems_repo = subprocess.check_output(
-        ["find", flaggems_dir, "-type", "d", "-name", "FlagGems"], text=True).strip()
-
-    p = subprocess.Popen(
-        f"cd {os.path.join(gems_repo, 'tests')} && python3 test_named_ops.py --name {operation} --device cpu ",
-        shell=True
-        )
-    p.wait()
-
-    return p.returncode
-
 grad_outputs = None
+# results of print_result are appended to it if it is a list, see sweep_main.py
+RESULT_SINK = None
 
 def do(exec_func, exec_args, bp=False):
     global grad_outputs
@@ -37,6 +28,89 @@ def do(exec_func, exec_args, bp=False):
         _tensor = exec_func(*exec_args)
 
 
+# Two sided 95% t values by degrees of freedom, the value of the next
+# smaller listed df is used, and 1.96 above 30.
+T_95 = {1: 12.71, 2: 4.30, 3: 3.18, 4: 2.78, 5: 2.57, 6: 2.45, 7: 2.36,
+        8: 2.31, 9: 2.26, 10: 2.23, 15: 2.13, 20: 2.09, 30: 2.04}
+
+# statistics of the last adaptive do_test, reported by print_result
+LAST_STATS = None
+# bytes moved and bandwidth of the last cal_perf with op2bytes, reported by
+# print_result
+LAST_BANDWIDTH = None
+
+
+def mean_ci(samples):
+    '''Mean of samples and the half width of its 95% confidence interval.'''
+    n = len(samples)
+    mean = sum(samples) / n
+    if n < 2:
+        return mean, float("inf")
+    var = sum((x - mean)**2 for x in samples) / (n - 1)
+    df = n - 1
+    t = 1.96 if df > 30 else T_95[max(k for k in T_95 if k <= df)]
+    return mean, t * math.sqrt(var / n)
+
+
+def median_ci(samples):
+    '''Median of samples and the half width of its 95% confidence
+    interval, from the order statistics around the median.'''
+    samples = sorted(samples)
+    n = len(samples)
+    median = samples[n // 2] if n % 2 else (samples[n // 2 - 1] +
+                                            samples[n // 2]) / 2
+    if n < 3:
+        return median, float("inf")
+    spread = 1.96 * math.sqrt(n) / 2
+    lo = max(0, int(math.floor(n / 2 - spread)))
+    hi = min(n - 1, int(math.ceil(n / 2 + spread)))
+    return median, (samples[hi] - samples[lo]) / 2
+
+
+def adaptive_cputime(exec_func, exec_args, sync_func, config, case_config,
+                     latency, bp=False):
+    '''Time chunks of iterations until the 95% CI of the per iteration time
+    is within CI_TARGET(relative) of the mean, after at least MIN_CHUNKS
+    chunks, or until TIME_BUDGET seconds are spent. Chunks are sized from
+    the warm latency(s) so that MIN_CHUNKS take a quarter of the budget.
+    Return mean seconds per iteration, CI half width and iterations.'''
+    budget = float(getattr(case_config, "TIME_BUDGET", 10.0))
+    target = float(getattr(case_config, "CI_TARGET", 0.01))
+    min_chunks = int(getattr(case_config, "MIN_CHUNKS", 10))
+    chunk = max(1, int(budget / 4 / min_chunks / max(latency, 1e-7)))
+
+    samples = []
+    start = time.perf_counter()
+    while True:
+        sync_func(config.vendor)
+        chunk_start = time.perf_counter()
+        for _ in range(chunk):
+            do(exec_func, exec_args, bp)
+        sync_func(config.vendor)
+        samples.append((time.perf_counter() - chunk_start) / chunk)
+
+        mean, ci = mean_ci(samples)
+        if len(samples) >= min_chunks and ci <= target * mean:
+            break
+        if time.perf_counter() - start >= budget:
+            break
+    return mean, ci, chunk * len(samples)
+
+
+def adaptive_kerneltime(exec_func, exec_args, case_config, bp=False):
+    '''Median kernel time(s) of do_bench and the half width of its 95% CI,
+    None if this triton can not return all the samples.'''
+    try:
+        times = kernel_bench(lambda: do(exec_func, exec_args, bp),
+                             warmup=case_config.KERNELWARMUP,
+                             rep=case_config.KERNELITERS,
+                             return_mode="all")
+    except (TypeError, ValueError, AssertionError):
+        return None, None
+    median, ci = median_ci(times)
+    return median / 1000.0, ci / 1000.0
+
+
 def do_test(exec_func, exec_args, sync_func, config, case_config, bp=False):
     sync_func(config.vendor)
     start_latency_nowarm = time.perf_counter_ns()
@@ -55,6 +129,30 @@ def do_test(exec_func, exec_args, sync_func, config, case_config, bp=False):
     sync_func(config.vendor)
     latency_warm = time.perf_counter_ns() - start_latency_warm
 
+    global LAST_STATS
+    LAST_STATS = None
+    if getattr(case_config, "ADAPTIVE", False):
+        cputime, cputime_ci, iters = adaptive_cputime(exec_func, exec_args,
+                                                      sync_func, config,
+                                                      case_config,
+                                                      latency_warm / 1e9, bp)
+        kerneltime, kerneltime_ci = adaptive_kerneltime(
+            exec_func, exec_args, case_config, bp)
+        if kerneltime is None:
+            kerneltime = kernel_bench(lambda: do(exec_func, exec_args, bp),
+                                      warmup=case_config.KERNELWARMUP,
+                                      rep=case_config.KERNELITERS,
+                                      return_mode="median") / 1000.0
+        LAST_STATS = {
+            "cputime": cputime,
+            "cputime_ci": cputime_ci,
+            "kerneltime": kerneltime,
+            "kerneltime_ci": kerneltime_ci,
+            "iterations": iters
+        }
+        return round(latency_nowarm / 1000.0,
+                     2), round(latency_warm / 1000.0, 2), cputime, kerneltime
+
     start_time = time.perf_counter()
     for _ in range(case_config.ITERS):
         do(exec_func, exec_args, bp)
@@ -74,7 +172,14 @@ def do_test(exec_func, exec_args, sync_func, config, case_config, bp=False):
                                                     2), cputime, kerneltime
 
 
-def cal_perf(cputime, kerneltime, op2flops, spectflops, bp=False):
+def cal_perf(cputime, kerneltime, op2flops, spectflops, bp=False,
+             op2bytes=None, spectbandwidth=None):
+    '''op2flops and op2bytes map op/s to FLOPS and bytes/s, op2bytes
+    counts the bytes read and written by the op, backward included. The
+    achieved GB/s are kept in LAST_BANDWIDTH, with their utilization of
+    spectbandwidth(GB/s) if it is known.'''
+    global LAST_BANDWIDTH
+    LAST_BANDWIDTH = None
     spectflops = float(spectflops)
     ctus = round(cputime * 1E6, 2)
     ktus = round(kerneltime * 1E6, 2)
@@ -82,6 +187,25 @@ def cal_perf(cputime, kerneltime, op2flops, spectflops, bp=False):
     cps = 1.0 / cputime
     kps = 1.0 / kerneltime
 
+    if op2bytes is not None:
+        cgbps = op2bytes(cps) / 1E9
+        kgbps = op2bytes(kps) / 1E9
+        spectbandwidth = float(spectbandwidth or -1)
+        LAST_BANDWIDTH = {
+            "flops_per_op": op2flops(1) * (3.0 if bp else 1.0),
+            "bytes_per_op": op2bytes(1),
+            "cpu_gbps": round(cgbps, 2),
+            "kernel_gbps": round(kgbps, 2),
+            "spectbandwidth": spectbandwidth,
+            "cpu_bu(%)": None,
+            "kernel_bu(%)": None
+        }
+        if spectbandwidth > 0:
+            LAST_BANDWIDTH["cpu_bu(%)"] = round(
+                100.0 * cgbps / spectbandwidth, 2)
+            LAST_BANDWIDTH["kernel_bu(%)"] = round(
+                100.0 * kgbps / spectbandwidth, 2)
+
     cflops = op2flops(cps) * (3.0 if bp else 1.0)
     kflops = op2flops(kps) * (3.0 if bp else 1.0)
     ctflops = round(cflops / 1E12, 2)
@@ -110,3 +234,67 @@ def print_result(config, casename, ct, kt, cps, kps, ctflops, ktflops, cfu,
     print(
         r"[FlagPerf Result]First time latency: no warmup={} us, warmup={} us".
         format(lnm, lm))
+    if LAST_BANDWIDTH is not None:
+        print(r"[FlagPerf Result]Bandwidth utilization: cputime={}%, "
+              "kerneltime={}%".format(LAST_BANDWIDTH["cpu_bu(%)"],
+                                      LAST_BANDWIDTH["kernel_bu(%)"]))
+        print(r"[FlagPerf Result]Bandwidth: cputime={} GB/s, "
+              "kerneltime={} GB/s".format(LAST_BANDWIDTH["cpu_gbps"],
+                                          LAST_BANDWIDTH["kernel_gbps"]))
+    if LAST_STATS is not None:
+        print(r"[FlagPerf Result]95% CI: cputime={} us ({}%), "
+              "kerneltime={} us ({}%), iterations={}".format(
+                  *ci_values(LAST_STATS), LAST_STATS["iterations"]))
+    write_result(config, casename, ct, kt, cps, kps, ctflops, ktflops, cfu,
+                 kfu, correctness, lnm, lm)
+
+
+def ci_values(stats):
+    '''CI half widths of stats in us and relative to their times in %.'''
+    values = []
+    for name in ("cputime", "kerneltime"):
+        ci = stats[name + "_ci"]
+        if ci is None:
+            values += [None, None]
+        else:
+            values += [round(ci * 1E6, 3), round(100.0 * ci / stats[name], 2)]
+    return values
+
+
+def write_result(config, casename, ct, kt, cps, kps, ctflops, ktflops, cfu,
+                 kfu, correctness, lnm, lm):
+    '''Write the result as json to FLAGPERF_RESULT_FILE given by
+    container_main, which run.py appends to the result store. In a sweep it
+    is appended to RESULT_SINK instead.'''
+    result = {
+        "operation": casename,
+        "oplib": config.oplib,
+        "dataformat": config.dataformat,
+        "spectflops": float(config.spectflops),
+        "cputime(us)": ct,
+        "kerneltime(us)": kt,
+        "cpu_throughput(op/s)": cps,
+        "kernel_throughput(op/s)": kps,
+        "cpu_tflops": ctflops,
+        "kernel_tflops": ktflops,
+        "cpu_fu(%)": cfu,
+        "kernel_fu(%)": kfu,
+        "correctness": correctness,
+        "latency_nowarm(us)": lnm,
+        "latency_warm(us)": lm
+    }
+    if LAST_STATS is not None:
+        cpu_ci, cpu_rel, kernel_ci, kernel_rel = ci_values(LAST_STATS)
+        result["cputime_ci(us)"] = cpu_ci
+        result["cputime_ci(%)"] = cpu_rel
+        result["kerneltime_ci(us)"] = kernel_ci
+        result["kerneltime_ci(%)"] = kernel_rel
+        result["iterations"] = LAST_STATS["iterations"]
+    if LAST_BANDWIDTH is not None:
+        result.update(LAST_BANDWIDTH)
+    if RESULT_SINK is not None:
+        RESULT_SINK.append(result)
+    result_file = os.getenv("FLAGPERF_RESULT_FILE")
+    if result_file:
+        with open(result_file, "w") as file:
+            json.dump(result, file)
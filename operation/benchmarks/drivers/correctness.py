@@ -0,0 +1,159 @@
+# Copyright (c) 2024 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+import os
+import json
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# FlagGems repo found by locate_flaggems, resolved once per process
+FLAGGEMS_REPO = None
+# correctness is per op, shared by all dataformats and oplibs, and kept for
+# each FlagGems commit in FLAGGEMS_CORRECTNESS_CACHE
+CACHE_PATH = os.getenv(
+    "FLAGGEMS_CORRECTNESS_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+                 "flaggems_correctness.json"))
+
+
+def locate_flaggems():
+    '''Return the FlagGems repo: FLAGGEMS_REPO if set, else the repo of the
+    installed flag_gems package, else the first FlagGems dir found under
+    FLAGGEMS_WORK_DIR("/" by default). None if it is not found.'''
+    global FLAGGEMS_REPO
+    if FLAGGEMS_REPO is not None:
+        return FLAGGEMS_REPO
+
+    candidates = []
+    if os.getenv("FLAGGEMS_REPO"):
+        candidates.append(os.getenv("FLAGGEMS_REPO"))
+    try:
+        import flag_gems
+        path = os.path.dirname(os.path.abspath(flag_gems.__file__))
+        # src/flag_gems or flag_gems in the repo
+        candidates += [
+            os.path.dirname(path),
+            os.path.dirname(os.path.dirname(path))
+        ]
+    except ImportError:
+        pass
+    for repo in candidates:
+        if os.path.isfile(os.path.join(repo, "tests", "test_named_ops.py")):
+            FLAGGEMS_REPO = repo
+            return repo
+
+    flaggems_dir = os.getenv("FLAGGEMS_WORK_DIR", "/")
+    found = subprocess.run(
+        ["find", flaggems_dir, "-type", "d", "-name", "FlagGems"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True).stdout.split()
+    if len(found) > 0:
+        FLAGGEMS_REPO = found[0]
+    return FLAGGEMS_REPO
+
+
+def flaggems_commit(repo):
+    '''git commit of the FlagGems repo, or the flag_gems version if it is
+    not a git checkout. None if neither is known.'''
+    ret = subprocess.run(["git", "-C", repo, "rev-parse", "HEAD"],
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.DEVNULL,
+                         text=True)
+    if ret.returncode == 0:
+        return ret.stdout.strip()
+    try:
+        import flag_gems
+        return "version-" + str(flag_gems.__version__)
+    except (ImportError, AttributeError):
+        return None
+
+
+def read_cache():
+    if not os.path.exists(CACHE_PATH):
+        return {}
+    try:
+        with open(CACHE_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_cache(results):
+    '''Merge results into the cache file, written under a temporary name and
+    renamed, so that concurrent writers never leave a partial file.'''
+    cache = read_cache()
+    cache.update(results)
+    tmp_path = CACHE_PATH + ".tmp" + str(os.getpid())
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, CACHE_PATH)
+    except OSError as err:
+        print("Write correctness cache " + CACHE_PATH + " failed: " +
+              str(err))
+
+
+def run_named_op(repo, operation):
+    '''Run the FlagGems tests of operation against the CPU reference, return
+    the exit code.'''
+    p = subprocess.Popen(
+        f"cd {os.path.join(repo, 'tests')} && python3 test_named_ops.py --name {operation} --device cpu ",
+        shell=True)
+    p.wait()
+    return p.returncode
+
+
+def check_correctness(operations, workers=None):
+    '''Return {operation: exit code} of the FlagGems tests of operations.
+    Cached passes of the current FlagGems commit are reused, the others run
+    in parallel on workers(half the CPU cores by default) and are cached if
+    they pass.'''
+    repo = locate_flaggems()
+    if repo is None:
+        print("FlagGems not found, set FLAGGEMS_REPO or FLAGGEMS_WORK_DIR")
+        return {operation: -1 for operation in operations}
+
+    commit = flaggems_commit(repo)
+    cache = read_cache() if commit is not None else {}
+    results = {}
+    todo = []
+    for operation in dict.fromkeys(operations):
+        key = str(commit) + ":" + operation
+        if key in cache:
+            print("Correctness of " + operation + " cached for FlagGems " +
+                  str(commit))
+            results[operation] = cache[key]["returncode"]
+        else:
+            todo.append(operation)
+
+    if len(todo) == 0:
+        return results
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 2) // 2)
+    with ThreadPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+        returncodes = list(
+            pool.map(lambda operation: run_named_op(repo, operation), todo))
+
+    new_entries = {}
+    for operation, returncode in zip(todo, returncodes):
+        results[operation] = returncode
+        # test_named_ops.py also exits with 1 when it crashes(ImportError,
+        # OOM, a broken env), so only passes are cached
+        if commit is not None and returncode == 0:
+            new_entries[str(commit) + ":" + operation] = {
+                "returncode": returncode,
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S",
+                                           time.localtime())
+            }
+    if len(new_entries) > 0:
+        write_cache(new_entries)
+    return results
+
+
+def do_correctness(operation):
+    '''Exit code of the FlagGems tests of operation, 0 if they pass.'''
+    return check_correctness([operation])[operation]
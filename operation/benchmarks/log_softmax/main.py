@@ -33,6 +33,11 @@ def parse_args():
                         required=True,
                         help="spectflops of current dataformat")
 
+    parser.add_argument("--spectbandwidth",
+                        type=str,
+                        default="-1",
+                        help="memory bandwidth of the chip in GB/s")
+
     parser.add_argument("--dataformat",
                         type=str,
                         required=True,
@@ -86,9 +91,11 @@ def main(config, case_config):
         f, (a, ), host_device_sync, config, case_config, bp=True) # 调整为torch.sub
 
     op2flops = lambda x: x * 4 * math.prod(shape)
+    op2bytes = lambda x: x * 5 * a.numel() * a.element_size()
 
     perf_result = cal_perf(cputime, kerneltime, op2flops,
-                           config.spectflops, bp=True)
+                           config.spectflops, bp=True, op2bytes=op2bytes,
+                           spectbandwidth=config.spectbandwidth)
     print_result(config, config.case_name, *perf_result, correctness,
                  latency_nowarm, latency_warm)
 
@@ -34,6 +34,11 @@ def parse_args():
                         required=True,
                         help="spectflops of current dataformat")
 
+    parser.add_argument("--spectbandwidth",
+                        type=str,
+                        default="-1",
+                        help="memory bandwidth of the chip in GB/s")
+
     parser.add_argument("--dataformat",
                         type=str,
                         required=True,
@@ -62,6 +67,7 @@ def main(config, case_config):
     n = case_config.N
     k = case_config.K
     op2flops = lambda x: x * 2 * m * n * k
+    op2bytes = lambda x: x * (m * n + n * k + m * k) * a.element_size()
 
     dtype = {
         "FP32": torch.float32,
@@ -79,7 +85,8 @@ def main(config, case_config):
         torch.mm, (a, b), host_device_sync, config, case_config)
 
     perf_result = cal_perf(cputime, kerneltime, op2flops,
-                           config.spectflops)
+                           config.spectflops, op2bytes=op2bytes,
+                           spectbandwidth=config.spectbandwidth)
     print_result(config, config.case_name, *perf_result, correctness,
                  latency_nowarm, latency_warm)
 
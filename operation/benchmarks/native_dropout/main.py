@@ -31,6 +31,11 @@ def parse_args():
                         type=str,
                         required=True,
                         help="spectflops of current dataformat")
+
+    parser.add_argument("--spectbandwidth",
+                        type=str,
+                        default="-1",
+                        help="memory bandwidth of the chip in GB/s")
     parser.add_argument("--dataformat",
                         type=str,
                         required=True,
@@ -71,9 +76,11 @@ def main(config, case_config):
         f, (a, ), host_device_sync, config, case_config, bp=True)
 
     op2flops = lambda x: x * m * 1024 * 1024
+    op2bytes = lambda x: x * a.numel() * (4 * a.element_size() + 2)
 
     perf_result = cal_perf(cputime, kerneltime, op2flops,
-                           config.spectflops, bp=True)
+                           config.spectflops, bp=True, op2bytes=op2bytes,
+                           spectbandwidth=config.spectbandwidth)
     print_result(config, config.case_name, *perf_result, correctness,
                  latency_nowarm, latency_warm)
 
@@ -63,6 +63,11 @@ def parse_args():
                         required=True,
                         help="abs path for FlagPerf/base")
 
+    parser.add_argument("--spectbandwidth",
+                        type=str,
+                        default="-1",
+                        help="memory bandwidth of the chip in GB/s")
+
     args, unknown_args = parser.parse_known_args()
     args.unknown_args = unknown_args
     return args
@@ -75,11 +80,22 @@ def write_pid_file(pid_file_path, pid_file):
     pid_file_path = os.path.join(pid_file_path, pid_file)
     if os.path.exists(pid_file_path):
         os.remove(pid_file_path)
+    if os.path.exists(pid_file_path + ".exit"):
+        os.remove(pid_file_path + ".exit")
     file_d = open(pid_file_path, "w")
     file_d.write("%s\n" % os.getpid())
     file_d.close()
 
 
+def write_exit_file(pid_file_path, pid_file, exit_code):
+    '''Write exit code of the task next to its pid file, so that the waiter
+       in the cluster can report it.
+    '''
+    file_d = open(os.path.join(pid_file_path, pid_file + ".exit"), "w")
+    file_d.write("%s\n" % exit_code)
+    file_d.close()
+
+
 if __name__ == "__main__":
     config = parse_args()
 
@@ -106,6 +122,7 @@ if __name__ == "__main__":
     start_cmd += " --dataformat=" + dataformat
     start_cmd += " --oplib=" + oplib
     start_cmd += " --chip=" + chip
+    start_cmd += " --spectbandwidth=" + config.spectbandwidth
 
     script_log_file = os.path.join(os.path.dirname(logfile),
                                    "operation.log.txt")
@@ -113,11 +130,18 @@ if __name__ == "__main__":
     logger.info(start_cmd)
     logger.info(script_log_file)
 
+    result_file = os.path.join(os.path.dirname(logfile), "result.json")
+    if os.path.exists(result_file):
+        os.remove(result_file)
+
     f = open(script_log_file, "w")
     p = subprocess.Popen(start_cmd,
                          shell=True,
                          stdout=f,
-                         stderr=subprocess.STDOUT)
+                         stderr=subprocess.STDOUT,
+                         env=dict(os.environ,
+                                  FLAGPERF_RESULT_FILE=result_file))
     p.wait()
+    write_exit_file(config.log_dir, "start_base_task.pid", p.returncode)
     f.close()
     logger.info("Task Finish")
@@ -19,6 +19,8 @@ spec_tflops_dict["FP16"]=312
 spec_tflops_dict["FP32"]=19.5
 spec_tflops_dict["INT32"]=19.5
 spec_tflops_dict["INT16"]=-1
+# memory bandwidth of the chip in GB/s
+spec_bandwidth=1555
 #=============================STOP==========================
 
 declare -A op_dict
@@ -107,7 +109,7 @@ for key in "${!op_dict[@]}"; do
         echo "Running operation: $key with data format: $value"
         total=$((total + 1))
         # Example command using the variables
-        bash run.sh --op_name "$key" --data_format "$value" --ip_address "$ip_address" --chip_name "$chip_name" --env_name "$env_name" --spec_tflops "${spec_tflops_dict[$value]}"
+        bash run.sh --op_name "$key" --data_format "$value" --ip_address "$ip_address" --chip_name "$chip_name" --env_name "$env_name" --spec_tflops "${spec_tflops_dict[$value]}" --spec_bandwidth "$spec_bandwidth"
         if [ $? -eq 0 ]; then
             echo "success: ${key} ${value}" >> $file
             success=$((success + 1))
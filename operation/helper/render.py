@@ -3,6 +3,10 @@ import sys
 import os
 from jinja2 import Environment, FileSystemLoader
 
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
+from utils import result_store
+
 # Read TDP from environment variable
 tdp = os.environ.get('TDP')
 if tdp:
@@ -19,6 +23,10 @@ regex_dict = {
     'kernel_clock': r'kerneltime=[0-9.]+\s+us,\s+throughput=[0-9.]+\s+op/s,\s+equals to (.*?) TFLOPS\s+',
     'fu_cputime': r'cputime=(.*?),',
     'kerneltime': r'FLOPS utilization: cputime=.*kerneltime=(.*?)\s+',
+    'gbps': r'Bandwidth: cputime=(.*?) GB/s',
+    'kernel_gbps': r'Bandwidth: cputime=.*kerneltime=(.*?) GB/s',
+    'bu_cputime': r'Bandwidth utilization: cputime=(.*?),',
+    'bu_kerneltime': r'Bandwidth utilization: cputime=.*kerneltime=(.*?)\s+',
     # Other evaluation results
     'cpu_time': r'cputime=(.*?) us',
     'kernel_time': r'kerneltime=(.*?) us',
@@ -48,6 +56,10 @@ format_dict = {
     'kernel_clock': ["TFLOPS"],
     'fu_cputime': None,
     'kerneltime': None,
+    'gbps': ["GB/s"],
+    'kernel_gbps': ["GB/s"],
+    'bu_cputime': None,
+    'bu_kerneltime': None,
     # Other evaluation results
     'cpu_time': ["us"],
     'kernel_time': ["us"],
@@ -105,6 +117,69 @@ def extract_values_from_log(log_text, regex_dict):
 
 
 
+def round_str(value, ndigits):
+    return None if value is None else str(round(value, ndigits))
+
+
+def str_or_none(value, suffix=""):
+    return None if value is None else str(value) + suffix
+
+
+def first_rank(stats):
+    return stats[sorted(stats)[0]] if stats else {}
+
+
+# Same values as extract_values_from_log, from a record of the result store
+def extract_values_from_record(record):
+    perf = record["metrics"]
+    stats = perf["stats"]
+    power = first_rank(stats["chip_power"])
+    return {
+        'correctness': str(perf["correctness"]),
+        'tflops': str(perf["cpu_tflops"]),
+        'kernel_clock': str(perf["kernel_tflops"]),
+        'fu_cputime': str(perf["cpu_fu(%)"]) + "%",
+        'kerneltime': str(perf["kernel_fu(%)"]) + "%",
+        'gbps': str_or_none(perf.get("cpu_gbps")),
+        'kernel_gbps': str_or_none(perf.get("kernel_gbps")),
+        'bu_cputime': str_or_none(perf.get("cpu_bu(%)"), "%"),
+        'bu_kerneltime': str_or_none(perf.get("kernel_bu(%)"), "%"),
+        'cpu_time': str(perf["cputime(us)"]),
+        'kernel_time': str(perf["kerneltime(us)"]),
+        'cpu_ops': str(perf["cpu_throughput(op/s)"]),
+        'kernel_ops': str(perf["kernel_throughput(op/s)"]),
+        'no_warmup_delay': str(perf["latency_nowarm(us)"]),
+        'warmup_delay': str(perf["latency_warm(us)"]),
+        'ave_system_power': round_str(stats["pwr"]["mean"], 2),
+        'max_system_power': round_str(stats["pwr"]["max"], 2),
+        'system_power_stddev': round_str(stats["pwr"]["std"], 2),
+        'single_card_avg_power': round_str(power.get("mean"), 2),
+        'single_card_max_power': round_str(power.get("max"), 2),
+        'single_card_power_stddev': round_str(power.get("std"), 2),
+        'avg_cpu_usage': round_str(stats["cpu"]["mean"], 3),
+        'avg_mem_usage': round_str(stats["mem"]["mean"], 3),
+        'single_card_avg_temp':
+        round_str(first_rank(stats["chip_temp"]).get("mean"), 2),
+        'max_gpu_memory_usage_per_card':
+        round_str(first_rank(stats["chip_mem"]).get("max"), 3),
+    }
+
+
+# The record of the run of log_file in the result store next to its run dir
+def read_record(file_name):
+    run_dir = os.path.dirname(os.path.abspath(file_name))
+    db_path = os.path.join(os.path.dirname(run_dir), "results.db")
+    if not os.path.exists(db_path):
+        return None
+    store = result_store.ResultStore(db_path)
+    records = store.query(subsystem="operation",
+                          run_id=os.path.basename(run_dir))
+    store.close()
+    if len(records) == 0 or "cpu_tflops" not in records[0]["metrics"]:
+        return None
+    return records[0]
+
+
 def format_values(extracted_values, format_dict):
     formatted_values = {}
     for key, value in extracted_values.items():
@@ -132,10 +207,17 @@ if __name__ == "__main__":
         file_name = sys.argv[1]
         data_type = sys.argv[2]
         readme_file_path = sys.argv[3]
-        log_text = read_log_from_file(file_name)
-        log_text = log_text.split("analysis logs")[1]
-        if log_text:
-            extracted_values = extract_values_from_log(log_text, regex_dict)
+        record = read_record(file_name)
+        log_text = None
+        if record is None:
+            log_text = read_log_from_file(file_name)
+            log_text = log_text.split("analysis logs")[1]
+        if record is not None or log_text:
+            if record is not None:
+                extracted_values = extract_values_from_record(record)
+            else:
+                extracted_values = extract_values_from_log(
+                    log_text, regex_dict)
             for key, value in extracted_values.items():
                 print(f"{key}: {value}")
             
@@ -152,7 +234,8 @@ if __name__ == "__main__":
                 extracted_values.update(data_values)
                 with open(data_file, 'w') as file:
                     file.write(str(extracted_values))
-                if len(extracted_values.keys()) >= 44:
+                # values of nativetorch and flaggems with their tdp
+                if len(extracted_values.keys()) >= 2 * (len(regex_dict) + 1):
                     render(extracted_values, readme_file_path)
             else:
                 # Write extracted_values to data file
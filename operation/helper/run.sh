@@ -26,6 +26,7 @@ modify_config() {
     # 替换FP  和 替换case 类型等
     #  "eq:FP32:nativetorch:A100_40_SXM": "ngctorch2403"
     sed -i "s|^    \".*:.*:.*:.*\": \".*\"|    \"$op_name:$data_format:$spec_tflops:$case_type:$chip_name\": \"$env_name\"|" "${OPERATIONDIR}/configs/host.yaml"
+    sed -i "s|^SPECTBANDWIDTH:.*$|SPECTBANDWIDTH: {\"$chip_name\": $spec_bandwidth}|" "${OPERATIONDIR}/configs/host.yaml"
     # 备份一下, 方便排查问题
     cp "${OPERATIONDIR}/configs/host.yaml" "${result_dir}/bak_${case_type}_host.yaml"
    }
@@ -99,9 +100,10 @@ ip_address=""
 chip_name=""
 env_name=""
 spec_tflops=0
+spec_bandwidth=-1
 
 usage() {
-    echo "Usage: $0 --op_name <op_name> --data_format <data_format> --ip_address <ip_address>  --chip_name <chip_name> --env_name <env_name> --spec_tflops <spec_tflops>"
+    echo "Usage: $0 --op_name <op_name> --data_format <data_format> --ip_address <ip_address>  --chip_name <chip_name> --env_name <env_name> --spec_tflops <spec_tflops> [--spec_bandwidth <spec_bandwidth>]"
     exit 1
 }
 
@@ -133,6 +135,10 @@ while [ $# -gt 0 ]; do
             spec_tflops="$2"
             shift 2
             ;; 
+        --spec_bandwidth)
+            spec_bandwidth="$2"
+            shift 2
+            ;;
         *)
             echo "Unknown option: $1"
             usage
@@ -153,6 +159,7 @@ echo "ip_address: $ip_address"
 echo "chip_name: $chip_name"
 echo "env_name: $env_name"
 echo "spec_tflops: $spec_tflops"
+echo "spec_bandwidth: $spec_bandwidth"
 
 
 # Read env vars
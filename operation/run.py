@@ -13,13 +13,15 @@ import yaml
 from argparse import Namespace
 import importlib
 import json
-import numpy as np
 
 CURR_PATH = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(os.path.abspath(os.path.join(CURR_PATH, "../")))
 from utils import cluster_manager
 from utils import flagperf_logger
 from utils import image_manager
+from utils import monitor_log
+from utils import log_analysis
+from utils import result_store
 
 VERSION = "v0.1"
 RUN_LOGGER = flagperf_logger.FlagPerfLogger()
@@ -143,8 +145,10 @@ def clear_caches_cluster(clear, nnodes):
 
 def start_monitors_in_cluster(dp_path, case_log_dir, nnodes, config):
     '''Start sytem and vendor's monitors.'''
+    log_format = " -f " + getattr(config, "MONITOR_FORMAT", "text")
     start_mon_cmd = "cd " + dp_path + " && " + sys.executable \
-                    + " ../utils/sys_monitor.py -o restart -l "
+                    + " ../utils/sys_monitor.py" + log_format \
+                    + " -o restart -l "
     timeout = 60
     RUN_LOGGER.debug("Run cmd in the cluster to start system monitors: " +
                      start_mon_cmd)
@@ -158,7 +162,7 @@ def start_monitors_in_cluster(dp_path, case_log_dir, nnodes, config):
     ven_mon_path = os.path.join(dp_path, "vendors", config.VENDOR,
                                 config.VENDOR + "_monitor.py")
     start_mon_cmd = "cd " + dp_path + " && " + sys.executable \
-                    + " " + ven_mon_path + " -o restart -l "
+                    + " " + ven_mon_path + log_format + " -o restart -l "
     RUN_LOGGER.debug("Run cmd in the cluster to start vendor's monitors: " +
                      start_mon_cmd)
     bad_hosts = CLUSTER_MGR.start_monitors_some_hosts(start_mon_cmd,
@@ -195,68 +199,107 @@ def stop_monitors_in_cluster(dp_path, nnodes, config):
                          ",".join(bad_hosts.keys()))
 
 
-def start_tasks_in_cluster(dp_path, container_name, config, base_args,
-                           curr_log_path, case):
-    '''Start tasks in cluster, and NOT wait.'''
-    nnodes = len(config.HOSTS)
-    framework = config.CASES[case]
-
-    op, df, spectflops, oplib, chip = case.split(":")
-    env_dir = os.path.join(config.FLAGPERF_PATH, "benchmarks", op,
-                           config.VENDOR, chip)
-
-    env_shell = os.path.join(env_dir, "env.sh")
-    req_file = os.path.join(env_dir, "requirements.txt")
-
-    abs_log_path = os.path.join(dp_path, curr_log_path)
-
+def task_cmd(dp_path, container_name, config, abs_log_path, env_dirs,
+             script, args):
+    '''Command to run script in the container, after installing the
+       requirements.txt and sourcing the env.sh in env_dirs. Files with the
+       same content are only used once.'''
     start_cmd = "cd " + dp_path + " && " + sys.executable \
                 + " ../utils/container_manager.py -o runcmdin -c " \
                 + container_name + " -d -r \"echo Hello FlagPerf" \
                 + " > " + abs_log_path + "/hello.log.txt"
 
-    if os.path.isfile(req_file):
+    req_files = unique_files(env_dirs, "requirements.txt")
+    env_shells = unique_files(env_dirs, "env.sh")
+    for req_file in req_files:
         start_cmd += " && pip install -r " + req_file \
-                     + " > " + abs_log_path + "/pip_install.log.txt " \
+                     + " >> " + abs_log_path + "/pip_install.log.txt " \
                      + "2>&1"
 
-    if os.path.isfile(env_shell):
-        if config.VENDOR == "iluvatar":
-            start_cmd += " && export CUDA_VISIBLE_DEVICES=" + str(config.DEVICE) 
+    if len(env_shells) > 0 and config.VENDOR == "iluvatar":
+        start_cmd += " && export CUDA_VISIBLE_DEVICES=" + str(config.DEVICE)
+    for env_shell in env_shells:
         start_cmd += " && source " + env_shell \
-                     + " > " + abs_log_path + "/env.log.txt " \
+                     + " >> " + abs_log_path + "/env.log.txt " \
                      + "2>&1"
 
-    start_cmd += " && python3 " + config.FLAGPERF_PATH + "/container_main.py" + base_args \
-                 + " > " + abs_log_path + "/container_main.log.txt " \
-                 + "2>&1"
+    start_cmd += " && python3 " + config.FLAGPERF_PATH + "/" + script + args \
+                 + " > " + abs_log_path + "/" + script.replace(".py", "") \
+                 + ".log.txt 2>&1"
 
     start_cmd += " \""
+    return start_cmd
+
+
+def unique_files(dirs, name):
+    '''Existing files named name in dirs, one per distinct content.'''
+    files = []
+    contents = set()
+    for directory in dirs:
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, "r") as file:
+            content = file.read()
+        if content not in contents:
+            contents.add(content)
+            files.append(path)
+    return files
+
+
+def start_tasks_in_cluster(dp_path, container_name, config, base_args,
+                           curr_log_path, case):
+    '''Start tasks in cluster, and NOT wait.'''
+    nnodes = len(config.HOSTS)
+
+    op, df, spectflops, oplib, chip = case.split(":")
+    env_dir = os.path.join(config.FLAGPERF_PATH, "benchmarks", op,
+                           config.VENDOR, chip)
+
+    abs_log_path = os.path.join(dp_path, curr_log_path)
+    start_cmd = task_cmd(dp_path, container_name, config, abs_log_path,
+                         [env_dir], "container_main.py", base_args)
 
     RUN_LOGGER.debug("Run cmd in the cluster to start tasks, cmd=" + start_cmd)
     CLUSTER_MGR.run_command_some_hosts_distribution_info(
         start_cmd, nnodes, 15, "base")
-    # Wait a moment for starting tasks.
-    time.sleep(60)
+
+
+def remove_pid_file_in_cluster(dp_path, pid_file_path, nnodes):
+    '''Remove pid file and exit file of the last task, so that they won't
+       be waited for again.
+    '''
+    rm_cmd = "cd " + dp_path + " && rm -f " + pid_file_path + " " \
+             + pid_file_path + ".exit"
+    RUN_LOGGER.debug("Run cmd in the cluster to remove old pid file: " + rm_cmd)
+    CLUSTER_MGR.run_command_some_hosts(rm_cmd, nnodes, 10)
 
 
 def wait_for_finish(dp_path, container_name, pid_file_path, nnodes):
     '''wait all the processes of start_xxx_task.py finished.
+       Each host blocks until its task exits and reports the exit code.
+       Return hosts whose task exits with non-zero code.
     '''
-    # Aussme pid of start_xxx_task.py won't loop in a short time.
-    check_cmd = "cd " + dp_path + "; " + sys.executable \
-                + " ../utils/container_manager.py -o pidrunning -c " \
-                + container_name + " -f " + pid_file_path
-
-    RUN_LOGGER.debug(
-        "Run cmd to check whether the training tasks is running: " + check_cmd)
-    while True:
-        bad_hosts = CLUSTER_MGR.run_command_some_hosts(check_cmd,
+    wait_cmd = "cd " + dp_path + "; " + sys.executable \
+               + " ../utils/container_manager.py -o waitpid -c " \
+               + container_name + " -f " + pid_file_path
+
+    RUN_LOGGER.debug("Run cmd to wait for the tasks finished: " + wait_cmd)
+    # ssh exits with 255 if the connection is lost, wait again in that case.
+    for _ in range(3):
+        bad_hosts = CLUSTER_MGR.run_command_some_hosts(wait_cmd,
                                                        nnodes,
+                                                       timeout=None,
                                                        no_log=True)
-        if len(bad_hosts) == nnodes:
+        lost_hosts = [host for host in bad_hosts if bad_hosts[host] == 255]
+        if len(lost_hosts) == 0:
             break
-        time.sleep(10)
+        RUN_LOGGER.warning("Lost connection to hosts while waiting for tasks: " +
+                           ",".join(lost_hosts) + ". Wait again.")
+    for host in bad_hosts:
+        RUN_LOGGER.warning("Task on host " + host + " exit with: " +
+                           str(bad_hosts[host]))
+    return bad_hosts
 
 
 def prepare_containers_env_cluster(dp_path, case_log_dir, container_name,
@@ -374,11 +417,7 @@ def summary_logs(config, case_log_dir):
         for index in ["cpu", "mem", "pwr"]:
             monitor_path = os.path.join(monitor_log_dir,
                                         index + "_monitor.log")
-            with open(monitor_path, 'r') as file:
-                sys_log = [
-                    float(line.split("\t")[1][:-1]) for line in file
-                    if "\t" in line
-                ]
+            sys_log = monitor_log.read_sys_log(monitor_path).tolist()
             result[host][index] = sys_log
 
         # FlagPerf Result
@@ -390,92 +429,268 @@ def summary_logs(config, case_log_dir):
             ]
         result[host]["flagperf"] = key_lines
 
+        # structured result written by drivers/calculate.py
+        perf_path = os.path.join(monitor_log_dir, "result.json")
+        if os.path.exists(perf_path):
+            with open(perf_path, "r") as file:
+                result[host]["perf"] = json.load(file)
+
         noderank += 1
 
     return result
 
 
-def analysis_log(key_logs):
-    noderank = 0
-    for host in key_logs:
-        RUN_LOGGER.info("*" * 50)
-        RUN_LOGGER.info("Noderank {} with IP {}".format(noderank, host))
-
-        RUN_LOGGER.info("1) Performance:")
-        for line in key_logs[host]["flagperf"]:
-            RUN_LOGGER.info("  " + line.split("]")[1])
-
-        RUN_LOGGER.info("2) POWER:")
-        RUN_LOGGER.info("  2.1) SYSTEM POWER:")
-        pwr_series = key_logs[host]["pwr"]
-        RUN_LOGGER.info(
-            "    AVERAGE: {} Watts, MAX: {} Watts, STD DEVIATION: {} Watts".
-            format(round(np.mean(pwr_series), 2), round(np.max(pwr_series), 2),
-                   round(np.std(pwr_series), 2)))
-
-        RUN_LOGGER.info("  2.2) AI-chip POWER:")
-        for node in key_logs[host]["vendor"]["power"].keys():
-            pwr_series = key_logs[host]["vendor"]["power"][node]
-            kmeans_series = []
-            for item in pwr_series:
-                if (np.max(pwr_series) - item) <= (item - np.min(pwr_series)):
-                    kmeans_series.append(item)
-            pwr_series = kmeans_series
-            RUN_LOGGER.info(
-                "    RANK {}'s AVERAGE: {} Watts, MAX: {} Watts, STD DEVIATION: {} Watts"
-                .format(node, round(np.mean(pwr_series), 2),
-                        round(np.max(pwr_series), 2),
-                        round(np.std(pwr_series), 2)))
-
-        RUN_LOGGER.info("  2.3) AI-chip TEMPERATURE:")
-        for node in key_logs[host]["vendor"]["temp"].keys():
-            temp_series = key_logs[host]["vendor"]["temp"][node]
-            kmeans_series = []
-            for item in temp_series:
-                if (np.max(temp_series) - item) <= (item -
-                                                    np.min(temp_series)):
-                    kmeans_series.append(item)
-            temp_series = kmeans_series
-            RUN_LOGGER.info(
-                u"    RANK {}'s AVERAGE: {} \u00b0C, MAX: {} \u00b0C, STD DEVIATION: {} \u00b0C"
-                .format(node, round(np.mean(temp_series), 2),
-                        round(np.max(temp_series), 2),
-                        round(np.std(temp_series), 2)))
-
-        RUN_LOGGER.info("3) Utilization:")
-        RUN_LOGGER.info("  3.1) SYSTEM CPU:")
-        cpu_series = key_logs[host]["cpu"]
-        RUN_LOGGER.info(
-            "    AVERAGE: {} %, MAX: {} %, STD DEVIATION: {} %".format(
-                round(np.mean(cpu_series) * 100, 3),
-                round(np.max(cpu_series) * 100, 3),
-                round(np.std(cpu_series) * 100, 3)))
-
-        RUN_LOGGER.info("  3.2) SYSTEM MEMORY:")
-        mem_series = key_logs[host]["mem"]
-        RUN_LOGGER.info(
-            "    AVERAGE: {} %, MAX: {} %, STD DEVIATION: {} %".format(
-                round(np.mean(mem_series) * 100, 3),
-                round(np.max(mem_series) * 100, 3),
-                round(np.std(mem_series) * 100, 3)))
-
-        RUN_LOGGER.info("  3.3) AI-chip MEMORY:")
-        for node in key_logs[host]["vendor"]["mem"].keys():
-            mem_series = key_logs[host]["vendor"]["mem"][node]
-            RUN_LOGGER.info(
-                "    RANK {}'s AVERAGE: {} %, MAX: {} %, STD DEVIATION: {} %".
-                format(
-                    node,
-                    round(
-                        np.mean(mem_series) * 100 /
-                        key_logs[host]["vendor"]["max_mem"], 3),
-                    round(
-                        np.max(mem_series) * 100 /
-                        key_logs[host]["vendor"]["max_mem"], 3),
-                    round(
-                        np.std(mem_series) * 100 /
-                        key_logs[host]["vendor"]["max_mem"], 3)))
-        noderank += 1
+def spect_bandwidth(config, chip):
+    '''Memory bandwidth of chip in GB/s from SPECTBANDWIDTH in host.yaml,
+       -1 if it is unknown.'''
+    return (getattr(config, "SPECTBANDWIDTH", None) or {}).get(chip, -1)
+
+
+def expand_shapes(op, spec):
+    '''case_config overrides of the shapes of op. spec is a list of
+       overrides, or a dict mapping case_config keys to a value, a list of
+       values or a geometric range like {"start": 1, "stop": 1024,
+       "factor": 2}, where the lists and ranges are zipped.'''
+    if isinstance(spec, list):
+        return spec
+    points = {}
+    for key, value in spec.items():
+        if isinstance(value, dict):
+            factor = value.get("factor", 2)
+            if factor <= 1 or value["start"] <= 0:
+                RUN_LOGGER.error("Shape range of " + op + ":" + key +
+                                 " should grow from a positive start"
+                                 "......[FAILED] [EXIT]")
+                sys.exit(3)
+            points[key] = []
+            x = value["start"]
+            while x <= value["stop"]:
+                points[key].append(x)
+                x = x * factor
+        elif isinstance(value, list):
+            points[key] = value
+    lengths = set(len(values) for values in points.values())
+    if len(lengths) > 1:
+        RUN_LOGGER.error("Shape lists and ranges of " + op + " have " +
+                         "different lengths " + str(sorted(lengths)) +
+                         "......[FAILED] [EXIT]")
+        sys.exit(3)
+    shapes = []
+    for i in range(lengths.pop() if lengths else 1):
+        shape = dict(spec)
+        for key, values in points.items():
+            shape[key] = values[i]
+        shapes.append(shape)
+    return shapes
+
+
+def get_sweep_plan(config, dp_path):
+    '''Return the plan of SWEEP in host.yaml, None if it is not set. ops of
+       the plan maps each op to its dataformats, all the ops in benchmarks
+       with all the dataformats by default. shapes of the plan maps ops to
+       their case_config overrides, the shape of case_config.yaml by
+       default.'''
+    sweep = getattr(config, "SWEEP", None)
+    if not sweep:
+        return None
+    dataformats = sweep["dataformats"]
+    ops = sweep.get("ops")
+    if not ops:
+        benchmarks_dir = os.path.join(dp_path, "benchmarks")
+        ops = sorted(
+            op for op in os.listdir(benchmarks_dir)
+            if os.path.isfile(os.path.join(benchmarks_dir, op, "main.py")))
+    if not isinstance(ops, dict):
+        ops = {op: None for op in ops}
+    for op, op_dataformats in ops.items():
+        if isinstance(op_dataformats, str):
+            op_dataformats = op_dataformats.split()
+        ops[op] = list(op_dataformats or dataformats)
+    return {
+        "image": sweep["image"],
+        "chip": sweep["chip"],
+        "dataformats": dataformats,
+        "oplibs": sweep.get("oplibs", ["nativetorch", "flaggems"]),
+        "ops": ops,
+        "shapes": {
+            op: expand_shapes(op, spec)
+            for op, spec in (sweep.get("shapes") or {}).items()
+        },
+        "bandwidth": sweep.get("bandwidth", spect_bandwidth(config,
+                                                            sweep["chip"])),
+        "launch_us": sweep.get("launch_us", 10)
+    }
+
+
+def run_sweep(config, plan, dp_path, curr_log_path, timestamp_log_dir):
+    '''Run all the cases of plan in one container on the first host, with
+       sweep_main.py importing the benchmarks instead of a container, pip
+       install, monitors and log collection per case.'''
+    nnodes = 1
+    framework = plan["image"]
+    image_mgr = image_manager.ImageManager(
+        "flagperf-operation-" + config.VENDOR + "-" + framework,
+        "t_" + VERSION)
+    image_name = image_mgr.repository + ":" + image_mgr.tag
+    RUN_LOGGER.info("=== 2.1 Prepare docker image:" + image_name + " ===")
+    if not prepare_docker_image_cluster(dp_path, image_mgr, framework,
+                                        nnodes, config):
+        RUN_LOGGER.error("=== 2.1 Prepare docker image...[FAILED] ===")
+        return
+    container_name = image_mgr.repository + "-" + image_mgr.tag \
+                     + "-container"
+    if config.VENDOR == "iluvatar":
+        container_name = container_name + "_device_" + str(config.DEVICE)
+
+    abs_log_path = os.path.join(dp_path, curr_log_path)
+    plan_path = os.path.join(abs_log_path, "sweep_plan.json")
+    os.makedirs(abs_log_path, exist_ok=True)
+    with open(plan_path, "w") as file:
+        json.dump(plan, file)
+
+    RUN_LOGGER.info("=== 2.2 Setup container and run the sweep. ===")
+    case_log_dir = os.path.join(curr_log_path, "sweep")
+    if not prepare_containers_env_cluster(dp_path, case_log_dir,
+                                          container_name, image_name, nnodes,
+                                          config):
+        RUN_LOGGER.error("Prepare container environments in cluster"
+                         "...[FAILED]")
+        return
+    pid_file_path = os.path.join(curr_log_path, "start_base_task.pid")
+    remove_pid_file_in_cluster(dp_path, pid_file_path, nnodes)
+
+    env_dirs = [
+        os.path.join(config.FLAGPERF_PATH, "benchmarks", op, config.VENDOR,
+                     plan["chip"]) for op in plan["ops"]
+    ]
+    sweep_args = " --plan " + plan_path + " --vendor " + config.VENDOR \
+                 + " --perf_path " + dp_path \
+                 + " --log_dir " + abs_log_path \
+                 + " --log_level " + config.FLAGPERF_LOG_LEVEL.upper()
+    start_cmd = task_cmd(dp_path, container_name, config, abs_log_path,
+                         env_dirs, "sweep_main.py", sweep_args)
+    RUN_LOGGER.debug("Run cmd in the cluster to start the sweep, cmd=" +
+                     start_cmd)
+    CLUSTER_MGR.run_command_some_hosts_distribution_info(
+        start_cmd, nnodes, 15, "base")
+
+    RUN_LOGGER.info("Waiting for " + str(
+        sum(
+            len(dfs) * len(plan["shapes"].get(op, [{}]))
+            for op, dfs in plan["ops"].items()) * len(plan["oplibs"])) +
+                    " cases of the sweep...")
+    wait_for_finish(dp_path, container_name, pid_file_path, nnodes)
+    clean_containers_env_cluster(dp_path, container_name, nnodes, config)
+
+    RUN_LOGGER.info("========= Step 3: Collect sweep results. =========")
+    collect_and_merge_logs(abs_log_path, ["sweep"], nnodes)
+    summary_sweep(config, plan, dp_path, case_log_dir, timestamp_log_dir)
+
+
+def summary_sweep(config, plan, dp_path, case_log_dir, timestamp_log_dir):
+    '''Log the results of the sweep as a table and append them to the
+       result store, one record per op, dataformat and oplib.'''
+    host = config.HOSTS[0]
+    result_path = os.path.join(dp_path, case_log_dir, host + "_noderank0",
+                               "sweep_result.json")
+    if not os.path.exists(result_path):
+        RUN_LOGGER.error("No sweep result in " + result_path)
+        return
+    with open(result_path, "r") as file:
+        results = json.load(file)
+
+    columns = ("operation", "dataformat", "oplib", "shape", "status",
+               "cputime(us)", "kerneltime(us)", "kerneltime_ci(%)",
+               "kernel_tflops", "kernel_fu(%)", "kernel_gbps",
+               "kernel_bu(%)", "intensity(FLOP/B)", "roofline(%)", "bound",
+               "correctness", "max_memory_allocated(GiB)")
+    RUN_LOGGER.info(" | ".join(columns))
+    records = []
+    for result in results:
+        RUN_LOGGER.info(" | ".join(
+            str(result.get(column, "-")) for column in columns))
+        case = ":".join([
+            result["operation"], result["dataformat"],
+            str(result["spectflops"]), result["oplib"], plan["chip"]
+        ])
+        records.append(
+            result_store.make_record("operation",
+                                     case,
+                                     config.VENDOR,
+                                     result,
+                                     chip=plan["chip"],
+                                     host=host,
+                                     run_id=timestamp_log_dir,
+                                     config={"sweep": True},
+                                     timestamp=result["timestamp"]))
+    result_store.append_records(
+        os.path.join(dp_path, result_store.store_path(config)), records,
+        RUN_LOGGER)
+    plot_roofline(plan, results, os.path.join(dp_path, case_log_dir))
+
+
+def plot_roofline(plan, results, out_dir):
+    '''Draw the achieved TFLOPS of the results over their arithmetic
+       intensity under the roofline of the chip, one chart per dataformat
+       in roofline_<dataformat>.png.'''
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        RUN_LOGGER.warning("matplotlib is not installed, skip the roofline")
+        return
+
+    bandwidth = float(plan["bandwidth"] or -1)
+    for dataformat, spectflops in plan["dataformats"].items():
+        # kernel_tflops is rounded to 0 for the smallest shapes
+        points = [
+            dict(result,
+                 tflops=result["kernel_throughput(op/s)"] *
+                 result["flops_per_op"] / 1E12) for result in results
+            if result["dataformat"] == dataformat
+            and result.get("intensity(FLOP/B)")
+        ]
+        if len(points) == 0:
+            continue
+        fig, ax = plt.subplots(figsize=(10, 7))
+        intensities = [point["intensity(FLOP/B)"] for point in points]
+        lo = min(intensities) / 2
+        hi = max(intensities) * 2
+        spectflops = float(spectflops)
+        if bandwidth > 0 and spectflops > 0:
+            ridge = spectflops * 1E3 / bandwidth
+            lo = min(lo, ridge / 4)
+            hi = max(hi, ridge * 4)
+            ax.plot([lo, ridge, hi],
+                    [lo * bandwidth / 1E3, spectflops, spectflops],
+                    color="black",
+                    label="roofline")
+        elif spectflops > 0:
+            ax.axhline(spectflops, color="black", label="peak")
+
+        series = {}
+        for point in points:
+            series.setdefault(point["operation"] + ":" + point["oplib"],
+                              []).append(point)
+        markers = {"nativetorch": "o", "flaggems": "^"}
+        for name, series_points in sorted(series.items()):
+            ax.plot([point["intensity(FLOP/B)"] for point in series_points],
+                    [point["tflops"] for point in series_points],
+                    marker=markers.get(series_points[0]["oplib"], "s"),
+                    linestyle=":",
+                    label=name)
+        ax.set_xscale("log")
+        ax.set_yscale("log")
+        ax.set_xlabel("arithmetic intensity (FLOP/byte)")
+        ax.set_ylabel("kernel TFLOPS")
+        ax.set_title("Roofline of " + plan["chip"] + " at " + dataformat)
+        ax.grid(True, which="both", alpha=0.3)
+        ax.legend(fontsize="small", ncol=2)
+        path = os.path.join(out_dir, "roofline_" + dataformat + ".png")
+        fig.savefig(path, dpi=120, bbox_inches="tight")
+        plt.close(fig)
+        RUN_LOGGER.info("Roofline of " + dataformat + " is saved to " + path)
 
 
 def print_welcome_msg():
@@ -531,6 +746,14 @@ def main():
     check_cluster_health()
     dp_path = os.path.abspath(config.FLAGPERF_PATH)
     check_cluster_deploy_path(dp_path)
+
+    plan = get_sweep_plan(config, dp_path)
+    if plan is not None:
+        RUN_LOGGER.info("========= Step 2: Run the sweep of " +
+                        str(len(plan["ops"])) + " ops. =========")
+        run_sweep(config, plan, dp_path, curr_log_path, timestamp_log_dir)
+        return
+
     cases = get_valid_cases(config)
     log_test_configs(cases, curr_log_path, dp_path, config)
 
@@ -568,7 +791,9 @@ def main():
                     + " --nproc_per_node " + str(config.NPROC_PER_NODE) \
                     + " --log_dir " + os.path.join(dp_path, log_dir_container) \
                     + " --log_level " + config.FLAGPERF_LOG_LEVEL.upper() \
-                    + " --master_port " + config.MASTER_PORT
+                    + " --master_port " + config.MASTER_PORT \
+                    + " --spectbandwidth " + str(
+                        spect_bandwidth(config, case.split(":")[-1]))
 
         RUN_LOGGER.info("=== 2.2 Setup container and run testcases. ===")
 
@@ -582,13 +807,14 @@ def main():
                              "...[FAILED]. Ignore case " + case)
             continue
         RUN_LOGGER.info("2) Start tasks in the cluster...")
+        pid_file_path = os.path.join(log_dir_container, "start_base_task.pid")
+        remove_pid_file_in_cluster(dp_path, pid_file_path, nnodes)
 
         start_tasks_in_cluster(dp_path, container_name, config, base_args,
                                curr_log_path, case)
 
         # Wait until start_xxx_task.py finished.
         RUN_LOGGER.info("3) Waiting for tasks end in the cluster...")
-        pid_file_path = os.path.join(log_dir_container, "start_base_task.pid")
         wait_for_finish(dp_path, container_name, pid_file_path, nnodes)
 
         RUN_LOGGER.info("3) Training tasks end in the cluster...")
@@ -604,15 +830,26 @@ def main():
     RUN_LOGGER.info("2) summary logs")
     key_logs = summary_logs(config, case_log_dir)
     RUN_LOGGER.debug(key_logs)
+    result = log_analysis.AnalysisResult(key_logs, steady=True)
     jsonfile = os.path.join(dp_path, curr_log_path, "detail_result.json")
-    json.dump(key_logs, open(jsonfile, "w"))
+    json.dump(result.to_dict(), open(jsonfile, "w"))
 
     RUN_LOGGER.info("3) analysis logs")
-    analysis_log(key_logs)
+    result.log(RUN_LOGGER)
+
+    RUN_LOGGER.info("4) append results to the result store")
+    records = result_store.host_records(result, "operation", case,
+                                        config.VENDOR,
+                                        case.split(":")[-1],
+                                        timestamp_log_dir)
+    result_store.append_records(
+        os.path.join(dp_path, result_store.store_path(config)), records,
+        RUN_LOGGER)
 
 
 if __name__ == '__main__':
     if len(sys.argv) > 1:
         usage()
     main()
+    CLUSTER_MGR.close()
     RUN_LOGGER.stop()
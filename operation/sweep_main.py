@@ -0,0 +1,265 @@
+# Copyright (c) 2024 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+'''Run the op x dataformat x oplib x shape matrix of a sweep plan in one
+   process. Every benchmarks/<op>/main.py is imported as a module and its
+   main() is called per case, instead of starting a container per case.'''
+import os
+import gc
+import sys
+import json
+import time
+import importlib.util
+import traceback
+import contextlib
+from argparse import ArgumentParser, Namespace
+import yaml
+from loguru import logger
+from container_main import write_pid_file, write_exit_file
+
+
+def parse_args():
+    parser = ArgumentParser(description=" ")
+
+    parser.add_argument("--plan",
+                        type=str,
+                        required=True,
+                        help="abs path of sweep_plan.json")
+
+    parser.add_argument("--log_dir",
+                        type=str,
+                        required=True,
+                        help="abs log dir")
+
+    parser.add_argument("--vendor",
+                        type=str,
+                        required=True,
+                        help="vendor name like nvidia")
+
+    parser.add_argument("--log_level",
+                        type=str,
+                        required=True,
+                        help="log level")
+
+    parser.add_argument("--host_addr", type=str, required=True, help="my ip")
+
+    parser.add_argument("--node_rank", type=int, required=True, help="my rank")
+
+    parser.add_argument("--perf_path",
+                        type=str,
+                        required=True,
+                        help="abs path for FlagPerf/operation")
+
+    args, unknown_args = parser.parse_known_args()
+    args.unknown_args = unknown_args
+    return args
+
+
+def load_op_module(benchmarks_dir, op):
+    '''Import benchmarks/<op>/main.py as a module.'''
+    spec = importlib.util.spec_from_file_location(
+        "flagperf_op_" + op, os.path.join(benchmarks_dir, op, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_case_config(op_dir, vendor, chip):
+    '''case_config.yaml of op updated by the one of vendor and chip, like
+       the __main__ of benchmarks/<op>/main.py.'''
+    with open(os.path.join(op_dir, "case_config.yaml"), "r") as file:
+        case_config = yaml.safe_load(file)
+    with open(os.path.join(op_dir, vendor, chip, "case_config.yaml"),
+              "r") as file:
+        case_config.update(yaml.safe_load(file))
+    return Namespace(**case_config)
+
+
+def reset_device(torch):
+    '''Isolate cases: free cached blocks and restart allocator stats.'''
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+        torch.cuda.empty_cache()
+        torch.cuda.reset_peak_memory_stats()
+
+
+def roofline(result, spectflops, bandwidth, launch_us):
+    '''Add the arithmetic intensity, % of the attainable FLOPS and the
+       bound to a result with flops_per_op and bytes_per_op. A kernel
+       shorter than launch_us is launch-bound, the others are
+       bandwidth-bound below the ridge point of spectflops(TFLOPS) and
+       bandwidth(GB/s), and compute-bound above it.'''
+    if not result.get("bytes_per_op"):
+        return
+    kps = result["kernel_throughput(op/s)"]
+    intensity = result["flops_per_op"] / result["bytes_per_op"]
+    result["intensity(FLOP/B)"] = round(intensity, 3)
+
+    peak = float(spectflops) * 1E12
+    bandwidth = float(bandwidth or -1)
+    attainable = []
+    if peak > 0:
+        attainable.append(peak)
+    if bandwidth > 0:
+        attainable.append(intensity * bandwidth * 1E9)
+    if len(attainable) > 0 and min(attainable) > 0:
+        result["roofline(%)"] = round(
+            100.0 * kps * result["flops_per_op"] / min(attainable), 2)
+
+    if result["kerneltime(us)"] < launch_us:
+        result["bound"] = "launch"
+    elif peak > 0 and bandwidth > 0:
+        ridge = peak / (bandwidth * 1E9)
+        result["bound"] = "bandwidth" if intensity < ridge else "compute"
+    else:
+        result["bound"] = "unknown"
+
+
+def run_case(module, op_dir, op, dataformat, spectflops, oplib, shape, plan,
+             vendor):
+    '''Run a case in this process with the case_config overrides of shape,
+       return its result record.'''
+    import torch
+    from drivers import calculate
+
+    result = {
+        "operation": op,
+        "dataformat": dataformat,
+        "oplib": oplib,
+        "chip": plan["chip"],
+        "spectflops": spectflops,
+        "shape": shape,
+        "status": "success"
+    }
+    config = Namespace(vendor=vendor,
+                       case_name=op,
+                       spectflops=str(spectflops),
+                       spectbandwidth=str(plan.get("bandwidth") or -1),
+                       dataformat=dataformat,
+                       oplib=oplib,
+                       chip=plan["chip"],
+                       unknown_args=[])
+    calculate.RESULT_SINK = []
+    calculate.grad_outputs = None
+    calculate.LAST_STATS = None
+    calculate.LAST_BANDWIDTH = None
+    reset_device(torch)
+    start = time.time()
+    cwd = os.getcwd()
+    try:
+        case_config = load_case_config(op_dir, vendor, plan["chip"])
+        vars(case_config).update(shape)
+        os.chdir(op_dir)
+        print("[FlagPerf Sweep]" + op + ":" + dataformat + ":" + oplib +
+              " " + json.dumps(shape))
+        if oplib == "flaggems":
+            import flag_gems
+            with flag_gems.use_gems():
+                module.main(config, case_config)
+        else:
+            module.main(config, case_config)
+        if len(calculate.RESULT_SINK) == 0:
+            result["status"] = "no result"
+        else:
+            result.update(calculate.RESULT_SINK[-1])
+            roofline(result, spectflops, plan.get("bandwidth"),
+                     plan.get("launch_us", 10))
+        if torch.cuda.is_available():
+            result["max_memory_allocated(GiB)"] = round(
+                torch.cuda.max_memory_allocated() / 2**30, 3)
+    except Exception:
+        result["status"] = "failed"
+        result["error"] = traceback.format_exc().splitlines()[-1]
+        logger.error("Case " + op + ":" + dataformat + ":" + oplib +
+                     " failed:\n" + traceback.format_exc())
+    finally:
+        os.chdir(cwd)
+        calculate.RESULT_SINK = None
+        calculate.grad_outputs = None
+        reset_device(torch)
+    result["duration(s)"] = round(time.time() - start, 2)
+    result["timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S",
+                                        time.localtime())
+    return result
+
+
+def run_sweep(plan, vendor, perf_path, host_dir):
+    '''Run every case of plan, results are rewritten to sweep_result.json
+       after each case, so that a crash keeps the finished ones.'''
+    benchmarks_dir = os.path.join(perf_path, "benchmarks")
+    sys.path.insert(0, benchmarks_dir)
+    from drivers.utils import adapt_torch
+    adapt_torch(vendor)
+
+    ops = {}
+    for op, dataformats in plan["ops"].items():
+        if os.path.exists(
+                os.path.join(benchmarks_dir, op, vendor, plan["chip"],
+                             "case_config.yaml")):
+            ops[op] = dataformats
+        else:
+            logger.warning("Skip " + op + ", no case_config.yaml for " +
+                           vendor + " " + plan["chip"])
+
+    # all the cases of an op then reuse its cached correctness
+    from drivers.correctness import check_correctness
+    logger.info("Check correctness of " + str(len(ops)) + " ops")
+    check_correctness(list(ops))
+
+    result_path = os.path.join(host_dir, "sweep_result.json")
+    results = []
+    for op, dataformats in ops.items():
+        op_dir = os.path.join(benchmarks_dir, op)
+        try:
+            module = load_op_module(benchmarks_dir, op)
+        except Exception:
+            logger.error("Import " + op + " failed:\n" +
+                         traceback.format_exc())
+            continue
+
+        for dataformat in dataformats:
+            spectflops = plan["dataformats"][dataformat]
+            for oplib in plan["oplibs"]:
+                for shape in plan.get("shapes", {}).get(op, [{}]):
+                    logger.info("Run " + op + ":" + dataformat + ":" +
+                                oplib + " " + json.dumps(shape))
+                    results.append(
+                        run_case(module, op_dir, op, dataformat, spectflops,
+                                 oplib, shape, plan, vendor))
+                    with open(result_path, "w") as file:
+                        json.dump(results, file)
+    return results
+
+
+if __name__ == "__main__":
+    config = parse_args()
+
+    host_dir = os.path.join(
+        config.log_dir, "sweep",
+        config.host_addr + "_noderank" + str(config.node_rank))
+    logfile = os.path.join(host_dir, "sweep_main.log.txt")
+    logger.remove()
+    logger.add(logfile, level=config.log_level)
+    logger.add(sys.stderr, level=config.log_level)
+
+    logger.info(config)
+    write_pid_file(config.log_dir, "start_base_task.pid")
+
+    with open(config.plan, "r") as file:
+        plan = json.load(file)
+
+    exit_code = 0
+    # benchmarks print their [FlagPerf Result] lines like in container_main
+    with open(os.path.join(host_dir, "operation.log.txt"), "w") as f:
+        with contextlib.redirect_stdout(f):
+            try:
+                results = run_sweep(plan, config.vendor, config.perf_path,
+                                    host_dir)
+            except Exception:
+                logger.error(traceback.format_exc())
+                exit_code = 1
+    write_exit_file(config.log_dir, "start_base_task.pid", exit_code)
+    logger.info("Task Finish")
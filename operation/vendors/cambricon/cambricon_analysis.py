@@ -1,25 +1,17 @@
+from utils import monitor_log
+
+
 def analysis_log(logpath, config):
-    logfile = open(logpath)
+    # columns of a device line: temp, power, mem, max mem
+    values = monitor_log.read_device_log(logpath, config.NPROC_PER_NODE,
+                                         "C", [0, 1, 2, 3])
 
     result = {"temp": {}, "power": {}, "mem": {}}
     for mluID in range(config.NPROC_PER_NODE):
-        for monitor_index in result.keys():
-            result[monitor_index][mluID] = []
-
-    max_mem = None
-    next_mlu_id = 0
-
-    for line in logfile.readlines():
-        if "C" in line:
-            if max_mem is None:
-                max_mem = float(line.split(" ")[3])
-                result["max_mem"] = max_mem
-            temp = float(line.split(" ")[0][:-1])
-            power = float(line.split(" ")[1])
-            mem = float(line.split(" ")[2])
-            result["temp"][next_mlu_id].append(temp)
-            result["power"][next_mlu_id].append(power)
-            result["mem"][next_mlu_id].append(mem)
-            next_mlu_id = (next_mlu_id + 1) % config.NPROC_PER_NODE
+        result["temp"][mluID] = values[:, mluID, 0].tolist()
+        result["power"][mluID] = values[:, mluID, 1].tolist()
+        result["mem"][mluID] = values[:, mluID, 2].tolist()
+    if len(values) > 0:
+        result["max_mem"] = float(values[0, 0, 3])
 
     return result
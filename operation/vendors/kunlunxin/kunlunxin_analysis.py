@@ -1,25 +1,17 @@
+from utils import monitor_log
+
+
 def analysis_log(logpath, config):
-    logfile = open(logpath)
+    # columns of a device line: temp, power, mem, max mem
+    values = monitor_log.read_device_log(logpath, config.NPROC_PER_NODE,
+                                         "MiB", [0, 1, 2, 3])
 
     result = {"temp": {}, "power": {}, "mem": {}}
     for gpuID in range(config.NPROC_PER_NODE):
-        for monitor_index in result.keys():
-            result[monitor_index][gpuID] = []
-
-    max_mem = None
-    next_gpu_id = 0
-
-    for line in logfile.readlines():
-        if "MiB" in line:
-            if max_mem is None:
-                max_mem = float(line.split(" ")[3][:-3])
-                result["max_mem"] = max_mem
-            temp = float(line.split(" ")[0][:-1])
-            power = float(line.split(" ")[1][:-1])
-            mem = float(line.split(" ")[2][:-3])
-            result["temp"][next_gpu_id].append(temp)
-            result["power"][next_gpu_id].append(power)
-            result["mem"][next_gpu_id].append(mem)
-            next_gpu_id = (next_gpu_id + 1) % config.NPROC_PER_NODE
+        result["temp"][gpuID] = values[:, gpuID, 0].tolist()
+        result["power"][gpuID] = values[:, gpuID, 1].tolist()
+        result["mem"][gpuID] = values[:, gpuID, 2].tolist()
+    if len(values) > 0:
+        result["max_mem"] = float(values[0, 0, 3])
 
     return result
@@ -213,6 +213,15 @@ def parse_args():
                        required=False,
                        default='./logs/',
                        help='log path')
+    # metax_analysis tracks the running maximum of 'used/total' in the text
+    # log, so the log is text in both formats.
+    parse.add_argument('-f',
+                       type=str,
+                       metavar='[format]',
+                       required=False,
+                       default='text',
+                       choices=['text', 'binary'],
+                       help='text|binary, always writes text')
     args = parse.parse_args()
     return args
 
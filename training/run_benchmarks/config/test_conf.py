@@ -45,6 +45,9 @@ PIP_SOURCE = "https://pypi.tuna.tsinghua.edu.cn/simple"
 FLAGPERF_PATH = "/home/FlagPerf/training"
 # Set log path on the host here.
 FLAGPERF_LOG_PATH = FLAGPERF_PATH + "/result/"
+# Results of all runs are appended to FLAGPERF_LOG_PATH/results.db, or to
+# RESULT_DB.
+# RESULT_DB = FLAGPERF_LOG_PATH + "results.db"
 
 # Set log level. It should be 'debug', 'info', 'warning', or 'error'.
 FLAGPERF_LOG_LEVEL = 'debug'
@@ -54,6 +57,39 @@ FLAGPERF_LOG_LEVEL = 'debug'
 SHM_SIZE = "32G"
 # Clear cache config. Clean system cache before running testcase.
 CLEAR_CACHES = True
+# Format of system monitor logs, "text" or "binary"(.bin logs next to the text
+# log names, see utils/monitor_log.py). Vendor's monitor logs are text.
+MONITOR_FORMAT = "text"
+# Tag images as t_<VERSION>-<hash of docker_image/<framework>>, and snapshot
+# the container after installing a case's requirements and extensions, tagged
+# by a hash of them. Later rounds and cases with the same dependencies start
+# from the snapshot and skip the installation. Images are t_<VERSION> if
+# False. Old hash tagged images and snapshots are not removed, prune them
+# with docker rmi.
+CACHE_CASE_IMAGE = False
+# Keep one container per case across repeat rounds, only killing stray
+# processes in it between rounds. False starts a new container every round.
+REUSE_CONTAINER = False
+
+# Prepare the next case while the current case is running.
+# possible value of PIPELINE_PREPARE are:
+#   None: prepare every case after the last one finished.
+#   "image": pull base images of the next case's docker image in advance.
+# The next case runs on the hosts of the current one, so only docker pulls
+# run alongside the measured case. They still share the network and disk
+# bandwidth of its hosts. Building the image, starting containers and
+# installing requirements wait until the measured case finished.
+PIPELINE_PREPARE = None
+
+# Run independent cases at the same time on free hosts and accelerators.
+# Cases sharing a host see only their own accelerators through
+# ACCE_VISIBLE_DEVICE_ENV_NAME, and run without monitors and cache clearing.
+# Cases listed in EXCLUSIVE_CASES (case key or model name) and cases larger
+# than the cluster get the whole cluster. PIPELINE_PREPARE is ignored.
+CASE_PACKING = False
+# Accelerators of each host in the cluster, used by CASE_PACKING.
+DEVICES_PER_HOST = 8
+EXCLUSIVE_CASES = []
 
 # Set the case dict you want to run here.
 '''
@@ -240,6 +240,8 @@ def main():
 
     for proc in processes:
         proc.wait()
+    helper.write_exit_file(task_args.log_dir, "start_paddle_task.pid",
+                           processes)
 
     START_LOGGER.stop()
 
@@ -192,6 +192,8 @@ def main():
 
     for proc in processes:
         proc.wait()
+    helper.write_exit_file(task_args.log_dir, "start_pytorch_task.pid",
+                           processes)
 
     START_LOGGER.stop()
     # check the return code of each process
@@ -7,8 +7,11 @@
 
 import os
 import sys
+import json
 import time
 import getpass
+import threading
+import queue
 from config import cluster_conf as cc
 from config import test_conf as tc
 
@@ -18,10 +21,13 @@ sys.path.append(os.path.abspath(os.path.join(CURR_PATH, "../../")))
 from utils import cluster_manager
 from utils import flagperf_logger
 from utils import image_manager
+from utils import case_scheduler
+from utils import result_store
 
 VERSION = "v0.1"
 RUN_LOGGER = flagperf_logger.FlagPerfLogger()
 CLUSTER_MGR = cluster_manager.ClusterManager()
+IMAGE_LOCK = threading.Lock()
 
 
 def usage():
@@ -155,6 +161,24 @@ def prepare_docker_image_cluster(dp_path, image_mgr, framework, nnodes):
     return True
 
 
+def prefetch_docker_image_cluster(dp_path, image_mgr, framework, nnodes):
+    '''Pull base images of the docker image in the cluster, without building
+       it. Return whether the image exists on all the hosts already.
+    '''
+    image_vendor_dir = os.path.join(
+        CURR_PATH, "../" + tc.VENDOR + "/docker_image/" + framework)
+    prefetch_cmd = "cd " + dp_path + " && " + sys.executable \
+                   + " ../utils/image_manager.py -o prefetch -i " \
+                   + image_mgr.repository + " -t " + image_mgr.tag \
+                   + " -d " + image_vendor_dir
+    timeout = 1200
+    RUN_LOGGER.debug("Run cmd in the cluster to prefetch docker image: " +
+                     prefetch_cmd + " timeout=" + str(timeout))
+    bad_hosts = CLUSTER_MGR.run_command_some_hosts(prefetch_cmd, nnodes,
+                                                   timeout)
+    return len(bad_hosts) == 0
+
+
 def prepare_running_env(dp_path, container_name, case_config):
     '''Install extensions and setup env before start task in container.
     '''
@@ -181,6 +205,32 @@ def prepare_running_env(dp_path, container_name, case_config):
     return True
 
 
+def check_image_in_cluster(dp_path, image_mgr, nnodes):
+    '''Return whether the image exists on all the hosts of the case.'''
+    exist_cmd = "cd " + dp_path + " && " + sys.executable \
+                + " ../utils/image_manager.py -o exist -i " \
+                + image_mgr.repository + " -t " + image_mgr.tag
+    bad_hosts = CLUSTER_MGR.run_command_some_hosts(exist_cmd, nnodes, 30,
+                                                   no_log=True)
+    return len(bad_hosts) == 0
+
+
+def commit_container_in_cluster(dp_path, image_mgr, container_name, nnodes):
+    '''Commit containers as image_mgr's image in the cluster.'''
+    commit_cmd = "cd " + dp_path + " && " + sys.executable \
+                 + " ../utils/image_manager.py -o commit -i " \
+                 + image_mgr.repository + " -t " + image_mgr.tag \
+                 + " -c " + container_name
+    RUN_LOGGER.debug("Run cmd in the cluster to commit container: " +
+                     commit_cmd)
+    bad_hosts = CLUSTER_MGR.run_command_some_hosts(commit_cmd, nnodes, 600)
+    if len(bad_hosts) != 0:
+        RUN_LOGGER.warning("Hosts that can't commit container: " +
+                           ",".join(bad_hosts.keys()))
+        return False
+    return True
+
+
 def start_container_in_cluster(dp_path, run_args, container_name, image_name,
                                nnodes):
     '''Call CLUSTER_MGR tool to start containers.'''
@@ -215,6 +265,22 @@ def stop_container_in_cluster(dp_path, container_name, nnodes):
     return True
 
 
+def reset_container_in_cluster(dp_path, container_name, nnodes):
+    '''Kill processes left by the last round in the warm containers.'''
+    kill_cmd = "cd " + dp_path + " && " + sys.executable \
+               + " ../utils/container_manager.py -o killall" \
+               + " -c " + container_name
+    RUN_LOGGER.debug("Run cmd to reset container(s) in the cluster:" +
+                     kill_cmd)
+    failed_hosts = CLUSTER_MGR.run_command_some_hosts(kill_cmd, nnodes, 60)
+    if len(failed_hosts) != 0:
+        RUN_LOGGER.warning("Hosts that reset container " + container_name +
+                           " failed:" + ",".join(failed_hosts.keys()) +
+                           " Continue.")
+        return False
+    return True
+
+
 def clear_caches_cluster(clear, nnodes):
     '''Set vm.drop to clean the system caches.'''
     if not clear:
@@ -235,7 +301,8 @@ def clear_caches_cluster(clear, nnodes):
 
 def start_monitors_in_cluster(dp_path, case_log_dir, nnodes):
     '''Start sytem and vendor's monitors.'''
-    start_mon_cmd = "cd " + dp_path + " && " + sys.executable + " ../utils/sys_monitor.py -o restart -v " + tc.VENDOR + " -l "
+    start_mon_cmd = "cd " + dp_path + " && " + sys.executable + " ../utils/sys_monitor.py -o restart -v " + tc.VENDOR \
+                    + " -f " + getattr(tc, "MONITOR_FORMAT", "text") + " -l "
     timeout = 60
     RUN_LOGGER.debug("Run cmd in the cluster to start system monitors: " +
                      start_mon_cmd)
@@ -284,9 +351,15 @@ def stop_monitors_in_cluster(dp_path, nnodes):
                          ",".join(bad_hosts.keys()))
 
 
-def start_tasks_in_cluster(dp_path, container_name, case_config, base_args,
-                           count, curr_log_path):
-    '''Start tasks in cluster, and NOT wait.'''
+def start_tasks_in_cluster(dp_path,
+                           container_name,
+                           case_config,
+                           base_args,
+                           count,
+                           curr_log_path,
+                           visible_devices=None):
+    '''Start tasks in cluster, and NOT wait. If visible_devices is set, tasks
+       only see these accelerators.'''
     nnodes = case_config["nnodes"]
     framework_sub_path = case_config["framework"]
     if "_" in framework_sub_path:
@@ -296,10 +369,15 @@ def start_tasks_in_cluster(dp_path, container_name, case_config, base_args,
         case_config["model"] + "-" + framework_sub_path,
         "config/environment_variables.sh")
     framework = case_config["framework"].split("_")[0]
+    visible_env = ""
+    if visible_devices is not None:
+        visible_env = "export " + tc.ACCE_VISIBLE_DEVICE_ENV_NAME + "=" \
+                      + visible_devices + " && "
     if (os.path.isfile(env_file)):
         start_cmd = "cd " + dp_path + " && " + sys.executable \
                 + " ../utils/container_manager.py -o runcmdin -c " \
-                + container_name + " -d -r \"source " + env_file \
+                + container_name + " -d -r \"" + visible_env \
+                + "source " + env_file \
                 + " > " + curr_log_path + "/source_env.log.txt " \
                 + "2>&1 && " \
                 + "python3 " + tc.FLAGPERF_PATH + "/run_benchmarks/" \
@@ -308,43 +386,58 @@ def start_tasks_in_cluster(dp_path, container_name, case_config, base_args,
     else:
         start_cmd = "cd " + dp_path + " && " + sys.executable \
                 + " ../utils/container_manager.py -o runcmdin -c " \
-                + container_name + " -d -r \"" \
+                + container_name + " -d -r \"" + visible_env \
                 + "python3 " + tc.FLAGPERF_PATH + "/run_benchmarks/" \
                 + framework + "/start_" + framework + "_task.py " \
                 + base_args + " --round " + str(count)
-    if tc.ACCE_VISIBLE_DEVICE_ENV_NAME is not None:
+    if tc.ACCE_VISIBLE_DEVICE_ENV_NAME is not None and visible_devices is None:
         start_cmd += " --visible_dev_env " \
                      + tc.ACCE_VISIBLE_DEVICE_ENV_NAME
     start_cmd += " \""
     RUN_LOGGER.debug("Run cmd in the cluster to start tasks, cmd=" + start_cmd)
     CLUSTER_MGR.run_command_some_hosts_distribution_info(start_cmd, nnodes, 15, "training")
-    # Wait a moment for starting tasks.
-    time.sleep(60)
+
+
+def remove_pid_file_in_cluster(dp_path, pid_file_path, nnodes):
+    '''Remove pid file and exit file of the last task, so that they won't
+       be waited for again.
+    '''
+    rm_cmd = "cd " + dp_path + " && rm -f " + pid_file_path + " " \
+             + pid_file_path + ".exit"
+    RUN_LOGGER.debug("Run cmd in the cluster to remove old pid file: " + rm_cmd)
+    CLUSTER_MGR.run_command_some_hosts(rm_cmd, nnodes, 10)
 
 
 def wait_for_finish(dp_path, container_name, pid_file_path, nnodes):
     '''wait all the processes of start_xxx_task.py finished.
+       Each host blocks until its task exits and reports the exit code.
+       Return hosts whose task exits with non-zero code.
     '''
-    # Aussme pid of start_xxx_task.py won't loop in a short time.
-    check_cmd = "cd " + dp_path + "; " + sys.executable \
-                + " ../utils/container_manager.py -o pidrunning -c " \
-                + container_name + " -f " + pid_file_path
-
-    RUN_LOGGER.debug(
-        "Run cmd to check whether the training tasks is running: " + check_cmd)
-    while True:
-        bad_hosts = CLUSTER_MGR.run_command_some_hosts(check_cmd,
+    wait_cmd = "cd " + dp_path + "; " + sys.executable \
+               + " ../utils/container_manager.py -o waitpid -c " \
+               + container_name + " -f " + pid_file_path
+
+    RUN_LOGGER.debug("Run cmd to wait for the tasks finished: " + wait_cmd)
+    # ssh exits with 255 if the connection is lost, wait again in that case.
+    for _ in range(3):
+        bad_hosts = CLUSTER_MGR.run_command_some_hosts(wait_cmd,
                                                        nnodes,
+                                                       timeout=None,
                                                        no_log=True)
-        if len(bad_hosts) == nnodes:
+        lost_hosts = [host for host in bad_hosts if bad_hosts[host] == 255]
+        if len(lost_hosts) == 0:
             break
-        time.sleep(10)
+        RUN_LOGGER.warning("Lost connection to hosts while waiting for tasks: " +
+                           ",".join(lost_hosts) + ". Wait again.")
+    for host in bad_hosts:
+        RUN_LOGGER.warning("Task on host " + host + " exit with: " +
+                           str(bad_hosts[host]))
+    return bad_hosts
 
 
-def prepare_containers_env_cluster(dp_path, case_log_dir, container_name,
-                                   image_name, case_config):
-    '''Prepare containers environments in the cluster. It will start
-       containers, setup environments, start monitors, and clear caches.'''
+def start_containers_env_cluster(dp_path, container_name, image_name,
+                                 case_config):
+    '''Start containers and setup environments in the cluster.'''
     nnodes = case_config["nnodes"]
     container_start_args = " --rm --init --detach --net=host --uts=host" \
                            + " --ipc=host --security-opt=seccomp=unconfined" \
@@ -361,9 +454,18 @@ def prepare_containers_env_cluster(dp_path, case_log_dir, container_name,
     if tc.ACCE_CONTAINER_OPT is not None:
         container_start_args += " " + tc.ACCE_CONTAINER_OPT
 
+    # Start from the snapshot with dependencies installed if there is one.
+    deps_image_mgr = None
+    if getattr(tc, "CACHE_CASE_IMAGE", False):
+        deps_image_mgr = get_case_deps_image(image_name, case_config)
+    deps_cached = deps_image_mgr is not None and check_image_in_cluster(
+        dp_path, deps_image_mgr, nnodes)
+    if deps_cached:
+        image_name = deps_image_mgr.repository + ":" + deps_image_mgr.tag
+
     RUN_LOGGER.info("a) Stop old container(s) first.")
     stop_container_in_cluster(dp_path, container_name, nnodes)
-    RUN_LOGGER.info("b) Start container(s) in the cluster.")
+    RUN_LOGGER.info("b) Start container(s) in the cluster: " + image_name)
     if not start_container_in_cluster(dp_path, container_start_args,
                                       container_name, image_name, nnodes):
         RUN_LOGGER.error("b) Start container in the cluster......"
@@ -371,6 +473,9 @@ def prepare_containers_env_cluster(dp_path, case_log_dir, container_name,
         return False
     RUN_LOGGER.info("b) Start container(s) in the cluster.......[SUCCESS]")
 
+    if deps_cached:
+        RUN_LOGGER.info("c) Running environment cached in image, skip.")
+        return True
     RUN_LOGGER.info("c) Prepare running environment.")
     if not prepare_running_env(dp_path, container_name, case_config):
         RUN_LOGGER.error("c) Prepare running environment......"
@@ -379,6 +484,37 @@ def prepare_containers_env_cluster(dp_path, case_log_dir, container_name,
         stop_container_in_cluster(dp_path, container_name, nnodes)
         return False
     RUN_LOGGER.info("c) Prepare running environment......[SUCCESS]")
+    if deps_image_mgr is not None:
+        RUN_LOGGER.info("c) Snapshot running environment as " +
+                        deps_image_mgr.repository + ":" + deps_image_mgr.tag)
+        commit_container_in_cluster(dp_path, deps_image_mgr, container_name,
+                                    nnodes)
+    return True
+
+
+def prepare_containers_env_cluster(dp_path,
+                                   case_log_dir,
+                                   container_name,
+                                   image_name,
+                                   case_config,
+                                   prewarmed=False,
+                                   exclusive=True):
+    '''Prepare containers environments in the cluster. It will start
+       containers, setup environments, start monitors, and clear caches.
+       If containers are prewarmed or kept warm from the last round, only
+       kill stray processes in them, start monitors and clear caches.
+       Monitors and caches are host wide, so they are skipped when the
+       case shares hosts with others.'''
+    nnodes = case_config["nnodes"]
+    if prewarmed:
+        RUN_LOGGER.info("a)-c) Container(s) warm, kill stray processes.")
+        reset_container_in_cluster(dp_path, container_name, nnodes)
+    elif not start_containers_env_cluster(dp_path, container_name, image_name,
+                                          case_config):
+        return False
+    if not exclusive:
+        RUN_LOGGER.info("d)-e) Hosts shared, skip monitors and caches.")
+        return True
     RUN_LOGGER.info("d) Start monitors......")
     start_monitors_in_cluster(dp_path, case_log_dir, nnodes)
     RUN_LOGGER.info("e) Clear system caches if it set......")
@@ -386,17 +522,79 @@ def prepare_containers_env_cluster(dp_path, case_log_dir, container_name,
     return True
 
 
-def clean_containers_env_cluster(dp_path, container_name, nnodes):
+class CasePrefetcher():
+    '''Pull base images of the next case in a background thread while the
+       current case is running. The next case runs on the hosts of the
+       current one, so building images, starting containers and installing
+       requirements would compete with the measured run for cpu and disk,
+       and wait until it finishes. Pulls still share the network and disk
+       bandwidth of the hosts.
+    '''
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.case = None
+        self.thread = None
+        self.image_ready = False
+        self.cost = 0.0
+        self.saved = 0.0
+
+    def start(self, dp_path, case, case_config, image_mgr, skip_image):
+        '''Start to prefetch images of case in background.'''
+        self.case = case
+        self.image_ready = False
+        self.cost = 0.0
+
+        def _prefetch():
+            start_time = time.time()
+            RUN_LOGGER.info("Prefetch for next case " + case + " starts.")
+            self.image_ready = skip_image or prefetch_docker_image_cluster(
+                dp_path, image_mgr, case_config["framework"],
+                case_config["nnodes"])
+            self.cost = time.time() - start_time
+            RUN_LOGGER.info("Prefetch for next case " + case +
+                            " finished in " + str(round(self.cost, 1)) + "s.")
+
+        self.thread = threading.Thread(target=_prefetch, daemon=True)
+        self.thread.start()
+
+    def wait(self, case):
+        '''Wait for the prefetch of case finished.
+           Return whether its image is ready.
+        '''
+        if self.thread is None or self.case != case:
+            return False
+        wait_start = time.time()
+        self.thread.join()
+        waited = time.time() - wait_start
+        self.saved += max(0.0, self.cost - waited)
+        self.thread = None
+        return self.image_ready
+
+
+def clean_containers_env_cluster(dp_path,
+                                 container_name,
+                                 nnodes,
+                                 exclusive=True,
+                                 keep_container=False):
     '''Clean containers environments in the cluster. It will stop containers,
-       and stop monitors.'''
-    RUN_LOGGER.info("a) Stop containers......")
-    stop_container_in_cluster(dp_path, container_name, nnodes)
+       and stop monitors. With keep_container, containers are kept warm for
+       the next round.'''
+    if keep_container:
+        RUN_LOGGER.info("a) Keep containers for the next round......")
+    else:
+        RUN_LOGGER.info("a) Stop containers......")
+        stop_container_in_cluster(dp_path, container_name, nnodes)
+    if not exclusive:
+        return
     RUN_LOGGER.info("b) Stop monitors......")
     stop_monitors_in_cluster(dp_path, nnodes)
 
 
-def collect_and_merge_logs(curr_log_path, cases):
+def collect_and_merge_logs(curr_log_path, cases, case_hosts=None):
     '''Scp logs from hosts in the cluster to temp dir, and then merge all.
+       case_hosts maps cases to the hosts they ran on, if not the first
+       nnodes hosts.
     '''
     get_all = True
     RUN_LOGGER.info("Collect logs in cluster.")
@@ -408,10 +606,12 @@ def collect_and_merge_logs(curr_log_path, cases):
             RUN_LOGGER.debug("Case " + case + ", round " + str(i) +
                              ", log dir: " + case_log_dir)
             nnodes = case_config["nnodes"]
-            failed_hosts = CLUSTER_MGR.collect_files_some_hosts(curr_log_path,
-                                                                curr_log_path,
-                                                                nnodes,
-                                                                timeout=600)
+            hosts = CLUSTER_MGR.hosts
+            if case_hosts is not None and case in case_hosts:
+                hosts = case_hosts[case]
+            with CLUSTER_MGR.use_hosts(hosts):
+                failed_hosts = CLUSTER_MGR.collect_files_some_hosts(
+                    curr_log_path, curr_log_path, nnodes, timeout=600)
             if len(failed_hosts) != 0:
                 RUN_LOGGER.error("Case " + case + ", round " + str(i) +
                                  ", log dir: " + case_log_dir +
@@ -462,6 +662,43 @@ def get_config_from_case(case):
     return True, case_config
 
 
+def get_case_image_and_container(case_config):
+    '''Return image manager and container name of the case.'''
+    image_vendor_dir = os.path.join(
+        CURR_PATH, "../" + tc.VENDOR + "/docker_image/" +
+        case_config["framework"])
+    image_tag = "t_" + VERSION
+    # Tag the image by its dockerfile dir, so that changes are rebuilt.
+    if getattr(tc, "CACHE_CASE_IMAGE", False):
+        image_tag += "-" + image_manager.content_hash([image_vendor_dir])
+    image_mgr = image_manager.ImageManager(
+        "flagperf-" + tc.VENDOR + "-" + case_config["framework"], image_tag)
+    container_name = image_mgr.repository + "-" + image_mgr.tag \
+                                          + "-container"
+    return image_mgr, container_name
+
+
+def get_case_deps_image(image_name, case_config):
+    '''Return image manager of the snapshot with the case's requirements and
+       extensions installed on top of image_name, or None if the case has
+       nothing to install.'''
+    framework_name = case_config["framework"].split("_")[0]
+    vend_model_path = os.path.join(
+        CURR_PATH, "../" + tc.VENDOR + "/" + case_config["model"] + "-" +
+        framework_name)
+    deps_paths = [
+        os.path.join(vend_model_path, "config/requirements.txt"),
+        os.path.join(vend_model_path, "csrc")
+    ]
+    if not any(os.path.exists(path) for path in deps_paths):
+        return None
+    deps_paths.append(
+        os.path.join(vend_model_path, "config/environment_variables.sh"))
+    repository, tag = image_name.rsplit(":", 1)
+    return image_manager.ImageManager(
+        repository, tag + "-" + image_manager.content_hash(deps_paths))
+
+
 def get_valid_cases():
     '''Check case config in test_conf, return valid cases list.'''
     if not isinstance(tc.CASES, dict):
@@ -488,6 +725,252 @@ def get_valid_cases():
     return valid_cases
 
 
+def run_case(case,
+             case_index,
+             cases,
+             dp_path,
+             curr_log_path,
+             timestamp_log_dir,
+             prefetcher=None,
+             placement=None):
+    '''Prepare and run all the rounds of a testcase. With placement, the
+       case runs on placement.hosts and devices, alongside other cases.'''
+    RUN_LOGGER.info("======= Testcase: " + case + " =======")
+    rets, case_config = get_config_from_case(case)
+    pipeline_mode = None if prefetcher is None else prefetcher.mode
+    shared = placement is not None and not placement.exclusive
+
+    # Prepare docker image.
+    image_mgr, container_name = get_case_image_and_container(case_config)
+    if placement is not None:
+        container_name += "-slot" + str(placement.slot)
+    image_name = image_mgr.repository + ":" + image_mgr.tag
+    nnodes = case_config["nnodes"]
+    image_ready = False
+    if prefetcher is not None:
+        image_ready = prefetcher.wait(case)
+    RUN_LOGGER.info("=== 2.1 Prepare docker image:" + image_name + " ===")
+    if image_ready:
+        RUN_LOGGER.info("=== 2.1 Docker image prefetched. ===")
+    else:
+        # Packed cases may build the same image on a host at the same time.
+        with IMAGE_LOCK:
+            image_ready = prepare_docker_image_cluster(
+                dp_path, image_mgr, case_config["framework"], nnodes)
+    if not image_ready:
+        RUN_LOGGER.error("=== 2.1 Prepare docker image...[FAILED] " +
+                         "Ignore this case " + case + " ===")
+        return
+
+    # Prepare the next case while this case is running.
+    if pipeline_mode is not None and case_index + 1 < len(cases):
+        next_case = cases[case_index + 1]
+        _, next_case_config = get_config_from_case(next_case)
+        next_image_mgr, _ = get_case_image_and_container(next_case_config)
+        prefetcher.start(dp_path, next_case, next_case_config,
+                         next_image_mgr,
+                         next_image_mgr.repository == image_mgr.repository)
+
+    # Set command to start train script in container in the cluster
+    log_dir_container = os.path.join(tc.FLAGPERF_LOG_PATH, timestamp_log_dir)
+    hosts = cc.HOSTS
+    master_port = cc.MASTER_PORT
+    visible_devices = None
+    if placement is not None:
+        hosts = placement.hosts
+        master_port = str(int(cc.MASTER_PORT) + placement.slot)
+    if shared:
+        # Cases sharing a host must not share pid files.
+        log_dir_container = os.path.join(log_dir_container,
+                                         "slot" + str(placement.slot))
+        visible_devices = placement.devices_str()
+        RUN_LOGGER.info("Case " + case + " runs on hosts " + ",".join(hosts) +
+                        " devices " + visible_devices + ", logs in " +
+                        log_dir_container)
+    base_args = " --vendor " + tc.VENDOR + " --case_name " + case \
+                + " --model_name " + case_config["model"] \
+                + " --train_script " + "run_pretraining.py" \
+                + " --nnodes " + str(nnodes) \
+                + " --nproc " + str(case_config["nproc"]) \
+                + " --hosts " + ",".join(hosts) \
+                + " --hosts_ports " + ",".join(cc.HOSTS_PORTS) \
+                + " --data_dir " + case_config["data_dir_container"] \
+                + " --log_dir " + log_dir_container \
+                + " --log_level " + tc.FLAGPERF_LOG_LEVEL \
+                + " --extern_config_file " + case_config["config"] \
+                + ".py" + " --enable_extern_config " \
+                + " --master_port " + master_port
+    RUN_LOGGER.info("=== 2.2 Prepare case config in cluster. ===")
+    if not prepare_case_config_cluster(dp_path, case_config, case):
+        RUN_LOGGER.warning("Prepare case config in cluster...[FAILED]. " +
+                           "Ignore case " + case)
+        return
+    RUN_LOGGER.info("=== 2.3 Setup container and run testcases. ===")
+    reuse_container = getattr(tc, "REUSE_CONTAINER", False)
+    warm = False
+    for count in range(1, case_config["repeat"] + 1):
+        RUN_LOGGER.info("-== Testcase " + case + " Round " + str(count) +
+                        " starts ==-")
+        RUN_LOGGER.info("1) Prepare container environments in cluster...")
+        case_log_dir = os.path.join(curr_log_path, case, "round" + str(count))
+        if not prepare_containers_env_cluster(
+                dp_path, case_log_dir, container_name, image_name,
+                case_config, warm, not shared):
+            RUN_LOGGER.error("1) Prepare container environments in cluster"
+                             "...[FAILED]. Ignore case " + case + " round " +
+                             str(count))
+            warm = False
+            continue
+        warm = reuse_container and count < case_config["repeat"]
+        RUN_LOGGER.info("2) Start tasks in the cluster...")
+        pid_file_path = os.path.join(
+            log_dir_container, "start_" +
+            case_config["framework"].split("_")[0] + "_task.pid")
+        remove_pid_file_in_cluster(dp_path, pid_file_path, nnodes)
+        start_tasks_in_cluster(dp_path, container_name, case_config,
+                               base_args, count, curr_log_path,
+                               visible_devices)
+
+        # Wait until start_xxx_task.py finished.
+        RUN_LOGGER.info("3) Waiting for tasks end in the cluster...")
+        wait_for_finish(dp_path, container_name, pid_file_path, nnodes)
+        RUN_LOGGER.info("3) Training tasks end in the cluster...")
+        append_round_results(
+            dp_path, case, case_config,
+            os.path.join(log_dir_container, case, "round" + str(count)),
+            hosts, count, timestamp_log_dir)
+        RUN_LOGGER.info("4) Clean container environments in cluster...")
+        clean_containers_env_cluster(dp_path, container_name, nnodes,
+                                     not shared, warm)
+        RUN_LOGGER.info("-== Testcase " + case + " Round " + str(count) +
+                        " finished ==-")
+    RUN_LOGGER.info("=== 2.3 Setup container and run testcases finished."
+                    " ===")
+
+
+def parse_round_logs(host_log_dir):
+    '''Metrics of a host in a round: the FINISHED info logged by each rank of
+       the train script, and its [FlagPerf Result] lines, grouped by rank.'''
+    flagperf_lines = []
+    finished = {}
+    for log_name in sorted(os.listdir(host_log_dir)):
+        if not (log_name.startswith("rank") and log_name.endswith(".out.log")):
+            continue
+        rank = log_name[len("rank"):-len(".out.log")]
+        with open(os.path.join(host_log_dir, log_name), "r") as log_file:
+            for line in log_file:
+                if "[FlagPerf Result]" in line:
+                    flagperf_lines.append(line.strip())
+                elif "[PerfLog]" in line and '"FINISHED"' in line:
+                    try:
+                        message = json.loads(line.split("[PerfLog]", 1)[1])
+                    except ValueError:
+                        continue
+                    finished[rank] = message.get("value")
+    metrics = result_store.parse_flagperf_lines(flagperf_lines)
+    for rank, value in finished.items():
+        if isinstance(value, dict):
+            metrics.setdefault("ranks", {}).setdefault(rank, {}).update(value)
+    return metrics
+
+
+def append_round_results(dp_path, case, case_config, task_log_dir, hosts,
+                         count, timestamp_log_dir):
+    '''Collect the logs of a round from its hosts, and append one record per
+       host to the result store.'''
+    nnodes = case_config["nnodes"]
+    failed_hosts = CLUSTER_MGR.collect_files_some_hosts(task_log_dir,
+                                                        task_log_dir, nnodes,
+                                                        timeout=600)
+    if len(failed_hosts) != 0:
+        RUN_LOGGER.warning("Collect logs of round " + str(count) +
+                           " failed on hosts: " + ",".join(failed_hosts))
+    records = []
+    for noderank, host in enumerate(hosts[0:nnodes]):
+        host_log_dir = os.path.join(task_log_dir,
+                                    host + "_noderank" + str(noderank))
+        if not os.path.isdir(host_log_dir):
+            continue
+        metrics = parse_round_logs(host_log_dir)
+        if len(metrics) == 0:
+            RUN_LOGGER.warning("No results of case " + case + " round " +
+                               str(count) + " on host " + host)
+            continue
+        records.append(
+            result_store.make_record("training",
+                                     case_config["model"],
+                                     tc.VENDOR,
+                                     metrics,
+                                     chip=case.split(":")[2],
+                                     host=host,
+                                     round_index=count,
+                                     run_id=timestamp_log_dir,
+                                     config={
+                                         "case": case,
+                                         "framework": case_config["framework"],
+                                         "config": case_config["config"]
+                                     }))
+    if len(records) == 0:
+        return
+    result_store.append_records(
+        os.path.join(dp_path, result_store.store_path(tc)), records,
+        RUN_LOGGER)
+
+
+def run_cases_packed(cases, dp_path, curr_log_path, timestamp_log_dir):
+    '''Run cases at the same time on free hosts and devices of the cluster.
+       Cases in EXCLUSIVE_CASES get the whole cluster. Return hosts of each
+       case.'''
+    devices_per_host = getattr(tc, "DEVICES_PER_HOST", 8)
+    pool = case_scheduler.ResourcePool(cc.HOSTS, devices_per_host)
+    if tc.ACCE_VISIBLE_DEVICE_ENV_NAME is None:
+        RUN_LOGGER.warning("ACCE_VISIBLE_DEVICE_ENV_NAME is not set, cases "
+                           "can't share hosts.")
+    exclusive_cases = getattr(tc, "EXCLUSIVE_CASES", [])
+    pending = list(enumerate(cases))
+    finished = queue.Queue()
+    case_hosts = {}
+    running = 0
+
+    def _run_placed(case_index, case, placement):
+        try:
+            with CLUSTER_MGR.use_hosts(placement.hosts):
+                run_case(case, case_index, cases, dp_path, curr_log_path,
+                         timestamp_log_dir, placement=placement)
+        finally:
+            finished.put(placement)
+
+    while len(pending) > 0 or running > 0:
+        for case_index, case in list(pending):
+            _, case_config = get_config_from_case(case)
+            exclusive = case in exclusive_cases \
+                        or case_config["model"] in exclusive_cases
+            nproc = case_config["nproc"]
+            if tc.ACCE_VISIBLE_DEVICE_ENV_NAME is None:
+                nproc = devices_per_host
+            placement = pool.acquire(case_config["nnodes"], nproc, exclusive)
+            if placement is None:
+                # Don't let later cases starve an exclusive one.
+                if exclusive or not pool.fits(case_config["nnodes"], nproc):
+                    break
+                continue
+            pending.remove((case_index, case))
+            case_hosts[case] = placement.hosts
+            running += 1
+            RUN_LOGGER.info("Schedule case " + case + " on hosts " +
+                            ",".join(placement.hosts) + " devices " +
+                            placement.devices_str() +
+                            (" exclusively" if placement.exclusive else ""))
+            threading.Thread(target=_run_placed,
+                             args=(case_index, case, placement),
+                             daemon=True).start()
+        if running == 0:
+            continue
+        pool.release(finished.get())
+        running -= 1
+    return case_hosts
+
+
 def print_welcome_msg():
     '''Print colorful welcome message to console.'''
     print("\033[1;34;40m==============================================\033[0m")
@@ -565,85 +1048,34 @@ def main():
 
     RUN_LOGGER.info("========= Step 2: Prepare and Run test cases. =========")
 
-    for case in cases:
-        RUN_LOGGER.info("======= Testcase: " + case + " =======")
-        rets, case_config = get_config_from_case(case)
-
-        # Prepare docker image.
-        image_mgr = image_manager.ImageManager(
-            "flagperf-" + tc.VENDOR + "-" + case_config["framework"],
-            "t_" + VERSION)
-        image_name = image_mgr.repository + ":" + image_mgr.tag
-        nnodes = case_config["nnodes"]
-        RUN_LOGGER.info("=== 2.1 Prepare docker image:" + image_name + " ===")
-        if not prepare_docker_image_cluster(dp_path, image_mgr,
-                                            case_config["framework"], nnodes):
-            RUN_LOGGER.error("=== 2.1 Prepare docker image...[FAILED] " +
-                             "Ignore this case " + case + " ===")
-            continue
-
-        # Set command to start docker container in the cluster
-        container_name = image_mgr.repository + "-" + image_mgr.tag \
-                                              + "-container"
-
-        # Set command to start train script in container in the cluster
-        log_dir_container = os.path.join(tc.FLAGPERF_LOG_PATH,
-                                         timestamp_log_dir)
-        base_args = " --vendor " + tc.VENDOR + " --case_name " + case \
-                    + " --model_name " + case_config["model"] \
-                    + " --train_script " + "run_pretraining.py" \
-                    + " --nnodes " + str(nnodes) \
-                    + " --nproc " + str(case_config["nproc"]) \
-                    + " --hosts " + ",".join(cc.HOSTS) \
-                    + " --hosts_ports " + ",".join(cc.HOSTS_PORTS) \
-                    + " --data_dir " + case_config["data_dir_container"] \
-                    + " --log_dir " + log_dir_container \
-                    + " --log_level " + tc.FLAGPERF_LOG_LEVEL \
-                    + " --extern_config_file " + case_config["config"] \
-                    + ".py" + " --enable_extern_config " \
-                    + " --master_port " + cc.MASTER_PORT
-        RUN_LOGGER.info("=== 2.2 Prepare case config in cluster. ===")
-        if not prepare_case_config_cluster(dp_path, case_config, case):
-            RUN_LOGGER.warning("Prepare case config in cluster...[FAILED]. " +
-                               "Ignore case " + case)
-            continue
-        RUN_LOGGER.info("=== 2.3 Setup container and run testcases. ===")
-        for count in range(1, case_config["repeat"] + 1):
-            RUN_LOGGER.info("-== Testcase " + case + " Round " + str(count) +
-                            " starts ==-")
-            RUN_LOGGER.info("1) Prepare container environments in cluster...")
-            case_log_dir = os.path.join(curr_log_path, case,
-                                        "round" + str(count))
-            if not prepare_containers_env_cluster(dp_path, case_log_dir,
-                                                  container_name, image_name,
-                                                  case_config):
-                RUN_LOGGER.error("1) Prepare container environments in cluster"
-                                 "...[FAILED]. Ignore case " + case +
-                                 " round " + str(count))
-                continue
-            RUN_LOGGER.info("2) Start tasks in the cluster...")
-            start_tasks_in_cluster(dp_path, container_name, case_config,
-                                   base_args, count, curr_log_path)
-
-            # Wait until start_xxx_task.py finished.
-            RUN_LOGGER.info("3) Waiting for tasks end in the cluster...")
-            pid_file_path = os.path.join(
-                log_dir_container, "start_" +
-                case_config["framework"].split("_")[0] + "_task.pid")
-            wait_for_finish(dp_path, container_name, pid_file_path, nnodes)
-            RUN_LOGGER.info("3) Training tasks end in the cluster...")
-            RUN_LOGGER.info("4) Clean container environments in cluster...")
-            clean_containers_env_cluster(dp_path, container_name, nnodes)
-            RUN_LOGGER.info("-== Testcase " + case + " Round " + str(count) +
-                            " finished ==-")
-        RUN_LOGGER.info("=== 2.3 Setup container and run testcases finished."
-                        " ===")
+    pipeline_mode = getattr(tc, "PIPELINE_PREPARE", None)
+    if pipeline_mode == "container":
+        RUN_LOGGER.warning("PIPELINE_PREPARE \"container\" would start "
+                           "containers on the hosts of the running case, "
+                           "only images are prefetched.")
+        pipeline_mode = "image"
+    case_hosts = None
+    if getattr(tc, "CASE_PACKING", False):
+        if pipeline_mode is not None:
+            RUN_LOGGER.warning("PIPELINE_PREPARE is ignored with CASE_PACKING.")
+        case_hosts = run_cases_packed(cases, dp_path, curr_log_path,
+                                      timestamp_log_dir)
+    else:
+        prefetcher = CasePrefetcher(pipeline_mode)
+        for case_index, case in enumerate(cases):
+            run_case(case, case_index, cases, dp_path, curr_log_path,
+                     timestamp_log_dir, prefetcher=prefetcher)
+        if pipeline_mode is not None:
+            RUN_LOGGER.info("Pipelined preparation saved " +
+                            str(round(prefetcher.saved, 1)) +
+                            "s of wall time.")
     RUN_LOGGER.info("========= Step 3: Collect logs in the cluster. =========")
-    collect_and_merge_logs(curr_log_path, cases)
+    collect_and_merge_logs(curr_log_path, cases, case_hosts)
 
 
 if __name__ == '__main__':
     if len(sys.argv) > 1:
         usage()
     main()
+    CLUSTER_MGR.close()
     RUN_LOGGER.stop()
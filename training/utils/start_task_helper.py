@@ -70,6 +70,8 @@ def write_pid_file(pid_file_path, pid_file):
     pid_file_path = os.path.join(pid_file_path, pid_file)
     if os.path.exists(pid_file_path):
         os.remove(pid_file_path)
+    if os.path.exists(pid_file_path + ".exit"):
+        os.remove(pid_file_path + ".exit")
     file_d = open(pid_file_path, "w")
     file_d.write("%s\n" % os.getpid())
     file_d.close()
@@ -81,6 +83,21 @@ def write_pid_file(pid_file_path, pid_file):
         file_d.close()
 
 
+def write_exit_file(pid_file_path, pid_file, processes):
+    '''Write exit code of the task next to its pid file, so that the waiter
+       in the cluster can report it. The exit code is the first non-zero
+       returncode of processes, or 0.
+    '''
+    exit_code = 0
+    for proc in processes:
+        if proc.returncode != 0:
+            exit_code = proc.returncode
+            break
+    file_d = open(os.path.join(pid_file_path, pid_file + ".exit"), "w")
+    file_d.write("%s\n" % exit_code)
+    file_d.close()
+
+
 def init_flagperf_logger(logger, task_args):
     '''Init the logger according to task_args, and return the log dir.'''
     task_log_dir = os.path.join(
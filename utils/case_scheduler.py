@@ -0,0 +1,98 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+'''Place testcases onto free hosts and accelerators of the cluster, so that
+   independent cases can run at the same time.'''
+
+
+class Placement():
+    '''Hosts and device ids that a case runs on. The same device ids are used
+       on every host. slot is a small number unique among running cases, used
+       to separate their container names and master ports.'''
+
+    def __init__(self, hosts, devices, slot, exclusive):
+        self.hosts = hosts
+        self.devices = devices
+        self.slot = slot
+        self.exclusive = exclusive
+
+    def devices_str(self):
+        '''Return device ids like "4,5,6,7".'''
+        return ",".join(str(dev) for dev in self.devices)
+
+
+class ResourcePool():
+    '''Free devices of each host in the cluster.'''
+
+    def __init__(self, hosts, devices_per_host):
+        self.hosts = list(hosts)
+        self.devices_per_host = devices_per_host
+        self.free = {host: set(range(devices_per_host)) for host in hosts}
+        self.slots = set()
+        self.exclusive_held = False
+
+    def idle(self):
+        '''Return whether no case is running.'''
+        return len(self.slots) == 0
+
+    def fits(self, nnodes, nproc):
+        '''Return whether a case can be placed in an idle cluster.'''
+        return nnodes <= len(self.hosts) and nproc <= self.devices_per_host
+
+    def _candidate_devices(self, nproc):
+        '''Yield device id lists of size nproc, aligned blocks first.'''
+        starts = list(range(0, self.devices_per_host - nproc + 1, nproc))
+        starts += [
+            start for start in range(0, self.devices_per_host - nproc + 1)
+            if start not in starts
+        ]
+        for start in starts:
+            yield list(range(start, start + nproc))
+
+    def _next_slot(self):
+        slot = 0
+        while slot in self.slots:
+            slot += 1
+        self.slots.add(slot)
+        return slot
+
+    def acquire(self, nnodes, nproc, exclusive=False):
+        '''Return a Placement for a case with nnodes x nproc devices, or None
+           if there are not enough free devices now. An exclusive case gets
+           the whole cluster, and no other case runs with it. A case that
+           doesn't fit the cluster runs exclusively too.
+        '''
+        if self.exclusive_held:
+            return None
+        if exclusive or not self.fits(nnodes, nproc):
+            if not self.idle():
+                return None
+            for host in self.hosts:
+                self.free[host] = set()
+            self.exclusive_held = True
+            return Placement(self.hosts[0:nnodes], list(range(nproc)),
+                             self._next_slot(), True)
+
+        for devices in self._candidate_devices(nproc):
+            hosts = [
+                host for host in self.hosts
+                if self.free[host].issuperset(devices)
+            ]
+            if len(hosts) < nnodes:
+                continue
+            hosts = hosts[0:nnodes]
+            for host in hosts:
+                self.free[host].difference_update(devices)
+            return Placement(hosts, devices, self._next_slot(), False)
+        return None
+
+    def release(self, placement):
+        '''Give back devices of placement.'''
+        self.slots.discard(placement.slot)
+        if placement.exclusive:
+            self.exclusive_held = False
+            for host in self.hosts:
+                self.free[host] = set(range(self.devices_per_host))
+            return
+        for host in placement.hosts:
+            self.free[host].update(placement.devices)
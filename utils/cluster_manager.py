@@ -5,6 +5,11 @@
 
 import os
 import sys
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 CURR_PATH = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(os.path.join(CURR_PATH))
@@ -46,6 +51,34 @@ def is_pid_running(pid_file_path, timeout=10):
     print("The process is not running.")
     return False
 
+def wait_pid_exit(pid_file_path, start_timeout=1800):
+    '''Block until the process with pid in pid_file_path exits in host. Wait
+       at most <start_timeout> seconds for the pid file.
+       Return value:
+           Exit code of the process, read from <pid_file_path>.exit. It is 0
+           if the process doesn't write one, and 2 if the pid file never shows
+           up.
+    '''
+    waited = 0
+    while not (os.path.isfile(pid_file_path)
+               and os.path.getsize(pid_file_path) > 0):
+        if waited >= start_timeout:
+            print("Can't find pid file ", pid_file_path, "in host.")
+            return 2
+        time.sleep(1)
+        waited += 1
+    with open(pid_file_path) as pid_file:
+        task_pid = int(pid_file.read().strip())
+    while os.path.exists("/proc/" + str(task_pid)):
+        time.sleep(1)
+    exit_code = 0
+    exit_file_path = pid_file_path + ".exit"
+    if os.path.isfile(exit_file_path):
+        with open(exit_file_path) as exit_file:
+            exit_code = int(exit_file.read().strip())
+    print("The process exited with code:", exit_code)
+    return exit_code
+
 def replace_between_spaces(input, start, end, replacement):
     '''
     Replace the words between start and end with replacement.
@@ -56,30 +89,140 @@ def replace_between_spaces(input, start, end, replacement):
     parts[start:end] = [replacement]
     return ' '.join(parts)
 
+def _host_timeout(timeout, host):
+    '''
+    Return the timeout for host. timeout is either a number of seconds for
+    all hosts or a dict of {host: seconds}.
+    '''
+    if isinstance(timeout, dict):
+        return timeout[host]
+    return timeout
+
 class ClusterManager():
     '''A cluster manager that can make healthcheck, distribute files, and run a
        command in the cluster.
     '''
 
     def __init__(self):
-        self.hosts = None
+        self._hosts = None
+        self._local = threading.local()
         self.ssh_port = None
         self.user = None
         self.ssh_cmd_head = None
         self.scp_cmd_head = None
         self.logger = None
-
-    def init(self, hosts, port, user, logger):
-        '''Init with all args that ssh needs.'''
+        self.max_workers = None
+        self.control_dir = None
+
+    def init(self,
+             hosts,
+             port,
+             user,
+             logger,
+             max_workers=None,
+             multiplex=None,
+             persist=600):
+        '''Init with all args that ssh needs.
+           max_workers: how many hosts are operated concurrently. None means
+                        all the hosts at once, 1 means one by one.
+           multiplex: keep one ssh master connection per host and share it
+                      among all ssh/scp calls. Default is on, unless
+                      FLAGPERF_SSH_MULTIPLEX=0.
+           persist: seconds an idle master connection stays alive.
+        '''
         self.hosts = hosts
         self.ssh_port = port
         self.user = user
         self.logger = logger
+        if max_workers is None:
+            max_workers = os.getenv("FLAGPERF_CLUSTER_WORKERS", None)
+        self.max_workers = None if max_workers is None else int(max_workers)
         self.ssh_cmd_head = "ssh -o ConnectTimeout=3" \
                             + " -o StrictHostKeyChecking=no -l " + self.user \
                             + " -p " + port
         self.scp_cmd_head = "scp -o  ConnectTimeout=3 " \
                             + "-o StrictHostKeyChecking=no -P " + port
+        if multiplex is None:
+            multiplex = os.getenv("FLAGPERF_SSH_MULTIPLEX", "1") != "0"
+        self.control_dir = None
+        if multiplex:
+            # Options are appended, callers replace words by position.
+            self.control_dir = os.path.join(tempfile.gettempdir(),
+                                            "flagperf-ssh-" + user)
+            os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+            mux_opts = " -o ControlMaster=auto -o ControlPath=" \
+                       + os.path.join(self.control_dir, "%C") \
+                       + " -o ControlPersist=" + str(persist)
+            self.ssh_cmd_head += mux_opts
+            self.scp_cmd_head += mux_opts
+
+    @property
+    def hosts(self):
+        '''Hosts that the current thread operates on.'''
+        local_hosts = getattr(self._local, "hosts", None)
+        if local_hosts is not None:
+            return local_hosts
+        return self._hosts
+
+    @hosts.setter
+    def hosts(self, hosts):
+        self._hosts = hosts
+
+    @contextmanager
+    def use_hosts(self, hosts):
+        '''Operate on hosts instead of all the hosts in the current thread,
+           so that cases placed on different hosts can run at the same time.
+        '''
+        self._local.hosts = hosts
+        try:
+            yield self
+        finally:
+            self._local.hosts = None
+
+    def _control_cmd(self, host, operation, timeout=10):
+        ''' Send a control operation(check/exit) to the master connection
+            of host. Return exit code and messages.
+        '''
+        ctl_cmd = self.ssh_cmd_head + " -O " + operation + " " + host
+        return run_cmd.run_cmd_wait(ctl_cmd, timeout)
+
+    def _run_with_master(self, cmd, host, timeout):
+        ''' Run a ssh/scp cmd. If it fails and the master connection of host
+            is broken, drop the master and run cmd once again with a new one.
+        '''
+        ret, outs = run_cmd.run_cmd_wait(cmd, timeout)
+        if ret == 0 or self.control_dir is None:
+            return ret, outs
+        check_ret, _ = self._control_cmd(host, "check")
+        if check_ret == 0:
+            return ret, outs
+        self.logger.debug("ssh master connection to " + host +
+                          " is down, reconnect and retry.")
+        self._control_cmd(host, "exit")
+        return run_cmd.run_cmd_wait(cmd, timeout)
+
+    def close(self):
+        ''' Close the master connections of all the hosts.
+        '''
+        if self.control_dir is None or self.hosts is None:
+            return
+        self._run_on_hosts(self.hosts,
+                           lambda host: self._control_cmd(host, "exit"))
+
+    def _run_on_hosts(self, hosts, func):
+        ''' Call func(host) for each host concurrently with at most
+            max_workers threads.
+            Return a list of results in the same order as hosts.
+        '''
+        if len(hosts) == 0:
+            return []
+        workers = len(hosts)
+        if self.max_workers is not None:
+            workers = max(1, min(self.max_workers, workers))
+        if workers == 1:
+            return [func(host) for host in hosts]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(func, hosts))
 
     def _run_command_ssh_remote(self, cmd, host, timeout=10):
         ''' Run cmd on host with ssh.
@@ -93,7 +236,7 @@ class ClusterManager():
                 self.logger.debug("replace python3 for ssh_run_cmd: " + ssh_run_cmd)
         self.logger.debug("Run cmd on host with ssh. ssh cmd=" + ssh_run_cmd +
                           " host=" + host + " timeout=" + str(timeout))
-        ret, outs = run_cmd.run_cmd_wait(ssh_run_cmd, timeout)
+        ret, outs = self._run_with_master(ssh_run_cmd, host, timeout)
         return ret, outs
 
     def healthcheck(self):
@@ -114,8 +257,10 @@ class ClusterManager():
         '''Run a command on each host with ssh.
         '''
         failed_hosts_ret = {}
-        for host in self.hosts:
-            ret, outs = self._run_command_ssh_remote(command, host, timeout)
+        results = self._run_on_hosts(
+            self.hosts, lambda host: self._run_command_ssh_remote(
+                command, host, _host_timeout(timeout, host)))
+        for host, (ret, outs) in zip(self.hosts, results):
             if ret != 0:
                 failed_hosts_ret[host] = ret
                 self.logger.error("Run cmd on host " + host + " cmd=" +
@@ -130,6 +275,7 @@ class ClusterManager():
         '''Run a command on each host with ssh.
         '''
         failed_hosts_ret = {}
+        hosts = []
         for i in range(0, host_count):
             self.logger.debug("host number:" + str(i))
             host = self.hosts[i]
@@ -141,9 +287,11 @@ class ClusterManager():
                     continue
                 elif is_substring("container_manager.py",
                                     command):
-                    if is_substring("-o pidrunning", command):
+                    wait_ops = ["-o pidrunning", "-o waitpid"]
+                    wait_op = [op for op in wait_ops if is_substring(op, command)]
+                    if len(wait_op) > 0:
                         command = command.replace('container_manager.py', 'cluster_manager.py')
-                        start_str = "-o pidrunning "
+                        start_str = wait_op[0] + " "
                         end_str = " -f "
                         start_index = command.find(start_str) + len(start_str)
                         end_index = command.find(end_str)
@@ -163,13 +311,17 @@ class ClusterManager():
                     else:
                         command = replace_between_spaces(command, 3, 4, "python3")
                     self.logger.debug("replace python3 for command: " + command)
+            hosts.append((host, command))
 
-            ret, outs = self._run_command_ssh_remote(command, host, timeout)
+        results = self._run_on_hosts(
+            hosts, lambda item: self._run_command_ssh_remote(
+                item[1], item[0], _host_timeout(timeout, item[0])))
+        for (host, host_cmd), (ret, outs) in zip(hosts, results):
             if ret != 0:
                 failed_hosts_ret[host] = ret
                 if not no_log:
                     self.logger.error("Run cmd on host " + host + " cmd=" +
-                                      command + " [FAILED]. Output: " +
+                                      host_cmd + " [FAILED]. Output: " +
                                       outs[0])
         return failed_hosts_ret
 
@@ -181,6 +333,7 @@ class ClusterManager():
         '''Start monitors on hosts with ssh.
         '''
         failed_hosts_ret = {}
+        hosts = []
         for i in range(0, host_count):
             self.logger.debug("host number:" + str(i))
             host = self.hosts[i]
@@ -193,7 +346,12 @@ class ClusterManager():
                 else:
                     command = replace_between_spaces(command, 3, 4, "python3")
                 self.logger.debug("replace python3 for command: " + command)
-            ret, outs = self._run_command_ssh_remote(command, host, timeout)
+            hosts.append((host, command))
+
+        results = self._run_on_hosts(
+            hosts, lambda item: self._run_command_ssh_remote(
+                item[1], item[0], _host_timeout(timeout, item[0])))
+        for (host, command), (ret, outs) in zip(hosts, results):
             if ret != 0:
                 failed_hosts_ret[host] = ret
                 self.logger.error("Run cmd on host " + host + " cmd=" +
@@ -212,6 +370,7 @@ class ClusterManager():
         if mode == "training" or mode == "base":
             base_cmd = base_cmd.rstrip("\"")
             command_master_ip = base_cmd + ' --master_addr ' + self.hosts[0]
+        hosts = []
         for i in range(0, host_count):
             host = self.hosts[i]
             command = base_cmd
@@ -223,8 +382,13 @@ class ClusterManager():
                 start_index = command.find(start_str) + len(start_str)
                 command = command[start_index:-1].strip()
                 self.logger.debug("replace python3 for command: " + command)
+            hosts.append((host, command))
 
-            ret, outs = self._run_command_ssh_remote(command, host, timeout)
+        results = self._run_on_hosts(
+            hosts, lambda item: self._run_command_ssh_remote(
+                item[1], item[0], _host_timeout(timeout, item[0])))
+        for i, ((host, command), (ret, outs)) in enumerate(zip(hosts,
+                                                              results)):
             if ret != 0:
                 failed_hosts_ret[host] = ret
                 self.logger.debug("Run cmd on host " + host + " cmd=" +
@@ -242,7 +406,7 @@ class ClusterManager():
         scp_cmd = self.scp_cmd_head + " " + local_file + " " + self.user \
                                     + "@" + host + ":" + remote_dir + "/"
         self.logger.debug("scp command:" + scp_cmd)
-        ret, outs = run_cmd.run_cmd_wait(scp_cmd, timeout)
+        ret, outs = self._run_with_master(scp_cmd, host, timeout)
         return ret, outs
 
     def sync_file_to_some_hosts(self,
@@ -258,12 +422,14 @@ class ClusterManager():
                 failed_hosts_ret[host] = 1
             return failed_hosts_ret
 
-        for i in range(0, host_count):
-            host = self.hosts[i]
-            ret, outs = self._scp_file_to_remote_host(host,
-                                                      local_file,
-                                                      remote_dir,
-                                                      timeout=timeout)
+        hosts = self.hosts[0:host_count]
+        results = self._run_on_hosts(
+            hosts, lambda host: self._scp_file_to_remote_host(
+                host,
+                local_file,
+                remote_dir,
+                timeout=_host_timeout(timeout, host)))
+        for host, (ret, outs) in zip(hosts, results):
             if ret != 0:
                 failed_hosts_ret[host] = ret
                 self.logger.debug("Scp local file " + local_file + "to " +
@@ -281,7 +447,7 @@ class ClusterManager():
         scp_cmd = self.scp_cmd_head + " -r " + self.user + "@" + host + ":" \
                                     + remote_dir + "/* " + local_dir + "/"
         self.logger.debug("scp command:" + scp_cmd)
-        ret, outs = run_cmd.run_cmd_wait(scp_cmd, timeout)
+        ret, outs = self._run_with_master(scp_cmd, host, timeout)
         return ret, outs
 
     def collect_files_some_hosts(self,
@@ -292,31 +458,85 @@ class ClusterManager():
         '''scp remote_dir from hosts in the cluster to <local_dir>/<host>.
         '''
         failed_hosts_ret = {}
-        for i in range(0, host_count):
-            host = self.hosts[i]
-            if not os.path.exists(local_dir):
-                self.logger.debug("Make local dir:" + local_dir)
-                os.makedirs(local_dir)
-            ret, outs = self._scp_dir_from_remote_host(host,
-                                                       remote_dir,
-                                                       local_dir,
-                                                       timeout=timeout)
+        hosts = self.hosts[0:host_count]
+        if len(hosts) > 0 and not os.path.exists(local_dir):
+            self.logger.debug("Make local dir:" + local_dir)
+            os.makedirs(local_dir)
+        results = self._run_on_hosts(
+            hosts, lambda host: self._scp_dir_from_remote_host(
+                host,
+                remote_dir,
+                local_dir,
+                timeout=_host_timeout(timeout, host)))
+        for host, (ret, outs) in zip(hosts, results):
             if ret != 0:
                 failed_hosts_ret[host] = ret
                 self.logger.debug("Scp from " + host + ":" + remote_dir +
                                   " to " + local_dir + " [FAILED]. Output: " +
                                   outs[0])
         return failed_hosts_ret
-    
+
+
+class LocalClusterManager(ClusterManager):
+    '''A stand-in of ClusterManager that runs every "host" on localhost
+       without ssh. Useful to test the runners and the cluster manager itself
+       on a single machine, e.g. with hosts=["127.0.0.1"].
+    '''
+
+    def init(self, hosts, port, user, logger, max_workers=None, **kwargs):
+        '''Init without any ssh options.'''
+        super().init(hosts, port, user, logger, max_workers, multiplex=False)
+
+    def _run_command_ssh_remote(self, cmd, host, timeout=10):
+        ''' Run cmd locally for host.
+            Return exit code of cmd and stdout/stderr messages.
+        '''
+        self.logger.debug("Run cmd locally. cmd=" + cmd + " host=" + host +
+                          " timeout=" + str(timeout))
+        return run_cmd.run_cmd_wait(cmd, timeout)
+
+    def _scp_file_to_remote_host(self,
+                                 host,
+                                 local_file,
+                                 remote_dir,
+                                 timeout=600):
+        ''' Copy local_file to remote_dir locally.
+        '''
+        cp_cmd = "mkdir -p " + remote_dir + " && cp " + local_file + " " \
+                 + remote_dir + "/"
+        self.logger.debug("cp command:" + cp_cmd)
+        return run_cmd.run_cmd_wait(cp_cmd, timeout)
+
+    def _scp_dir_from_remote_host(self,
+                                  host,
+                                  remote_dir,
+                                  local_dir,
+                                  timeout=600):
+        ''' Copy remote_dir to local_dir locally. Nothing to do if they are
+            the same directory.
+        '''
+        if os.path.abspath(remote_dir) == os.path.abspath(local_dir):
+            return 0, ["", None]
+        cp_cmd = "cp -r " + remote_dir + "/* " + local_dir + "/"
+        self.logger.debug("cp command:" + cp_cmd)
+        return run_cmd.run_cmd_wait(cp_cmd, timeout)
+
+    def close(self):
+        '''No connection to close.'''
+        return
+
+
 def _parse_args():
     '''Get command args from input. '''
     parser = ArgumentParser(description="Manage a host. ")
     parser.add_argument("-o",
                         type=str,
                         required=True,
-                        choices=['pidrunning'],
+                        choices=['pidrunning', 'waitpid'],
                         help="Operation on the host:"
-                        "pidrunning Check wether the process is running.")
+                        "pidrunning Check wether the process is running."
+                        "waitpid  Wait until the process exits, exit with "
+                        "its exit code.")
 
     args, _ = parser.parse_known_args()
 
@@ -325,6 +545,15 @@ def _parse_args():
                             type=str,
                             required=True,
                             help="pid file path in container.")
+    elif args.o == 'waitpid':
+        parser.add_argument("-f",
+                            type=str,
+                            required=True,
+                            help="pid file path in host.")
+        parser.add_argument("-s",
+                            type=int,
+                            default=1800,
+                            help="timeout of waiting for the pid file")
     args = parser.parse_args()
     return args
 
@@ -343,6 +572,9 @@ def main():
             sys.exit(0)
         sys.exit(1)
 
+    if operation == "waitpid":
+        sys.exit(wait_pid_exit(args.f, args.s))
+
     if ret == 0:
         print("Output: ", outs[0])
         print(operation, "successful.")
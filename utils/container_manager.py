@@ -119,6 +119,53 @@ class ContainerManager():
         print("The process is not running.")
         return False
 
+    def wait_pid_exit(self, pid_file_path, start_timeout=1800, timeout=None):
+        '''Block until the process with pid in pid_file_path exits in
+           container. Wait at most <start_timeout> seconds for the pid file.
+           Return value:
+               Exit code of the process, read from <pid_file_path>.exit. It is
+               0 if the process doesn't write one, and 2 if the pid file never
+               shows up.
+        '''
+        exit_file_path = pid_file_path + ".exit"
+        wait_cmd = "n=0; while [ ! -s " + pid_file_path + " ] && " \
+                   + "[ \\$n -lt " + str(start_timeout) + " ]; do sleep 1; " \
+                   + "n=\\$((n+1)); done; [ -s " + pid_file_path + " ] " \
+                   + "|| exit 2; pid=\\$(cat " + pid_file_path + "); " \
+                   + "while [ -e /proc/\\$pid ]; do sleep 1; done; " \
+                   + "cat " + exit_file_path + " 2>/dev/null || echo 0"
+        ret, outs = self.run_cmd_in(wait_cmd, timeout, detach=False)
+        if ret != 0:
+            print("Can't find pid file ", pid_file_path, "in container.")
+            return ret
+        exit_code = _parse_exit_code(outs[0])
+        print("The process exited with code:", exit_code)
+        return exit_code
+
+
+    def kill_processes(self):
+        '''Kill all processes in container but init and the "sleep infinity"
+           keeping it alive, so that the container can be reused by the next
+           round of the case.
+        '''
+        kill_cmd = "for p in \\$(ls /proc | grep -E '^[0-9]+\\$'); do " \
+                   + "[ \\$p -eq 1 ] || [ \\$p -eq \\$\\$ ] || " \
+                   + "case \\$(tr -d '\\000' 2>/dev/null " \
+                   + "< /proc/\\$p/cmdline) in sleepinfinity) ;; " \
+                   + "*) kill -9 \\$p 2>/dev/null ;; esac; done; true"
+        ret, outs = self.run_cmd_in(kill_cmd, 30, detach=False)
+        return ret, outs
+
+
+def _parse_exit_code(output):
+    '''Return the exit code in the last line of output, or 0 if the line is
+       not a number.'''
+    lines = output.strip().split("\n")
+    try:
+        return int(lines[-1])
+    except ValueError:
+        return 0
+
 
 def _parse_args():
     '''Get command args from input. '''
@@ -128,7 +175,7 @@ def _parse_args():
                         required=True,
                         choices=[
                             'start', 'stop', 'rm', 'exists', 'runnew',
-                            'runcmdin', 'pidrunning'
+                            'runcmdin', 'pidrunning', 'waitpid', 'killall'
                         ],
                         help="Operation on the container:"
                         "start    Start a stopped container."
@@ -137,7 +184,11 @@ def _parse_args():
                         "exists   Check whether a container exists."
                         "runnew   Start a new container with run args."
                         "runcmdin Run a command in the container."
-                        "pidrunning Check wether the process is running.")
+                        "pidrunning Check wether the process is running."
+                        "waitpid  Wait until the process exits, exit with "
+                        "its exit code."
+                        "killall  Kill all processes but the container's "
+                        "own.")
     parser.add_argument("-c", type=str, required=True, help="Container name")
 
     args, _ = parser.parse_known_args()
@@ -169,6 +220,19 @@ def _parse_args():
                             type=str,
                             required=True,
                             help="pid file path in container.")
+    elif args.o == 'waitpid':
+        parser.add_argument("-f",
+                            type=str,
+                            required=True,
+                            help="pid file path in container.")
+        parser.add_argument("-s",
+                            type=int,
+                            default=1800,
+                            help="timeout of waiting for the pid file")
+        parser.add_argument("-t",
+                            type=int,
+                            default=0,
+                            help="timeout of waiting, 0 means no limit")
     args = parser.parse_args()
     return args
 
@@ -194,12 +258,18 @@ def main():
             sys.exit(0)
         sys.exit(1)
 
+    if operation == "waitpid":
+        timeout = args.t if args.t > 0 else None
+        sys.exit(container_mgr.wait_pid_exit(args.f, args.s, timeout))
+
     if operation == "start":
         ret, outs = container_mgr.start()
     elif operation == "stop":
         ret, outs = container_mgr.stop()
     elif operation == "rm":
         ret, outs = container_mgr.remove()
+    elif operation == "killall":
+        ret, outs = container_mgr.kill_processes()
     elif operation == "runcmdin":
         cmd = args.r
         detach = args.d
@@ -10,6 +10,7 @@ image_management.py -o [operation] -i [repository] -t [tag]
 import os
 import sys
 import argparse
+import hashlib
 from run_cmd import run_cmd_wait as rcw
 from container_manager import ContainerManager
 import time
@@ -21,7 +22,12 @@ exist     Whether the image exists
 remove    Remove a docker image
 build     Build a docker image with two options if the image doesn't exist:
           -d [directory]  Directory contains dockerfile and install script
-          -f [framework]  AI framework '''
+          -f [framework]  AI framework
+prefetch  Pull the base images of the dockerfile if the image doesn't exist,
+          exit with 1 if the image still has to be built:
+          -d [directory]  Directory contains dockerfile
+commit    Commit a container as the image:
+          -c [container]  Container name '''
 
     parser = argparse.ArgumentParser(
         description='Docker managment script',
@@ -30,7 +36,8 @@ build     Build a docker image with two options if the image doesn't exist:
                         type=str,
                         metavar='[operation]',
                         required=True,
-                        choices=['exist', 'remove', 'build'],
+                        choices=['exist', 'remove', 'build', 'prefetch',
+                                 'commit'],
                         help=help_message)
     parser.add_argument('-i',
                         type=str,
@@ -52,16 +59,51 @@ build     Build a docker image with two options if the image doesn't exist:
                             type=str,
                             required=True,
                             help="testcase framework of the image.")
+    if args.o == "prefetch":
+        parser.add_argument("-d",
+                            type=str,
+                            required=True,
+                            help="dir contains dockerfile for building image.")
+    if args.o == "commit":
+        parser.add_argument("-c",
+                            type=str,
+                            required=True,
+                            help="container to commit.")
     args = parser.parse_args()
     return args
 
 
+def content_hash(paths, length=12):
+    '''Return a short sha256 of the files under paths(files or dirs). Names
+       and contents are hashed, so any change gives a new hash. Missing paths
+       are hashed by name only.
+    '''
+    sha = hashlib.sha256()
+    for path in paths:
+        sha.update(path.encode())
+        files = []
+        if os.path.isfile(path):
+            files = [path]
+        elif os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files += [os.path.join(root, name) for name in sorted(names)]
+        for file_path in files:
+            sha.update(os.path.relpath(file_path, path).encode())
+            with open(file_path, "rb") as file_d:
+                for chunk in iter(lambda: file_d.read(1 << 20), b""):
+                    sha.update(chunk)
+    return sha.hexdigest()[0:length]
+
+
 class ImageManager():
     '''Local image manager.
     Support operations below:
         -- remove,          rm image from local
         -- exists,     query if image exist local
         -- build_image,     build docker image
+        -- pull_base_images, pull images the dockerfile builds from
+        -- commit,          commit a container as the image
     '''
 
     def __init__(self, repository, tag):
@@ -74,8 +116,8 @@ class ImageManager():
             0 - image already exist
             1 - image doesn't exist
         '''
-        cmd = "sudo docker images|grep -w \"" + self.repository + "\"|grep -w \"" + \
-              self.tag + "\""
+        cmd = "sudo docker image inspect " + self.repository + ":" + \
+              self.tag + " > /dev/null 2>&1"
         print(cmd)
         ret, _ = rcw(cmd, 10)
         print(ret)
@@ -95,12 +137,59 @@ class ImageManager():
             return 1
         return 0
 
+    def commit(self, container_name):
+        '''Commit container as the image, e.g. to snapshot the packages
+           installed in it.
+           Return code:
+            0  - commit image successfully
+            1  - commit image failed
+        '''
+        commit_cmd = "docker commit -a \"baai\" -m \"flagperf case\" " \
+                     + container_name + " " + self.repository + ":" + self.tag
+        ret, outs = rcw(commit_cmd, 300)
+        if ret != 0:
+            print("Commit docker image failed.")
+            print("Error: " + outs[0])
+            return 1
+        return 0
+
     def _rm_tmp_image(self, tmp_image_name, cont_mgr):
         '''remove temp container and temp image.'''
         clean_tmp_cmd = "docker rmi -f " + tmp_image_name
         cont_mgr.remove()
         rcw(clean_tmp_cmd, 30)
 
+    def pull_base_images(self, image_dir):
+        '''Pull the images that the dockerfile in image_dir builds from, so
+           that building the image later only runs its own steps. Stages of
+           a multi-stage build can't be pulled and are skipped.
+           Return code:
+            0  - pull images successfully
+            1  - pull images failed
+        '''
+        dockerfile = os.path.join(image_dir, "Dockerfile")
+        if not os.path.isfile(dockerfile):
+            print("Can't find dockerfile in " + image_dir)
+            return 1
+        stages = set()
+        ret = 0
+        with open(dockerfile, "r") as file_d:
+            for line in file_d:
+                items = [item for item in line.split()
+                         if not item.startswith("--")]
+                if len(items) < 2 or items[0].upper() != "FROM":
+                    continue
+                if len(items) >= 4 and items[2].upper() == "AS":
+                    stages.add(items[3])
+                if items[1] in stages or items[1] == "scratch":
+                    continue
+                pull_ret, outs = rcw("docker pull " + items[1], 1200)
+                if pull_ret != 0:
+                    print("Pull docker image failed. " + items[1])
+                    print("Error: " + outs[0])
+                    ret = 1
+        return ret
+
     def build_image(self, image_dir, framework):
         '''Build docker image in vendor's path.
         '''
@@ -193,6 +282,14 @@ def main():
             image_dir = args.d
             framework = args.f
             ret = image_manager.build_image(image_dir, framework)
+    elif operation == "prefetch":
+        if image_manager.exist() == 0:
+            ret = 0
+        else:
+            image_manager.pull_base_images(args.d)
+            ret = 1
+    elif operation == "commit":
+        ret = image_manager.commit(args.c)
     else:
         print("Invalid operation.")
         sys.exit(2)
@@ -0,0 +1,155 @@
+# Copyright (c) 2024 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+'''Statistics of monitor logs summarized by base/run.py and
+   operation/run.py, shared by their logs and detail_result.json.'''
+
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+
+
+def steady_state(series):
+    '''Keep samples closer to the max than to the min of series, i.e. drop
+       the idle samples before and after the test. NaN samples are dropped.
+    '''
+    series = np.asarray(series, dtype=np.float64)
+    series = series[~np.isnan(series)]
+    if len(series) == 0:
+        return series
+    return series[series >= (series.max() + series.min()) / 2]
+
+
+class SeriesStats():
+    '''Mean, max, std and percentiles of a monitor series.'''
+
+    def __init__(self, series, scale=1.0, steady=False):
+        series = np.asarray(series, dtype=np.float64) * scale
+        if steady:
+            series = steady_state(series)
+        else:
+            series = series[~np.isnan(series)]
+        self.count = len(series)
+        if self.count == 0:
+            self.mean = self.max = self.std = float("nan")
+            self.percentiles = {p: float("nan") for p in PERCENTILES}
+            return
+        self.mean = float(series.mean())
+        self.max = float(series.max())
+        self.std = float(series.std())
+        self.percentiles = dict(
+            zip(PERCENTILES,
+                np.percentile(series, PERCENTILES).tolist()))
+
+    def to_dict(self):
+        result = {
+            "count": self.count,
+            "mean": self.mean,
+            "max": self.max,
+            "std": self.std
+        }
+        for p in PERCENTILES:
+            result["p" + str(p)] = self.percentiles[p]
+        return result
+
+    def format(self, unit, ndigits):
+        '''Return "AVERAGE: x unit, MAX: x unit, STD DEVIATION: x unit".'''
+        return "AVERAGE: {} {}, MAX: {} {}, STD DEVIATION: {} {}".format(
+            round(self.mean, ndigits), unit, round(self.max, ndigits), unit,
+            round(self.std, ndigits), unit)
+
+
+class HostStats():
+    '''Statistics of the logs summarized on a host.'''
+
+    def __init__(self, host_logs, steady):
+        vendor = host_logs["vendor"]
+        self.flagperf = host_logs["flagperf"]
+        self.pwr = SeriesStats(host_logs["pwr"])
+        self.cpu = SeriesStats(host_logs["cpu"], 100)
+        self.mem = SeriesStats(host_logs["mem"], 100)
+        self.chip_power = {
+            rank: SeriesStats(series, steady=steady)
+            for rank, series in vendor["power"].items()
+        }
+        self.chip_temp = {
+            rank: SeriesStats(series, steady=steady)
+            for rank, series in vendor["temp"].items()
+        }
+        max_mem = vendor.get("max_mem", float("nan"))
+        self.chip_mem = {
+            rank: SeriesStats(series, 100 / max_mem)
+            for rank, series in vendor["mem"].items()
+        }
+
+    def to_dict(self):
+        return {
+            "pwr": self.pwr.to_dict(),
+            "cpu": self.cpu.to_dict(),
+            "mem": self.mem.to_dict(),
+            "chip_power":
+            {rank: s.to_dict()
+             for rank, s in self.chip_power.items()},
+            "chip_temp":
+            {rank: s.to_dict()
+             for rank, s in self.chip_temp.items()},
+            "chip_mem": {rank: s.to_dict()
+                         for rank, s in self.chip_mem.items()}
+        }
+
+
+class AnalysisResult():
+    '''Statistics of all hosts, in the order of noderank.'''
+
+    def __init__(self, key_logs, steady=False):
+        self.key_logs = key_logs
+        self.hosts = {
+            host: HostStats(host_logs, steady)
+            for host, host_logs in key_logs.items()
+        }
+
+    def to_dict(self):
+        '''Summarized logs of each host with their statistics in "stats".'''
+        result = {}
+        for host, host_stats in self.hosts.items():
+            result[host] = dict(self.key_logs[host])
+            result[host]["stats"] = host_stats.to_dict()
+        return result
+
+    def log(self, logger):
+        '''Print statistics of each host with logger.'''
+        for noderank, (host, stats) in enumerate(self.hosts.items()):
+            logger.info("*" * 50)
+            logger.info("Noderank {} with IP {}".format(noderank, host))
+
+            logger.info("1) Performance:")
+            for line in stats.flagperf:
+                logger.info("  " + line.split("]")[1])
+
+            logger.info("2) POWER:")
+            logger.info("  2.1) SYSTEM POWER:")
+            logger.info("    " + stats.pwr.format("Watts", 2))
+
+            logger.info("  2.2) AI-chip POWER:")
+            for rank, rank_stats in stats.chip_power.items():
+                logger.info("    RANK {}'s ".format(rank) +
+                            rank_stats.format("Watts", 2))
+
+            logger.info("  2.3) AI-chip TEMPERATURE:")
+            for rank, rank_stats in stats.chip_temp.items():
+                logger.info("    RANK {}'s ".format(rank) +
+                            rank_stats.format(u"\u00b0C", 2))
+
+            logger.info("3) Utilization:")
+            logger.info("  3.1) SYSTEM CPU:")
+            logger.info("    " + stats.cpu.format("%", 3))
+
+            logger.info("  3.2) SYSTEM MEMORY:")
+            logger.info("    " + stats.mem.format("%", 3))
+
+            logger.info("  3.3) AI-chip MEMORY:")
+            for rank, rank_stats in stats.chip_mem.items():
+                logger.info("    RANK {}'s ".format(rank) +
+                            rank_stats.format("%", 3))
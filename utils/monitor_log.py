@@ -0,0 +1,255 @@
+# Copyright (c) 2024 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+'''Compact binary time series for monitor logs.
+
+A .bin monitor log is a 16 bytes header followed by fixed size records:
+    header: b"FPTS", version(uint16), devices(uint16), fields(uint16),
+            6 reserved bytes
+    record: timestamp in milliseconds(int64),
+            devices x fields values(float32)
+Records are only appended, and read back with a numpy memmap.
+
+usage:
+monitor_log.py -i [text log] [-o bin log] [-n devices -m marker -c columns]
+'''
+
+import os
+import re
+import sys
+import time
+import struct
+import datetime
+import argparse
+import numpy as np
+
+MAGIC = b"FPTS"
+VERSION = 1
+HEADER = struct.Struct("<4sHHH6x")
+TIME_FORMATS = ('%Y-%m-%d-%H:%M:%S.%f', '%Y-%m-%d-%H:%M:%S')
+TIME_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}-\d{2}:\d{2}:\d{2}(\.\d+)?')
+UNIT_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz%/\n"
+
+
+def record_dtype(devices, fields):
+    '''numpy dtype of one record.'''
+    return np.dtype([("ts", "<i8"), ("values", "<f4", (devices, fields))])
+
+
+def parse_timestamp(text):
+    '''Return milliseconds since epoch of a monitor TIMESTAMP.'''
+    for time_format in TIME_FORMATS:
+        try:
+            stamp = datetime.datetime.strptime(text, time_format)
+        except ValueError:
+            continue
+        return int(stamp.timestamp() * 1000)
+    raise ValueError("Invalid monitor timestamp: " + text)
+
+
+def bin_path_of(log_path):
+    '''Return the .bin path next to a text log path.'''
+    return os.path.splitext(log_path)[0] + ".bin"
+
+
+class MonitorWriter():
+    '''Append records to a .bin monitor log.'''
+
+    def __init__(self, path, devices=1, fields=1):
+        self.devices = devices
+        self.fields = fields
+        self.record = struct.Struct("<q" + "f" * (devices * fields))
+        exists = os.path.isfile(path) and os.path.getsize(path) > 0
+        if exists:
+            header = read_header(path)
+            if header != (devices, fields):
+                raise ValueError("Shape of " + path + " is " + str(header))
+        self.file = open(path, "ab")
+        if not exists:
+            self.file.write(HEADER.pack(MAGIC, VERSION, devices, fields))
+            self.file.flush()
+
+    def append(self, timestamp_ms, values):
+        '''Append values(devices x fields numbers, flattened) at time.'''
+        self.file.write(self.record.pack(timestamp_ms, *values))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_header(path):
+    '''Return (devices, fields) of a .bin monitor log.'''
+    with open(path, "rb") as f:
+        magic, version, devices, fields = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(path + " is not a FlagPerf monitor log.")
+    return devices, fields
+
+
+def read_bin(path):
+    '''Memory map a .bin monitor log. Return timestamps in milliseconds
+       (n,) and values (n, devices, fields). A partly written last record
+       is ignored.
+    '''
+    devices, fields = read_header(path)
+    dtype = record_dtype(devices, fields)
+    count = (os.path.getsize(path) - HEADER.size) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, "<i8"), np.zeros((0, devices, fields), "<f4")
+    records = np.memmap(path,
+                        dtype=dtype,
+                        mode="r",
+                        offset=HEADER.size,
+                        shape=(count, ))
+    return records["ts"], records["values"]
+
+
+def parse_sys_text(path):
+    '''Parse a "TIMESTAMP\\tvalue" text log of sys_monitor. Return
+       timestamps (n,) and values (n, 1, 1).'''
+    stamps, values = [], []
+    with open(path, "r") as f:
+        for line in f:
+            if "\t" not in line:
+                continue
+            stamp, value = line.split("\t", 1)
+            stamps.append(stamp)
+            values.append(value)
+    values = np.char.strip(np.array(values, dtype=str)).astype("<f4")
+    stamps = np.array([parse_timestamp(stamp) for stamp in stamps], "<i8")
+    return stamps, values.reshape(-1, 1, 1)
+
+
+def parse_device_text(path, devices, marker, columns):
+    '''Parse a vendor monitor text log, where a TIMESTAMP line is followed by
+       one line per device. Lines containing marker are device lines, and
+       their space separated tokens at columns are taken as numbers with units
+       like C, W, MiB and % stripped. Return timestamps (n,) and values
+       (n, devices, len(columns)). An incomplete last sample is dropped.
+    '''
+    stamps, tokens = [], []
+    stamp = 0
+    with open(path, "r") as f:
+        for line in f:
+            if TIME_PATTERN.match(line):
+                stamp = parse_timestamp(line.strip())
+            elif marker in line:
+                items = line.split(" ")
+                tokens.append([items[column] for column in columns])
+                stamps.append(stamp)
+    samples = len(tokens) // devices
+    tokens = tokens[0:samples * devices]
+    if samples == 0:
+        return np.zeros(0, "<i8"), np.zeros((0, devices, len(columns)),
+                                            "<f4")
+    values = device_values(tokens)
+    stamps = np.array(stamps[0:samples * devices:devices], "<i8")
+    return stamps, values.reshape(samples, devices, len(columns))
+
+
+def device_values(tokens):
+    '''Return tokens of device lines as float32 numbers, with units like C,
+       W, MiB and % stripped.'''
+    values = np.char.rstrip(np.array(tokens, dtype=str), UNIT_CHARS)
+    # tokens like N/A are left empty
+    return np.where(values == "", "nan", values).astype("<f4")
+
+
+def append_device_sample(path, text, marker, columns):
+    '''Append one sample of a vendor monitor, the text printed by its device
+       query, to the .bin log next to path. Device lines are picked and split
+       like parse_device_text does. Return False if the sample has no device
+       line, or not as many devices as the log.
+    '''
+    tokens = []
+    for line in text.splitlines():
+        items = line.split(" ")
+        if marker in line and len(items) > max(columns):
+            tokens.append([items[column] for column in columns])
+    if len(tokens) == 0:
+        return False
+    try:
+        writer = MonitorWriter(bin_path_of(path), len(tokens), len(columns))
+    except ValueError:
+        return False
+    writer.append(int(time.time() * 1000),
+                  device_values(tokens).reshape(-1).tolist())
+    writer.close()
+    return True
+
+
+def read_sys_log(path):
+    '''Return values of a sys_monitor log as a 1-D array, from the .bin log
+       next to path if there is one.'''
+    if os.path.isfile(bin_path_of(path)):
+        _, values = read_bin(bin_path_of(path))
+    else:
+        _, values = parse_sys_text(path)
+    return values[:, 0, 0]
+
+
+def read_device_log(path, devices, marker, columns):
+    '''Return values (samples, devices, len(columns)) of a vendor monitor log,
+       from the .bin log next to path if there is one.'''
+    if os.path.isfile(bin_path_of(path)):
+        _, values = read_bin(bin_path_of(path))
+    else:
+        _, values = parse_device_text(path, devices, marker, columns)
+    return values
+
+
+def convert(text_path, bin_path, devices=None, marker=None, columns=None):
+    '''Convert a text monitor log to a .bin log. Without devices, it is a
+       sys_monitor log.'''
+    if devices is None:
+        stamps, values = parse_sys_text(text_path)
+    else:
+        stamps, values = parse_device_text(text_path, devices, marker,
+                                           columns)
+    dtype = record_dtype(values.shape[1], values.shape[2])
+    records = np.empty(len(stamps), dtype=dtype)
+    records["ts"] = stamps
+    records["values"] = values
+    with open(bin_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, values.shape[1], values.shape[2]))
+        records.tofile(f)
+    return len(stamps)
+
+
+def parse_args():
+    ''' Check script input parameter. '''
+    parser = argparse.ArgumentParser(
+        description='Convert a text monitor log to a .bin monitor log')
+    parser.add_argument('-i', type=str, required=True, help='text log path')
+    parser.add_argument('-o',
+                        type=str,
+                        default=None,
+                        help='bin log path, next to the text log default')
+    parser.add_argument('-n',
+                        type=int,
+                        default=None,
+                        help='devices per sample of a vendor log')
+    parser.add_argument('-m',
+                        type=str,
+                        default="MiB",
+                        help='marker of device lines in a vendor log')
+    parser.add_argument('-c',
+                        type=str,
+                        default="0,1,2,3",
+                        help='token columns of device lines to keep')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    bin_path = args.o if args.o is not None else bin_path_of(args.i)
+    columns = [int(column) for column in args.c.split(",")]
+    count = convert(args.i, bin_path, args.n, args.m, columns)
+    print("Converted", count, "samples to", bin_path)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,313 @@
+# Copyright (c) 2024 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+'''Append-only SQLite store of run results. Each subsystem appends one
+   record per case, round and host, so that historical runs are compared
+   with a query instead of scraping logs:
+
+   python3 utils/result_store.py -d result/results.db -v nvidia -n mm
+'''
+
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+
+# Bump when the fields of a record change, old rows keep their version.
+SCHEMA_VERSION = 1
+
+FIELDS = ("schema_version", "subsystem", "run_id", "timestamp", "vendor",
+          "chip", "case_name", "round", "host", "metrics", "config")
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    schema_version INTEGER NOT NULL,
+    subsystem TEXT NOT NULL,
+    run_id TEXT,
+    timestamp TEXT NOT NULL,
+    vendor TEXT NOT NULL,
+    chip TEXT,
+    case_name TEXT NOT NULL,
+    round INTEGER NOT NULL,
+    host TEXT,
+    metrics TEXT NOT NULL,
+    config TEXT
+);
+CREATE INDEX IF NOT EXISTS results_vendor ON results (vendor, timestamp);
+CREATE INDEX IF NOT EXISTS results_chip ON results (chip, timestamp);
+CREATE INDEX IF NOT EXISTS results_case ON results (case_name, timestamp);
+CREATE INDEX IF NOT EXISTS results_timestamp ON results (timestamp);
+CREATE INDEX IF NOT EXISTS results_run ON results (run_id);
+CREATE TRIGGER IF NOT EXISTS results_no_update BEFORE UPDATE ON results
+BEGIN SELECT RAISE(ABORT, 'results are append-only'); END;
+CREATE TRIGGER IF NOT EXISTS results_no_delete BEFORE DELETE ON results
+BEGIN SELECT RAISE(ABORT, 'results are append-only'); END;
+'''
+
+# "[FlagPerf Result]Rank 0's computation-FP32=123.4TFLOPS"
+FLAGPERF_LINE = re.compile(r"\[FlagPerf Result\]\s*(?:Rank (\d+)'s )?"
+                           r"([^=]+)=\s*([-+0-9.eE]+)\s*(\S*)")
+
+
+def store_path(config):
+    '''Path of the store of a subsystem, RESULT_DB in host.yaml or
+       results.db under FLAGPERF_LOG_PATH.'''
+    path = getattr(config, "RESULT_DB", None)
+    if path is None:
+        path = os.path.join(config.FLAGPERF_LOG_PATH, "results.db")
+    return path
+
+
+def make_record(subsystem,
+                case_name,
+                vendor,
+                metrics,
+                chip=None,
+                host=None,
+                round_index=1,
+                run_id=None,
+                config=None,
+                timestamp=None):
+    '''Return a record of the current schema. metrics and config are json
+       serializable dicts, timestamp defaults to now in local time.'''
+    if timestamp is None:
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "subsystem": subsystem,
+        "run_id": run_id,
+        "timestamp": timestamp,
+        "vendor": vendor,
+        "chip": chip,
+        "case_name": case_name,
+        "round": round_index,
+        "host": host,
+        "metrics": metrics,
+        "config": config
+    }
+
+
+def parse_flagperf_lines(lines):
+    '''Metrics of "[FlagPerf Result]name=value unit" lines printed by
+       benchmarks and toolkits, keyed like "computation-FP32(TFLOPS)" and
+       grouped by rank if the lines have one. Other lines are kept as they
+       are in "lines".'''
+    metrics = {}
+    others = []
+    for line in lines:
+        match = FLAGPERF_LINE.search(line)
+        if match is None:
+            others.append(line)
+            continue
+        rank, name, value, unit = match.groups()
+        key = name.strip() + ("(" + unit + ")" if unit else "")
+        target = metrics
+        if rank is not None:
+            target = metrics.setdefault("ranks", {}).setdefault(rank, {})
+        try:
+            target[key] = float(value)
+        except ValueError:
+            others.append(line)
+    if len(others) > 0:
+        metrics["lines"] = others
+    return metrics
+
+
+def host_records(analysis, subsystem, case_name, vendor, chip, run_id,
+                 config=None):
+    '''One record per host of a log_analysis.AnalysisResult. Metrics of a
+       host are its "perf" record written by the task if any, else its
+       [FlagPerf Result] lines parsed, with the monitor statistics in
+       "stats".'''
+    records = []
+    for host, stats in analysis.hosts.items():
+        host_logs = analysis.key_logs[host]
+        metrics = dict(
+            host_logs.get("perf")
+            or parse_flagperf_lines(host_logs["flagperf"]))
+        metrics["stats"] = stats.to_dict()
+        records.append(
+            make_record(subsystem,
+                        case_name,
+                        vendor,
+                        metrics,
+                        chip=chip,
+                        host=host,
+                        run_id=run_id,
+                        config=config))
+    return records
+
+
+def _finite(value):
+    '''value with NaN(of empty monitor series) replaced by None, which json
+       keeps as null.'''
+    if isinstance(value, float) and value != value:
+        return None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+def _json(value):
+    if value is None:
+        return None
+    return json.dumps(_finite(value), sort_keys=True, default=str)
+
+
+class ResultStore():
+    '''Results in a SQLite file, only appended to.'''
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if row is None:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO meta (key, value) VALUES "
+                    "('schema_version', ?)", (str(SCHEMA_VERSION), ))
+        elif int(row["value"]) > SCHEMA_VERSION:
+            raise RuntimeError("Result store " + path + " has schema " +
+                               row["value"] + ", newer than " +
+                               str(SCHEMA_VERSION))
+
+    def close(self):
+        self.conn.close()
+
+    def append(self, records):
+        '''Append a record or a list of records in one transaction.'''
+        if isinstance(records, dict):
+            records = [records]
+        rows = []
+        for record in records:
+            row = [record.get(field) for field in FIELDS]
+            row[FIELDS.index("metrics")] = _json(record["metrics"])
+            row[FIELDS.index("config")] = _json(record.get("config"))
+            rows.append(row)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO results (" + ", ".join(FIELDS) + ") VALUES (" +
+                ", ".join("?" * len(FIELDS)) + ")", rows)
+        return len(rows)
+
+    def query(self,
+              subsystem=None,
+              vendor=None,
+              chip=None,
+              case_name=None,
+              run_id=None,
+              since=None,
+              until=None,
+              limit=None):
+        '''Records matching all the given fields, oldest first. since and
+           until are dates like "2024-05-01" or "2024-05-01 12:00:00", until
+           is exclusive.'''
+        conditions = []
+        args = []
+        for field, value in (("subsystem", subsystem), ("vendor", vendor),
+                             ("chip", chip), ("case_name", case_name),
+                             ("run_id", run_id)):
+            if value is not None:
+                conditions.append(field + " = ?")
+                args.append(value)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            args.append(since)
+        if until is not None:
+            conditions.append("timestamp < ?")
+            args.append(until)
+
+        sql = "SELECT * FROM results"
+        if len(conditions) > 0:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY timestamp, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(int(limit))
+
+        records = []
+        for row in self.conn.execute(sql, args):
+            record = dict(row)
+            record["metrics"] = json.loads(record["metrics"])
+            if record["config"] is not None:
+                record["config"] = json.loads(record["config"])
+            records.append(record)
+        return records
+
+
+def append_records(path, records, logger=None):
+    '''Append records to the store at path. A broken store is logged and
+       never fails the run.'''
+    try:
+        store = ResultStore(path)
+        count = store.append(records)
+        store.close()
+    except (sqlite3.Error, RuntimeError, OSError) as err:
+        if logger is not None:
+            logger.error("Append results to " + path + " failed: " +
+                         str(err))
+        return 0
+    if logger is not None:
+        logger.info("Append " + str(count) + " results to " + path)
+    return count
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description='Query results of FlagPerf runs, one json per line')
+    parser.add_argument('-d',
+                        type=str,
+                        metavar='[path]',
+                        required=True,
+                        help='path of results.db')
+    parser.add_argument('-s', type=str, metavar='[subsystem]', default=None,
+                        help='training, inference, base or operation')
+    parser.add_argument('-v', type=str, metavar='[vendor]', default=None)
+    parser.add_argument('-c', type=str, metavar='[chip]', default=None)
+    parser.add_argument('-n', type=str, metavar='[case]', default=None)
+    parser.add_argument('-r', type=str, metavar='[run_id]', default=None)
+    parser.add_argument('--since', type=str, default=None,
+                        help='like 2024-05-01')
+    parser.add_argument('--until', type=str, default=None,
+                        help='like 2024-06-01, exclusive')
+    parser.add_argument('--limit', type=int, default=None)
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    if not os.path.exists(args.d):
+        print("Result store " + args.d + " doesn't exist.")
+        sys.exit(1)
+    store = ResultStore(args.d)
+    for record in store.query(subsystem=args.s,
+                              vendor=args.v,
+                              chip=args.c,
+                              case_name=args.n,
+                              run_id=args.r,
+                              since=args.since,
+                              until=args.until,
+                              limit=args.limit):
+        print(json.dumps(record, sort_keys=True))
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
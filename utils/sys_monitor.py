@@ -5,20 +5,105 @@ Usage:  python3 sys-monitor.py -o operation -l [log_path]
             -o, --operation     start|stop|restart|status
             -l, --log           log path , ./logs/ default
             -v, --gpu vendor    nvidia|iluvatar|cambricon|kunlunxin
+            -b, --backend       proc|shell, proc default
+            -i, --interval      seconds between cpu/mem samples, 5 default
+            -f, --format        text|binary, text default
 '''
 
 import os
 import sys
 import time
+import glob
 import signal
 import atexit
 import argparse
 import schedule
 import datetime
+import threading
 from multiprocessing import Process
 from run_cmd import run_cmd_wait as rcw
 
 
+class ProcSampler:
+    '''
+    Sample cpu/mem usage from /proc and cpu package power from powercap
+    sysfs in the current process, without running any command. Usage is
+    computed between two calls, like mpstat does over its interval.
+    '''
+
+    def __init__(self):
+        self.last_cpu = self._read_cpu()
+        self.rapl_files = [
+            path for path in glob.glob(
+                '/sys/class/powercap/intel-rapl:*/energy_uj')
+            # package domains only, subdomains are counted in them
+            if path.count(':') == 1
+        ]
+        self.last_energy = self._read_energy()
+
+    @staticmethod
+    def _read_cpu():
+        with open('/proc/stat', 'r') as f:
+            fields = f.readline().split()
+        # user nice system idle iowait irq softirq steal, guest is in user
+        ticks = [int(x) for x in fields[1:9]]
+        return ticks[3], sum(ticks)
+
+    def cpu_usage(self):
+        '''Busy fraction of all cpus since the last call.'''
+        idle, total = self._read_cpu()
+        last_idle, last_total = self.last_cpu
+        self.last_cpu = (idle, total)
+        if total == last_total:
+            return 0.0
+        return 1.0 - (idle - last_idle) / (total - last_total)
+
+    @staticmethod
+    def mem_usage():
+        '''Used fraction of memory, reclaimable caches are not counted.'''
+        info = {}
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                key, value = line.split(':', 1)
+                info[key] = int(value.split()[0])
+        available = info.get('MemAvailable',
+                             info['MemFree'] + info.get('Cached', 0))
+        return (info['MemTotal'] - available) / info['MemTotal']
+
+    def _read_energy(self):
+        energy = []
+        for path in self.rapl_files:
+            try:
+                with open(path, 'r') as f:
+                    uj = int(f.read())
+                with open(os.path.join(os.path.dirname(path),
+                                       'max_energy_range_uj'), 'r') as f:
+                    max_uj = int(f.read())
+            except (IOError, ValueError):
+                uj, max_uj = 0, 0
+            energy.append((uj, max_uj))
+        return time.time(), energy
+
+    def cpu_power(self):
+        '''Watts of all cpu packages since the last call, None if powercap
+           is not readable.'''
+        if len(self.rapl_files) == 0:
+            return None
+        now, energy = self._read_energy()
+        last_time, last_energy = self.last_energy
+        self.last_energy = (now, energy)
+        if now <= last_time:
+            return None
+        joules = 0.0
+        for (uj, max_uj), (last_uj, _) in zip(energy, last_energy):
+            delta = uj - last_uj
+            if delta < 0:
+                # counter wrapped around
+                delta += max_uj
+            joules += delta / 1e6
+        return joules / (now - last_time)
+
+
 class Daemon:
     '''
     daemon subprocess class.
@@ -40,6 +125,8 @@ class Daemon:
                  home_dir='.',
                  umask=0o22,
                  vendor="nvidia",
+                 backend="proc",
+                 log_format="text",
                  verbose=0):
         self.stdin = stdin
         self.stdout = stdout
@@ -54,12 +141,15 @@ class Daemon:
         self.cpulog = str(log_path + '/cpu_monitor.log')
         self.memlog = str(log_path + '/mem_monitor.log')
         self.pwrlog = str(log_path + '/pwr_monitor.log')
+        self.cpupwrlog = str(log_path + '/cpu_pwr_monitor.log')
         self.rate1 = rate1
         self.rate2 = rate2
         self.umask = umask
         self.verbose = verbose
         self.daemon_alive = True
         self.vendor=vendor
+        self.backend = backend
+        self.log_format = log_format
 
     def get_pid(self):
         try:
@@ -75,10 +165,86 @@ class Daemon:
         if os.path.exists(self.pidfile):
             os.remove(self.pidfile)
 
+    def pwr_sample(self):
+        '''Return system power in Watts from ipmitool, as a line.'''
+        cmd = "ipmitool sdr list|grep -i Watts|awk 'BEGIN{FS = \"|\"}{for (f=1; f <= NF; f+=1) {if ($f ~ /Watts/)" \
+              " {print $f}}}'|awk '{print $1}'|sort -n -r|head -n1"
+        # support cambriocn mlu 
+        if "cambricon" in self.vendor:
+            cmd = "echo $(( $(ipmitool sdr list | grep -i Watts | awk 'BEGIN{FS=\"|\"} {for (f=1; f<=NF; f++) {if ($f ~ /Watts/) print $f}}' | awk '{print $1}' | sort -n -r | head -n 1) + $(cnmon info -c 0 | grep 'Machine' | awk '{print $3}') ))"
+
+        res, out = rcw(cmd, 10)
+
+        if (out[0] == ""):
+            cmd = "ipmitool dcmi power reading | grep -i 'Instantaneous power reading' | awk -F': *' '{sub(/[^0-9]+/,\"\",$2); print $2}'"
+            res, out = rcw(cmd, 10)
+        return out[0]
+
+    def timestamp(self):
+        '''Sample time, with milliseconds for sub-second sampling.'''
+        now = datetime.datetime.now()
+        if self.rate1 < 1:
+            return now.strftime('%Y-%m-%d-%H:%M:%S.%f')[:-3]
+        return now.strftime('%Y-%m-%d-%H:%M:%S')
+
+    def open_log(self, path):
+        '''Open a monitor log to append samples with write_log.'''
+        if self.log_format == "binary":
+            # numpy is only needed on hosts writing binary logs
+            import monitor_log
+            return monitor_log.MonitorWriter(monitor_log.bin_path_of(path))
+        return open(path, 'a', buffering=1)
+
+    def write_log(self, log, value):
+        '''Append a sample of value(a float or text line) to log.'''
+        if self.log_format == "binary":
+            try:
+                value = float(value)
+            except ValueError:
+                value = float("nan")
+            log.append(int(time.time() * 1000), [value])
+            return
+        value = str(value)
+        if not value.endswith("\n"):
+            value += "\n"
+        log.write(self.timestamp() + "\t" + value)
+
+    def run_proc(self):
+        '''
+        Sample cpu/mem every rate1 seconds by reading /proc, and system power
+        every rate2 seconds in a thread, all in this process.
+        '''
+        sampler = ProcSampler()
+
+        def pwr_loop():
+            pwr_log = self.open_log(self.pwrlog)
+            while True:
+                self.write_log(pwr_log, self.pwr_sample())
+                time.sleep(self.rate2)
+
+        pwr_thread = threading.Thread(target=pwr_loop, daemon=True)
+        pwr_thread.start()
+
+        cpu_log = self.open_log(self.cpulog)
+        mem_log = self.open_log(self.memlog)
+        cpu_pwr_log = self.open_log(self.cpupwrlog)
+        next_time = time.time() + self.rate1
+        while True:
+            time.sleep(max(0, next_time - time.time()))
+            next_time += self.rate1
+            self.write_log(cpu_log, round(sampler.cpu_usage(), 4))
+            self.write_log(mem_log, round(sampler.mem_usage(), 4))
+            cpu_pwr = sampler.cpu_power()
+            if cpu_pwr is not None:
+                self.write_log(cpu_pwr_log, round(cpu_pwr, 2))
+
     def run(self):
         '''
         NOTE: override the method in subclass
         '''
+        if self.backend == "proc":
+            self.run_proc()
+            return
 
         def cpu_mon(file):
             TIMESTAMP = datetime.datetime.now().strftime('%Y-%m-%d-%H:%M:%S')
@@ -102,21 +268,7 @@ class Daemon:
 
         def pwr_mon(file):
             TIMESTAMP = datetime.datetime.now().strftime('%Y-%m-%d-%H:%M:%S')
-            cmd = "ipmitool sdr list|grep -i Watts|awk 'BEGIN{FS = \"|\"}{for (f=1; f <= NF; f+=1) {if ($f ~ /Watts/)" \
-                  " {print $f}}}'|awk '{print $1}'|sort -n -r|head -n1"
-            # support cambriocn mlu 
-            if "cambricon" in self.vendor:
-                cmd = "echo $(( $(ipmitool sdr list | grep -i Watts | awk 'BEGIN{FS=\"|\"} {for (f=1; f<=NF; f++) {if ($f ~ /Watts/) print $f}}' | awk '{print $1}' | sort -n -r | head -n 1) + $(cnmon info -c 0 | grep 'Machine' | awk '{print $3}') ))"
-            
-            res, out = rcw(cmd, 10)
-            if res:
-                result = "error"
-
-            if (out[0] == ""):
-                cmd = "ipmitool dcmi power reading | grep -i 'Instantaneous power reading' | awk -F': *' '{sub(/[^0-9]+/,\"\",$2); print $2}'"
-                res, out = rcw(cmd, 10)
-
-            result = TIMESTAMP + "\t" + out[0]
+            result = TIMESTAMP + "\t" + self.pwr_sample()
             with open(file, 'a') as f:
                 f.write(result)
 
@@ -182,9 +334,10 @@ class Daemon:
         if not os.path.exists(self.log_path):
             os.makedirs(self.log_path)
         else:
-            for i in self.cpulog, self.memlog, self.pwrlog:
-                if os.path.exists(i):
-                    os.remove(i)
+            for i in self.cpulog, self.memlog, self.pwrlog, self.cpupwrlog:
+                for log in i, os.path.splitext(i)[0] + ".bin":
+                    if os.path.exists(log):
+                        os.remove(log)
         if self.verbose >= 1:
             print('ready to start ......')
         # check for a pid file to see if the daemon already runs
@@ -262,14 +415,40 @@ def parse_args():
                        required=False,
                        default='nvidia',
                        help='gpu vendor')
+    parse.add_argument('-b',
+                       type=str,
+                       metavar='[backend]',
+                       required=False,
+                       default='proc',
+                       choices=['proc', 'shell'],
+                       help='proc: read /proc in one process, '
+                       'shell: run mpstat/free in a process per sample')
+    parse.add_argument('-i',
+                       type=float,
+                       metavar='[interval]',
+                       required=False,
+                       default=5,
+                       help='seconds between cpu/mem samples, may be '
+                       'less than 1 with proc backend')
+    parse.add_argument('-f',
+                       type=str,
+                       metavar='[format]',
+                       required=False,
+                       default='text',
+                       choices=['text', 'binary'],
+                       help='text: TIMESTAMP\\tvalue lines in *.log, '
+                       'binary: *.bin, see monitor_log.py. proc backend only')
     args = parse.parse_args()
     return args
 
 
 def main():
-    sample_rate1 = 5
     sample_rate2 = 120
     args = parse_args()
+    sample_rate1 = args.i
+    if args.b == "shell" and sample_rate1 < 5:
+        # mpstat samples for 1 second, and the scheduler wakes every 5s
+        sample_rate1 = 5
     operation = args.o
     vendor=args.v
     path = args.l
@@ -283,6 +462,8 @@ def main():
                        path,
                        verbose=1,
                        vendor=vendor,
+                       backend=args.b,
+                       log_format=args.f,
                        rate1=sample_rate1,
                        rate2=sample_rate2)
     if operation == 'start':